@@ -1,5 +1,21 @@
 """Gmail Voice Assistant package."""
-from .gmail_voice_assistant_gui import GmailAssistantGUI, main
+import importlib
 
 __version__ = "0.1.0"
-__all__ = ['GmailAssistantGUI', 'main'] 
\ No newline at end of file
+__all__ = ['GmailAssistantGUI', 'GmailVoiceAssistant', 'main']
+
+# Public names and the modules defining them. They are imported on first
+# access, so importing a submodule does not load customtkinter, NLTK or the
+# Gmail client.
+_LAZY_EXPORTS = {
+    'GmailAssistantGUI': '.gmail_voice_assistant_gui',
+    'main': '.gmail_voice_assistant_gui',
+    'GmailVoiceAssistant': '.gmail_voice_assistant',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        module = importlib.import_module(_LAZY_EXPORTS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
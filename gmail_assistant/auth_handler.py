@@ -1,12 +1,9 @@
 """Handle Gmail OAuth2 authentication."""
 import os
-import pickle
 import json
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 from .config.secrets import GMAIL_CLIENT_ID, GMAIL_CLIENT_SECRET, GMAIL_REDIRECT_URI
 from .error_handler import handle_errors
+from .gmail_service import CredentialStore
 
 class AuthHandler:
     def __init__(self):
@@ -33,6 +30,8 @@ class AuthHandler:
             with open(self.credentials_path, 'w') as f:
                 json.dump(self.credentials, f)
 
+        self.store = CredentialStore(self.token_path, self.credentials_path, self.SCOPES)
+
     @handle_errors
     def get_credentials(self):
         """Get valid user credentials from storage.
@@ -40,26 +39,6 @@ class AuthHandler:
         Returns:
             Credentials, the obtained credential.
         """
-        creds = None
-        # The file token.pickle stores the user's access and refresh tokens
-        if os.path.exists(self.token_path):
-            with open(self.token_path, 'rb') as token:
-                creds = pickle.load(token)
-        
-        # If there are no (valid) credentials available, let the user log in.
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    self.credentials_path, self.SCOPES)
-                creds = flow.run_local_server(port=0)
-            
-            # Ensure the directory exists
-            os.makedirs(os.path.dirname(self.token_path), exist_ok=True)
-            
-            # Save the credentials for the next run
-            with open(self.token_path, 'wb') as token:
-                pickle.dump(creds, token)
-        
-        return creds 
\ No newline at end of file
+        # The file token.pickle stores the user's access and refresh tokens;
+        # the store reads it once and refreshes them as needed
+        return self.store.get()
@@ -0,0 +1,144 @@
+"""Apply label changes to every message matching a search in few API calls."""
+
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Most ids messages().list() returns per page
+LIST_PAGE_SIZE = 500
+# Most ids batchModify and batchDelete accept per call
+CHUNK_SIZE = 1000
+
+
+@dataclass
+class BulkResult:
+    """Outcome of a bulk operation."""
+
+    query: str
+    matched: int
+    changed: int = 0
+    dry_run: bool = False
+
+
+class BulkOperations:
+    """Change labels on all messages matching a Gmail search.
+
+    Matching ids are paged out of ``messages().list()`` and changed with
+    ``messages().batchModify()`` a thousand at a time, so marking ten
+    thousand messages read takes about thirty calls instead of two per
+    message.
+
+    Args:
+        gmail_service: Gmail API service.
+        store: Optional MessageStore updated as chunks are applied.
+        chunk_size: Ids per batchModify or batchDelete call.
+    """
+
+    def __init__(self, gmail_service, store=None, chunk_size=CHUNK_SIZE):
+        self.gmail_service = gmail_service
+        self.store = store
+        self.chunk_size = min(chunk_size, CHUNK_SIZE)
+
+    def matching_ids(self, query, limit=None):
+        """Return the ids of messages matching ``query``, newest first."""
+        messages = self.gmail_service.users().messages()
+        ids = []
+        page_token = None
+        while limit is None or len(ids) < limit:
+            page_size = (
+                LIST_PAGE_SIZE
+                if limit is None
+                else min(LIST_PAGE_SIZE, limit - len(ids))
+            )
+            results = messages.list(
+                userId="me", q=query, maxResults=page_size, pageToken=page_token
+            ).execute()
+            ids.extend(message["id"] for message in results.get("messages", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+        return ids
+
+    def count(self, query):
+        """Number of messages a bulk operation on ``query`` would change."""
+        return len(self.matching_ids(query))
+
+    def modify(
+        self, query, add=(), remove=(), dry_run=False, limit=None, on_progress=None
+    ):
+        """Add and remove labels on every message matching ``query``.
+
+        Args:
+            query: Gmail search query.
+            add: Label ids to add.
+            remove: Label ids to remove.
+            dry_run: Only count the matching messages.
+            limit: Most messages to change, newest first.
+            on_progress: Optional ``(done, total)`` callback after each chunk.
+
+        Returns:
+            BulkResult.
+        """
+        ids = self.matching_ids(query, limit)
+        result = BulkResult(query, len(ids), dry_run=dry_run)
+        if dry_run or not ids:
+            return result
+        messages = self.gmail_service.users().messages()
+        body = {}
+        if add:
+            body["addLabelIds"] = list(add)
+        if remove:
+            body["removeLabelIds"] = list(remove)
+        for chunk in self._chunks(ids):
+            messages.batchModify(userId="me", body=dict(body, ids=chunk)).execute()
+            if self.store is not None:
+                self.store.modify_labels(chunk, add, remove)
+            result.changed += len(chunk)
+            self._report(result, on_progress)
+        return result
+
+    def mark_read(self, query, **options):
+        """Mark every matching unread message as read."""
+        return self.modify(
+            self._scoped(query, "is:unread"), remove=["UNREAD"], **options
+        )
+
+    def trash(self, query, **options):
+        """Move every matching message to the trash."""
+        return self.modify(self._scoped(query, "-in:trash"), add=["TRASH"], **options)
+
+    def delete(self, query, dry_run=False, limit=None, on_progress=None):
+        """Permanently delete every matching message.
+
+        Deleted messages cannot be recovered, and Gmail only allows this
+        with the full ``https://mail.google.com/`` scope.
+        """
+        ids = self.matching_ids(query, limit)
+        result = BulkResult(query, len(ids), dry_run=dry_run)
+        if dry_run:
+            return result
+        messages = self.gmail_service.users().messages()
+        for chunk in self._chunks(ids):
+            messages.batchDelete(userId="me", body={"ids": chunk}).execute()
+            if self.store is not None:
+                self.store.delete_messages(chunk)
+            result.changed += len(chunk)
+            self._report(result, on_progress)
+        return result
+
+    def _chunks(self, ids):
+        for start in range(0, len(ids), self.chunk_size):
+            yield ids[start : start + self.chunk_size]
+
+    @staticmethod
+    def _scoped(query, scope):
+        return f"{query} {scope}".strip()
+
+    @staticmethod
+    def _report(result, on_progress):
+        logger.info(
+            f"Bulk update of '{result.query}': {result.changed}/{result.matched}"
+        )
+        if on_progress is not None:
+            on_progress(result.changed, result.matched)
@@ -1,95 +1,200 @@
 """Process voice commands and map to actions."""
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
+from dataclasses import dataclass, field
+from typing import Any, Dict
 from googleapiclient.errors import HttpError
+from .bulk_operations import BulkOperations
 from .error_handler import handle_errors, GmailAssistantError
+from .intent_engine import NEGATIONS, NUMBER_WORDS, get_engine
+from .message_fetcher import MessageFetcher
+from .message_store import parse_date
+from .mime_decoder import extract_text
+from .prefetch import Prefetcher
 import base64
 from email.mime.text import MIMEText
 import logging
+import time
 from bs4 import BeautifulSoup
-import html2text
 
 logger = logging.getLogger(__name__)
 
+SEARCH_PAGE_SIZE = 5
+
+# Characters of a body that are indexed and summarized...
+BODY_CHARS = 20000
+# ...and read out in response to a read command
+READ_CHARS = 2000
+
+# Words that make a command act on every matching message...
+BULK_WORDS = ('all', 'every', 'everything')
+# ...and that only count the messages it would change
+DRY_RUN_WORDS = ('preview', 'count')
+# Words that confirm a pending bulk change...
+CONFIRM_WORDS = ('yes', 'confirm', 'proceed')
+# ...within this many seconds of it being announced
+CONFIRM_TIMEOUT = 60
+
+# Gmail search units for "older than" and "newer than", and days per unit
+AGE_UNITS = {'day': ('d', 1), 'week': ('d', 7), 'month': ('m', 1), 'year': ('y', 1)}
+CATEGORIES = ('primary', 'social', 'promotions', 'updates', 'forums')
+SYSTEM_LABELS = ('inbox', 'sent', 'drafts', 'spam', 'trash', 'starred', 'important')
+
+# Label listings as (label id, search query, max results, headers)
+LABEL_LISTINGS = {
+    'list_unread': ('UNREAD', 'is:unread', 5, ('From', 'Subject')),
+    'list_important': ('IMPORTANT', 'is:important', 5, ('From', 'Subject')),
+}
+
+@dataclass
+class CommandResult:
+    """Matched intent of a command and the handler's response, if it ran."""
+    intent: str
+    slots: Dict[str, Any] = field(default_factory=dict)
+    score: float = 0.0
+    response: Any = None
+
 class CommandProcessor:
     def __init__(self):
         self.gmail_service = None
+        self.message_fetcher = None
+        self.message_store = None
+        self.summarizer = None
+        # Optional (done, total) callback for bulk label changes
+        self.on_bulk_progress = None
+        # (action, deadline) of a bulk change waiting for confirmation
+        self.pending_action = None
+        self.prefetcher = Prefetcher()
+        self.intent_engine = get_engine()
         self.commands = {
-            'read': self._handle_read,
-            'send': self._handle_send,
-            'delete': self._handle_delete,
-            'search': self._handle_search,
-            'unread': self._handle_unread,
-            'important': self._handle_important
+            'read_email': self._handle_read,
+            'summarize_email': self._handle_summarize,
+            'send_email': self._handle_send,
+            'delete_email': self._handle_delete,
+            'mark_read': self._handle_mark_read,
+            'search_email': self._handle_search,
+            'check_inbox': self._handle_unread,
+            'list_unread': self._handle_unread,
+            'list_important': self._handle_important
         }
     
     def set_gmail_service(self, service):
         """Set Gmail service instance."""
         self.gmail_service = service
-
-    def _get_email_content(self, message):
-        """Extract email content from message payload."""
-        if 'parts' in message['payload']:
-            parts = message['payload']['parts']
-            for part in parts:
-                if part['mimeType'] == 'text/plain':
-                    data = part['body'].get('data')
-                    if data:
-                        return base64.urlsafe_b64decode(data).decode()
-                elif part['mimeType'] == 'text/html':
-                    data = part['body'].get('data')
-                    if data:
-                        html_content = base64.urlsafe_b64decode(data).decode()
-                        return html2text.html2text(html_content)
-        elif 'body' in message['payload']:
-            data = message['payload']['body'].get('data')
-            if data:
-                return base64.urlsafe_b64decode(data).decode()
-        return "No content available"
+        self.message_fetcher = MessageFetcher(service)
+
+    def set_message_store(self, store):
+        """Set the local MessageStore used to answer label queries."""
+        self.message_store = store
+
+    def set_summarizer(self, summarizer):
+        """Set the EmailSummarizer used to answer summary requests."""
+        self.summarizer = summarizer
+
+    def process_command(self, command_text):
+        """Match a command to an intent and run its handler.
+
+        The handler only runs once a Gmail service is set, and handlers
+        that change or send mail only on a confident match.
+
+        Returns:
+            CommandResult; ``response`` is None if no handler ran.
+        """
+        pending = self._take_pending_action()
+        if pending is not None and self._is_confirmation(command_text.lower().split()):
+            return CommandResult('confirm', score=1.0, response=pending())
+
+        match = self.intent_engine.match(command_text)
+        result = CommandResult(match.intent, match.slots, match.score)
+        handler = self.commands.get(match.intent)
+        if handler is None or self.gmail_service is None:
+            return result
+        if not match.runnable:
+            logger.info(f"Not running {match.intent} on a weak match (score {match.score:.2f})")
+            return result
+        logger.info(f"Running {match.intent} (score {match.score:.2f})")
+        result.response = handler(command_text.lower().split(), match)
+        return result
+
+    def _take_pending_action(self):
+        """Return the bulk change awaiting confirmation, if still current.
+
+        A pending change is only offered to the next command, so anything
+        but a confirmation cancels it.
+        """
+        pending, self.pending_action = self.pending_action, None
+        if pending is None:
+            return None
+        action, deadline = pending
+        return action if time.monotonic() < deadline else None
+
+    @staticmethod
+    def _is_confirmation(words):
+        return (any(word in CONFIRM_WORDS for word in words)
+                and not any(word in NEGATIONS for word in words))
+
+    def prefetch_for(self, partial_text):
+        """Start the lookups a partial transcript is heading towards.
+
+        The handlers pick the results up from ``self.prefetcher`` once the
+        final command arrives; lookups the command ends up not needing are
+        discarded.
+        """
+        if self.gmail_service is None:
+            return
+        intent = self.intent_engine.match(partial_text).intent
+        if intent == 'check_inbox':
+            intent = 'list_unread'
+        candidates = []
+        if intent in LABEL_LISTINGS:
+            listing = LABEL_LISTINGS[intent]
+            candidates.append((('label',) + listing, self._fetch_label, listing))
+        elif intent == 'read_email':
+            query, max_results = self._read_query(partial_text.lower().split())
+            candidates.append((('read', query, max_results), self._fetch_messages,
+                               (query, max_results)))
+        self.prefetcher.propose(candidates)
+
+    def _list_by_label(self, label_id, query, max_results, headers):
+        """List header summaries for a label, prefetched if already started."""
+        return self.prefetcher.get(
+            ('label', label_id, query, max_results, headers),
+            self._fetch_label, label_id, query, max_results, headers)
+
+    def _fetch_label(self, label_id, query, max_results, headers):
+        """List header summaries for a label, locally when the store is synced."""
+        if self.message_store is not None and self.message_store.is_ready():
+            return self.message_store.list_messages(label_id, limit=max_results)
+
+        results = self.gmail_service.users().messages().list(
+            userId='me', q=query, maxResults=max_results).execute()
+        return self.message_fetcher.fetch_headers(
+            results.get('messages', []), headers=headers)
+
+    def _get_email_content(self, message, limit=BODY_CHARS):
+        """Extract up to ``limit`` characters of email content from a message."""
+        return extract_text(message['payload'], limit) or "No content available"
+
+    @staticmethod
+    def _get_search_text(message, limit=BODY_CHARS):
+        """Extract the text to index a message by, or '' if it has none."""
+        return extract_text(message['payload'], limit) or ''
 
     @handle_errors
-    def _handle_read(self, words):
+    def _handle_read(self, words, match):
         """Handle read email commands."""
         try:
-            query = ""
-            max_results = 1
-
-            if "from" in words:
-                sender_idx = words.index("from") + 1
-                if sender_idx < len(words):
-                    sender = words[sender_idx]
-                    query = f"from:{sender}"
-
-            if "subject" in words:
-                subject_idx = words.index("subject") + 1
-                if subject_idx < len(words):
-                    subject = words[subject_idx]
-                    query = f"subject:{subject}"
-
-            if "last" in words or "latest" in words:
-                try:
-                    num_idx = words.index("last") + 1
-                    max_results = int(words[num_idx])
-                except (ValueError, IndexError):
-                    max_results = 1
-
-            results = self.gmail_service.users().messages().list(
-                userId='me', maxResults=max_results, q=query).execute()
-            messages = results.get('messages', [])
+            query, max_results = self._read_query(words)
+            messages = self.prefetcher.get(
+                ('read', query, max_results), self._fetch_messages, query, max_results)
 
             if not messages:
                 return "No emails found."
 
             response = ""
-            for message in messages:
-                msg = self.gmail_service.users().messages().get(
-                    userId='me', id=message['id']).execute()
-                
+            for msg in messages:
                 headers = msg['payload']['headers']
                 subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No subject')
                 sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown sender')
-                content = self._get_email_content(msg)
+                content = self._get_email_content(msg, READ_CHARS)
 
                 response += f"\nFrom: {sender}\nSubject: {subject}\n\nContent:\n{content}\n"
                 response += "\n" + "-"*50 + "\n"
@@ -100,7 +205,85 @@ class CommandProcessor:
             raise GmailAssistantError(f"Error reading email: {str(error)}")
 
     @handle_errors
-    def _handle_send(self, words):
+    def _handle_summarize(self, words, match):
+        """Handle summarize email commands."""
+        if self.summarizer is None:
+            return "Email summaries are not available."
+        try:
+            query, max_results = self._read_query(words)
+            response = ""
+            for message_id, sender, subject, body in self._summary_sources(query, max_results):
+                summary = self.summarizer.summary_for(message_id, body)
+                response += f"\nFrom: {sender}\nSubject: {subject}\n\nSummary:\n{summary}\n"
+                response += "\n" + "-"*50 + "\n"
+            return response or "No emails found."
+
+        except HttpError as error:
+            raise GmailAssistantError(f"Error summarizing email: {str(error)}")
+
+    def _summary_sources(self, query, max_results):
+        """Return (id, sender, subject, body) of the messages to summarize.
+
+        The latest messages come from the local store when their bodies are
+        indexed, so a pre-made summary needs no Gmail request at all.
+        """
+        if not query and self.message_store is not None and self.message_store.is_ready():
+            sources = []
+            for headers in self.message_store.list_messages('INBOX', limit=max_results):
+                body = self.message_store.get_body(headers['id'])
+                if not body:
+                    break
+                sources.append((headers['id'], headers.get('from', 'Unknown sender'),
+                                headers.get('subject', 'No subject'), body))
+            else:
+                return sources
+
+        sources = []
+        for msg in self._fetch_messages(query, max_results):
+            headers = msg['payload']['headers']
+            subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No subject')
+            sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown sender')
+            sources.append((msg['id'], sender, subject, self._get_email_content(msg)))
+        return sources
+
+    @staticmethod
+    def _read_query(words):
+        """Return the (query, max_results) a read command asks for."""
+        query = ""
+        max_results = 1
+
+        if "from" in words:
+            sender_idx = words.index("from") + 1
+            if sender_idx < len(words):
+                sender = words[sender_idx]
+                query = f"from:{sender}"
+
+        if "subject" in words:
+            subject_idx = words.index("subject") + 1
+            if subject_idx < len(words):
+                subject = words[subject_idx]
+                query = f"subject:{subject}"
+
+        if "last" in words or "latest" in words:
+            try:
+                num_idx = words.index("last") + 1
+                max_results = int(words[num_idx])
+            except (ValueError, IndexError):
+                max_results = 1
+
+        return query, max_results
+
+    def _fetch_messages(self, query, max_results):
+        """Fetch full messages matching a search query."""
+        results = self.gmail_service.users().messages().list(
+            userId='me', maxResults=max_results, q=query).execute()
+        messages = results.get('messages', [])
+        if not messages:
+            return []
+        return self.message_fetcher.fetch(messages, fmt='full')
+
+    @handle_errors
+    def _handle_send(self, words, match):
         """Handle send email commands."""
         # Note: This should be integrated with GUI compose window
         try:
@@ -119,8 +302,10 @@ class CommandProcessor:
             raise GmailAssistantError(f"Error sending email: {str(error)}")
 
     @handle_errors
-    def _handle_delete(self, words):
+    def _handle_delete(self, words, match):
         """Handle delete email commands."""
+        if self._is_bulk(words) or self._is_dry_run(words):
+            return self._bulk_trash(words)
         try:
             query = ""
             if "from" in words:
@@ -151,76 +336,220 @@ class CommandProcessor:
         except HttpError as error:
             raise GmailAssistantError(f"Error deleting email: {str(error)}")
 
+    def _bulk_trash(self, words):
+        """Count the messages matching a command and ask before trashing them.
+
+        Nothing is moved until the next command confirms, so a single
+        misheard phrase cannot empty a folder.
+        """
+        query = self._bulk_query(words)
+        if not query:
+            return ("Please say which emails to trash, for example "
+                    "everything from a sender or older than a month.")
+        try:
+            result = BulkOperations(self.gmail_service, self.message_store).trash(
+                query, dry_run=True)
+        except HttpError as error:
+            raise GmailAssistantError(f"Error deleting emails: {str(error)}")
+        if self._is_dry_run(words):
+            return f"{result.matched} emails matching '{query}' would be moved to trash."
+        if not result.matched:
+            return "No emails found to delete."
+        self.pending_action = (lambda: self._confirmed_trash(query),
+                               time.monotonic() + CONFIRM_TIMEOUT)
+        return (f"{result.matched} emails matching '{query}' will be moved to trash. "
+                "Say yes to confirm.")
+
+    @handle_errors
+    def _confirmed_trash(self, query):
+        """Move every message matching ``query`` to the trash."""
+        try:
+            result = BulkOperations(self.gmail_service, self.message_store).trash(
+                query, on_progress=self.on_bulk_progress)
+        except HttpError as error:
+            raise GmailAssistantError(f"Error deleting emails: {str(error)}")
+        if not result.matched:
+            return "No emails found to delete."
+        return f"Moved {result.changed} emails matching '{query}' to trash."
+
     @handle_errors
-    def _handle_search(self, words):
-        """Handle search email commands."""
+    def _handle_mark_read(self, words, match):
+        """Handle mark as read commands, for the latest or every matching email."""
+        query = self._bulk_query(words)
         try:
-            # Build search query from command
+            result = BulkOperations(self.gmail_service, self.message_store).mark_read(
+                query, dry_run=self._is_dry_run(words),
+                limit=None if self._is_bulk(words) else 1,
+                on_progress=self.on_bulk_progress)
+        except HttpError as error:
+            raise GmailAssistantError(f"Error marking emails as read: {str(error)}")
+        if result.dry_run:
+            return f"{result.matched} unread emails would be marked as read."
+        if not result.matched:
+            return "No unread emails found."
+        if result.changed == 1:
+            return "Marked 1 email as read."
+        return f"Marked {result.changed} emails as read."
+
+    @staticmethod
+    def _is_bulk(words):
+        return any(word in BULK_WORDS for word in words)
+
+    @staticmethod
+    def _is_dry_run(words):
+        return (any(word in DRY_RUN_WORDS for word in words)
+                or ('how' in words and 'many' in words))
+
+    @classmethod
+    def _bulk_query(cls, words):
+        """Return the Gmail search query a bulk command's filters describe."""
+        terms = []
+        sender = cls._word_after(words, "from")
+        if sender:
+            terms.append(f"from:{sender}")
+        subject = cls._word_after(words, "subject")
+        if subject:
+            terms.append(f"subject:{subject}")
+        for keyword, operator in (("older", "older_than"), ("newer", "newer_than")):
+            age = cls._age_after(words, keyword)
+            if age:
+                terms.append(f"{operator}:{age}")
+        place = cls._word_after(words, "in")
+        if place in CATEGORIES:
+            terms.append(f"category:{place}")
+        elif place in SYSTEM_LABELS:
+            terms.append(f"in:{place}")
+        elif place:
+            terms.append(f"label:{place}")
+        return " ".join(terms)
+
+    @staticmethod
+    def _age_after(words, keyword):
+        """Parse "older than 2 weeks" style ages into Gmail's 14d form."""
+        if keyword not in words:
+            return None
+        rest = words[words.index(keyword) + 1:]
+        if rest[:1] == ['than']:
+            rest = rest[1:]
+        count = 1
+        if rest and rest[0] not in ('a', 'an'):
+            if rest[0].isdigit():
+                count = int(rest[0])
+            elif rest[0] in NUMBER_WORDS:
+                count = NUMBER_WORDS[rest[0]]
+            else:
+                rest = [None] + rest
+        unit = rest[1].rstrip('s') if len(rest) > 1 and rest[1] else None
+        if unit not in AGE_UNITS:
+            return None
+        suffix, multiplier = AGE_UNITS[unit]
+        return f"{count * multiplier}{suffix}"
+
+    @handle_errors
+    def _handle_search(self, words, match):
+        """Handle search email commands from the slots the intent engine found."""
+        try:
+            slots = match.slots
+            sender = slots.get('sender')
+            subject = slots.get('subject')
+            after = slots.get('after')
+            page = slots.get('page')
+            page = page if isinstance(page, int) and page > 0 else 1
+            free_terms = slots.get('query', '').split()
+
             search_terms = []
-            if "from" in words:
-                idx = words.index("from") + 1
-                if idx < len(words):
-                    search_terms.append(f"from:{words[idx]}")
-            
-            if "subject" in words:
-                idx = words.index("subject") + 1
-                if idx < len(words):
-                    search_terms.append(f"subject:{words[idx]}")
-            
-            if "after" in words:
-                idx = words.index("after") + 1
-                if idx < len(words):
-                    search_terms.append(f"after:{words[idx]}")
+            if sender:
+                search_terms.append(f"from:{sender}")
+            if subject:
+                search_terms.append(f"subject:({subject})" if ' ' in subject
+                                    else f"subject:{subject}")
+            if after:
+                search_terms.append(f"after:{after}")
+            query = " ".join(free_terms + search_terms)
 
-            query = " ".join(search_terms) if search_terms else " ".join(words[words.index("search")+1:])
-            
             if not query:
                 return "Please specify search terms"
 
+            if self.message_store is not None and self.message_store.is_ready():
+                after_date = parse_date(after) if after else None
+                if not after or after_date:
+                    messages, total = self.message_store.search(
+                        free_terms, sender=sender, subject=subject, after=after_date,
+                        limit=SEARCH_PAGE_SIZE, offset=(page - 1) * SEARCH_PAGE_SIZE)
+                    # The store only holds recent mail. It has every match
+                    # when the search starts after its oldest message and
+                    # all bodies are indexed; otherwise only a full page
+                    # can be answered from it, with a lower bound as total.
+                    complete = self._store_covers(after_date)
+                    if complete or len(messages) == SEARCH_PAGE_SIZE:
+                        return self._format_search_results(
+                            query, messages, total, page, exact=complete)
+
             results = self.gmail_service.users().messages().list(
-                userId='me', q=query, maxResults=5).execute()
-            messages = results.get('messages', [])
+                userId='me', q=query, maxResults=SEARCH_PAGE_SIZE * page).execute()
+            skipped = (page - 1) * SEARCH_PAGE_SIZE
+            messages = self.message_fetcher.fetch_headers(
+                results.get('messages', [])[skipped:], headers=('From', 'Subject', 'Date'))
+            total = max(results.get('resultSizeEstimate', 0), skipped + len(messages))
+            return self._format_search_results(query, messages, total, page)
 
-            if not messages:
-                return f"No emails found matching '{query}'"
+        except HttpError as error:
+            raise GmailAssistantError(f"Error searching emails: {str(error)}")
 
-            response = f"Found {len(messages)} emails matching '{query}':\n\n"
+    @staticmethod
+    def _word_after(words, keyword):
+        """Return the word following ``keyword``, or None."""
+        if keyword in words:
+            idx = words.index(keyword) + 1
+            if idx < len(words):
+                return words[idx]
+        return None
+
+    def _store_covers(self, after_date):
+        """True if the local store holds every message received after ``after_date``."""
+        if after_date is None or self.message_store.unindexed_ids(limit=1):
+            return False
+        oldest = self.message_store.oldest_date()
+        return oldest is not None and after_date >= oldest
+
+    @staticmethod
+    def _format_search_results(query, messages, total, page=1, exact=True):
+        if not messages:
+            return f"No emails found matching '{query}'"
+
+        if not exact:
+            response = f"Found at least {total} emails matching '{query}' (page {page})"
+        else:
+            response = f"Found {total} emails matching '{query}'"
+            pages = -(-total // SEARCH_PAGE_SIZE)
+            if pages > 1:
+                response += f" (page {page} of {pages})"
+        response += ":\n\n"
+        
+        for headers in messages:
+            subject = headers.get('subject', 'No subject')
+            sender = headers.get('from', 'Unknown sender')
+            date = headers.get('date', 'Unknown date')
             
-            for msg_id in messages:
-                msg = self.gmail_service.users().messages().get(
-                    userId='me', id=msg_id['id']).execute()
-                headers = msg['payload']['headers']
-                subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No subject')
-                sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown sender')
-                date = next((h['value'] for h in headers if h['name'].lower() == 'date'), 'Unknown date')
-                
-                response += f"From: {sender}\nDate: {date}\nSubject: {subject}\n"
-                response += "-"*50 + "\n"
-
-            return response
+            response += f"From: {sender}\nDate: {date}\nSubject: {subject}\n"
+            response += "-"*50 + "\n"
 
-        except HttpError as error:
-            raise GmailAssistantError(f"Error searching emails: {str(error)}")
+        return response
 
     @handle_errors
-    def _handle_unread(self, words):
+    def _handle_unread(self, words, match):
         """Handle unread emails command."""
         try:
-            results = self.gmail_service.users().messages().list(
-                userId='me', q='is:unread', maxResults=5).execute()
-            messages = results.get('messages', [])
+            messages = self._list_by_label(*LABEL_LISTINGS['list_unread'])
 
             if not messages:
                 return "No unread emails found."
 
             response = f"You have {len(messages)} unread emails:\n\n"
             
-            for msg_id in messages:
-                msg = self.gmail_service.users().messages().get(
-                    userId='me', id=msg_id['id']).execute()
-                headers = msg['payload']['headers']
-                subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No subject')
-                sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown sender')
+            for headers in messages:
+                subject = headers.get('subject', 'No subject')
+                sender = headers.get('from', 'Unknown sender')
                 
                 response += f"From: {sender}\nSubject: {subject}\n"
                 response += "-"*50 + "\n"
@@ -231,24 +560,19 @@ class CommandProcessor:
             raise GmailAssistantError(f"Error fetching unread emails: {str(error)}")
 
     @handle_errors
-    def _handle_important(self, words):
+    def _handle_important(self, words, match):
         """Handle important emails command."""
         try:
-            results = self.gmail_service.users().messages().list(
-                userId='me', q='is:important', maxResults=5).execute()
-            messages = results.get('messages', [])
+            messages = self._list_by_label(*LABEL_LISTINGS['list_important'])
 
             if not messages:
                 return "No important emails found."
 
             response = f"Found {len(messages)} important emails:\n\n"
             
-            for msg_id in messages:
-                msg = self.gmail_service.users().messages().get(
-                    userId='me', id=msg_id['id']).execute()
-                headers = msg['payload']['headers']
-                subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No subject')
-                sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown sender')
+            for headers in messages:
+                subject = headers.get('subject', 'No subject')
+                sender = headers.get('from', 'Unknown sender')
                 
                 response += f"From: {sender}\nSubject: {subject}\n"
                 response += "-"*50 + "\n"
@@ -0,0 +1,172 @@
+"""Token-budgeted conversation history with a running summary."""
+
+import logging
+import threading
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Tokens of recent exchanges kept verbatim in the prompt
+HISTORY_BUDGET = 2048
+# Exchanges kept verbatim when older ones are summarized
+KEEP_TURNS = 4
+# Upper bound on stored exchanges, whatever their size
+MAX_TURNS = 32
+
+Turn = namedtuple("Turn", ["id", "user", "assistant", "tokens"])
+
+
+def estimate_tokens(text):
+    """Rough token count for when no tokenizer is available."""
+    return len(text) // 4 + 1
+
+
+class ConversationMemory:
+    """Recent exchanges in a bounded ring buffer plus a summary of older ones.
+
+    When the exchanges exceed ``budget`` tokens (or ``max_turns``), the
+    oldest are folded into the summary in one step, leaving the newest
+    ``keep_turns``. If those alone are still over budget, they are cut
+    short, oldest first, until they fit. Compacting in blocks rather than
+    a turn at a time keeps the prompt prefix stable between compactions,
+    which lets the model reuse its cached evaluation of it.
+
+    Args:
+        count_tokens: ``(text) -> int`` using the model's tokenizer.
+        summarize: ``(summary, turns) -> str`` returning the updated
+            summary; without it, dropped turns are simply forgotten.
+        budget: Token budget for the verbatim exchanges.
+        keep_turns: Exchanges to keep verbatim after compacting.
+        max_turns: Capacity of the ring buffer.
+        background: Summarize on a background thread, so the caller that
+            added the exchange does not wait for the model.
+    """
+
+    def __init__(
+        self,
+        count_tokens=estimate_tokens,
+        summarize=None,
+        budget=HISTORY_BUDGET,
+        keep_turns=KEEP_TURNS,
+        max_turns=MAX_TURNS,
+        background=True,
+    ):
+        self.count_tokens = count_tokens
+        self.summarize = summarize
+        self.budget = budget
+        self.keep_turns = keep_turns
+        self.background = background
+        self.summary = ""
+        self._turns = deque(maxlen=max_turns)
+        self._overflow = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._compaction = None
+
+    @property
+    def turns(self):
+        """Snapshot of the exchanges kept verbatim, oldest first."""
+        with self._lock:
+            return list(self._turns)
+
+    @property
+    def tokens(self):
+        """Tokens used by the verbatim exchanges."""
+        with self._lock:
+            return sum(turn.tokens for turn in self._turns)
+
+    def add(self, user, assistant):
+        """Record an exchange and compact older ones if over budget."""
+        tokens = self._turn_tokens(user, assistant)
+        with self._lock:
+            if len(self._turns) == self._turns.maxlen:
+                # Summarization fell behind; keep the turn for the next one
+                self._overflow.append(self._turns[0])
+            self._turns.append(Turn(self._next_id, user, assistant, tokens))
+            self._next_id += 1
+        self._maybe_compact()
+
+    def clear(self):
+        """Forget the exchanges and the summary."""
+        with self._lock:
+            self._turns.clear()
+            self._overflow = []
+            self.summary = ""
+
+    def wait(self, timeout=None):
+        """Wait for a background compaction to finish."""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join(timeout)
+
+    def _maybe_compact(self):
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            used = sum(turn.tokens for turn in self._turns)
+            if used <= self.budget and not self._overflow:
+                return
+            old = self._overflow + list(self._turns)[: -self.keep_turns or None]
+            if not old:
+                self._fit_budget()
+                return
+            summary = self.summary
+        if self.background:
+            self._compaction = threading.Thread(
+                target=self._compact,
+                args=(summary, old),
+                name="MemoryCompaction",
+                daemon=True,
+            )
+            self._compaction.start()
+        else:
+            self._compact(summary, old)
+
+    def _compact(self, summary, old):
+        new_summary = summary
+        if self.summarize is not None:
+            try:
+                new_summary = self.summarize(summary, old)
+            except Exception as e:
+                # Keep the old summary; the turns are dropped regardless so
+                # the prompt stays within the context window
+                logger.error(f"Conversation summary failed: {str(e)}")
+        last_id = old[-1].id
+        with self._lock:
+            while self._turns and self._turns[0].id <= last_id:
+                self._turns.popleft()
+            self._overflow = [turn for turn in self._overflow if turn.id > last_id]
+            self.summary = new_summary
+            self._fit_budget()
+        logger.info(f"Summarized {len(old)} earlier exchanges")
+
+    def _turn_tokens(self, user, assistant):
+        return self.count_tokens(f"{user} [/INST] {assistant} </s><s>[INST] ")
+
+    def _fit_budget(self):
+        """Cut the kept exchanges, oldest first, until they fit the budget."""
+        excess = sum(turn.tokens for turn in self._turns) - self.budget
+        index = 0
+        while excess > 0 and index < len(self._turns):
+            turn = self._turns[index]
+            trimmed = self._trim(turn, turn.tokens - excess)
+            if trimmed is None:
+                del self._turns[index]
+                excess -= turn.tokens
+                continue
+            self._turns[index] = trimmed
+            excess -= turn.tokens - trimmed.tokens
+            index += 1
+
+    def _trim(self, turn, tokens):
+        """``turn`` with its text cut to fit ``tokens``, or None if none fits."""
+        ratio = max(0.0, tokens / turn.tokens)
+        while True:
+            user = turn.user[: int(len(turn.user) * ratio)]
+            assistant = turn.assistant[: int(len(turn.assistant) * ratio)]
+            used = self._turn_tokens(user, assistant)
+            if used <= tokens:
+                return turn._replace(user=user, assistant=assistant, tokens=used)
+            if not user and not assistant:
+                return None
+            ratio *= 0.75
@@ -0,0 +1,305 @@
+"""Process-wide Gmail API client with credentials refreshed ahead of expiry."""
+
+import json
+import logging
+import os
+import pickle
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import build_http
+
+from .error_handler import GmailAssistantError
+from .rate_limiter import get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Refresh the access token this many seconds before it expires...
+REFRESH_MARGIN = 300
+# ...and retry this often while refreshing fails
+RETRY_INTERVAL = 60
+# Gmail requests that may be in flight at once, each on its own connection
+POOL_SIZE = int(os.getenv("GMAIL_HTTP_POOL_SIZE", 4))
+
+
+class CredentialStore:
+    """OAuth credentials loaded from disk once and kept valid in the background.
+
+    The token file may hold authorized-user JSON or a pickled Credentials
+    object, as older versions of the assistant wrote; it is saved back in
+    the format it was read in. ``start_refresher`` refreshes the access
+    token shortly before it expires, so requests never wait on an OAuth
+    round trip.
+
+    Args:
+        token_path: File holding the user's tokens; defaults to the one
+            in config.secrets, as do the other two arguments.
+        credentials_path: OAuth client secrets, used when the user must log in.
+        scopes: OAuth scopes to request.
+        client_config: Client secrets as a dict, instead of ``credentials_path``.
+        port: Local port for the login redirect; 0 picks a free one.
+    """
+
+    def __init__(
+        self,
+        token_path=None,
+        credentials_path=None,
+        scopes=None,
+        client_config=None,
+        port=0,
+    ):
+        if None in (token_path, credentials_path, scopes):
+            # Only the defaults need the client secrets file to exist
+            from .config import secrets
+
+            token_path = token_path or secrets.TOKEN_PATH
+            credentials_path = credentials_path or secrets.CREDENTIALS_PATH
+            scopes = scopes or secrets.SCOPES
+        self.token_path = token_path
+        self.credentials_path = credentials_path
+        self.scopes = scopes
+        self.client_config = client_config
+        self.port = port
+        self.credentials = None
+        self._pickled = str(token_path).endswith(".pickle")
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def get(self):
+        """Return valid credentials, logging the user in if there are none."""
+        with self._lock:
+            if self.credentials is None:
+                self.credentials = self._load()
+            creds = self.credentials
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    self.refresh()
+                else:
+                    self.credentials = self._authorize()
+                    self._save()
+            return self.credentials
+
+    def refresh(self):
+        """Refresh the access token now and save it."""
+        with self._lock:
+            self.credentials.refresh(Request())
+            self._save()
+
+    def seconds_until_refresh(self, margin=REFRESH_MARGIN):
+        """Seconds until the token is due for refresh, or None if it never is."""
+        creds = self.credentials
+        if creds is None or creds.expiry is None or not creds.refresh_token:
+            return None
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (creds.expiry - now).total_seconds() - margin
+
+    def start_refresher(self, margin=REFRESH_MARGIN, retry_interval=RETRY_INTERVAL):
+        """Refresh the token ``margin`` seconds before it expires, in the background."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(margin, retry_interval),
+            name="CredentialRefresher",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self, margin, retry_interval):
+        while not self._stop_event.is_set():
+            delay = self.seconds_until_refresh(margin)
+            if delay is None:
+                return
+            if delay > 0:
+                self._stop_event.wait(delay)
+                continue
+            try:
+                self.refresh()
+                logger.info("Refreshed Gmail credentials")
+                remaining = self.seconds_until_refresh(margin)
+                if remaining is None or remaining > 0:
+                    continue
+            except Exception as e:
+                logger.warning(f"Failed to refresh Gmail credentials: {str(e)}")
+            self._stop_event.wait(retry_interval)
+
+    def _load(self):
+        if not os.path.exists(self.token_path):
+            return None
+        try:
+            creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+            self._pickled = False
+            return creds
+        except (ValueError, UnicodeDecodeError):
+            with open(self.token_path, "rb") as token:
+                creds = pickle.load(token)
+            self._pickled = True
+            return creds
+
+    def _authorize(self):
+        if self.client_config is not None:
+            flow = InstalledAppFlow.from_client_config(self.client_config, self.scopes)
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(
+                self.credentials_path, self.scopes
+            )
+        return flow.run_local_server(port=self.port)
+
+    def _save(self):
+        directory = os.path.dirname(self.token_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self._pickled:
+            with open(self.token_path, "wb") as token:
+                pickle.dump(self.credentials, token)
+        else:
+            with open(self.token_path, "w") as token:
+                token.write(self.credentials.to_json())
+
+
+_document = None
+_document_lock = threading.Lock()
+
+
+def discovery_document():
+    """Gmail's API description, parsed once from the copy googleapiclient ships.
+
+    ``build('gmail', 'v1')`` reads and parses this document on every call.
+    """
+    global _document
+    with _document_lock:
+        if _document is None:
+            content = get_static_doc("gmail", "v1")
+            if content is None:
+                raise GmailAssistantError("Gmail discovery document not found")
+            _document = json.loads(content)
+        return _document
+
+
+class HttpPool:
+    """Authorized HTTP transports lent to one request at a time.
+
+    An httplib2 transport keeps connection state that two threads must not
+    use at once, but the Gmail client is shared by the command handlers,
+    MessageSync and the prefetcher. Each request borrows a transport for
+    its duration, so up to ``size`` requests run in parallel and the rest
+    wait for a transport to come back. Idle transports keep their
+    connections open; one that failed mid-request is closed and replaced.
+
+    Requests are paced by a RateLimiter, which retries throttled ones
+    without holding a transport while it backs off.
+
+    Args:
+        credentials: Credentials every transport authorizes requests with.
+        size: Most transports, and so concurrent requests, in the pool.
+        http_factory: ``() -> httplib2.Http`` for new transports.
+        limiter: RateLimiter, or None for the process-wide one.
+    """
+
+    def __init__(
+        self, credentials, size=POOL_SIZE, http_factory=build_http, limiter=None
+    ):
+        self.credentials = credentials
+        self.size = size
+        self.http_factory = http_factory
+        self.limiter = limiter or get_rate_limiter()
+        self.created = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transport(self):
+        """Borrow a transport, waiting while all of them are in use."""
+        with self._slots:
+            try:
+                http = self._idle.get_nowait()
+            except queue.Empty:
+                http = AuthorizedHttp(self.credentials, http=self.http_factory())
+                with self._lock:
+                    self.created += 1
+            try:
+                yield http
+            except BaseException:
+                http.close()
+                with self._lock:
+                    self.created -= 1
+                raise
+            self._idle.put(http)
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        """Send one request on a borrowed transport; same interface as httplib2."""
+
+        def send():
+            with self.transport() as http:
+                return http.request(uri, method, *args, **kwargs)
+
+        body = args[0] if args else kwargs.get("body")
+        return self.limiter.send(method, uri, body, send)
+
+    def close(self):
+        """Close the connections of idle transports."""
+        while True:
+            try:
+                http = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            http.close()
+            with self._lock:
+                self.created -= 1
+
+
+def build_service(credentials, pool_size=POOL_SIZE, limiter=None):
+    """Build a thread-safe, rate limited Gmail API client.
+
+    The API description comes from discovery_document(), so nothing is
+    fetched or re-parsed, and requests go through an HttpPool.
+    """
+    return build_from_document(
+        discovery_document(), http=HttpPool(credentials, pool_size, limiter=limiter)
+    )
+
+
+_services = {}
+_store = None
+_service_lock = threading.Lock()
+
+
+def get_gmail_service(store=None, pool_size=POOL_SIZE):
+    """Return the shared Gmail client for ``store``.
+
+    The first call for a store loads its credentials, builds the client
+    with ``pool_size`` connections and starts refreshing the token in the
+    background; later calls with the same store return the same client,
+    which any thread may use. Without a store, the first store's client is
+    returned, or one for a default CredentialStore.
+    """
+    global _store
+    with _service_lock:
+        store = store or _store or CredentialStore()
+        service = _services.get(store)
+        if service is None:
+            service = build_service(store.get(), pool_size)
+            store.start_refresher()
+            _services[store] = service
+            _store = _store or store
+        return service
+
+
+def get_credential_store():
+    """Return the store of the first shared client, or None before it is built."""
+    return _store
@@ -1,40 +1,109 @@
-import speech_recognition as sr
-import pyttsx3
-from .auth_handler import AuthHandler
-from .command_processor import CommandProcessor
-from .error_handler import handle_errors, GmailAssistantError
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 import logging
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.tag import pos_tag
-from .llm_service import LLMService
+import threading
+from .error_handler import handle_errors, GmailAssistantError
+from .llm.streaming import speak_stream
+from .startup import StartupProfiler, Subsystems
 
 logger = logging.getLogger(__name__)
 
+# Heavy libraries (NLTK, googleapiclient, pyttsx3, speech_recognition,
+# llama.cpp) are imported by the setup method that first needs them, so a
+# lazy assistant can be created before any of them is loaded.
+
 class GmailVoiceAssistant:
-    def __init__(self):
-        self.recognizer = sr.Recognizer()
-        self.engine = pyttsx3.init()
-        self.auth_handler = AuthHandler()
-        self.command_processor = CommandProcessor()
+    def __init__(self, lazy=False, profiler=None):
+        """Create the assistant.
+
+        Args:
+            lazy: If True, only create the object; call ``start_background``
+                to bring the subsystems up on background threads. Otherwise
+                everything is set up and tested before returning.
+            profiler: StartupProfiler recording the startup timing.
+        """
+        self.subsystems = Subsystems(profiler or StartupProfiler())
+        self.recognizer = None
+        self.microphone = None
+        self.asr_backend = None
+        self.engine = None
+        self.speech = None
+        self.auth_handler = None
+        self.command_processor = None
         self.gmail_service = None
-        self.llm_service = LLMService()
+        self.message_store = None
+        self.message_sync = None
+        self.pre_summarizer = None
+        self.llm_service = None
+        self._stream_stop = threading.Event()
+        if lazy:
+            return
         
         # Initialize and test all components
         logger.info("Initializing Gmail Voice Assistant...")
-        self.test_nltk_components()
-        self.setup_gmail_service()
-        self.test_api_endpoints()
+        self.subsystems.run('voice', self.setup_voice)
+        self.subsystems.run('commands', self.setup_commands)
+        self.subsystems.run('llm', self.setup_llm)
+        self.subsystems.run('nltk', self.test_nltk_components)
+        self.subsystems.run('gmail', self.setup_gmail)
+        logger.info("Initialization complete!")
+        logger.info(self.subsystems.profiler.report())
+
+    def start_background(self, on_ready=None):
+        """Set up every subsystem on its own background thread.
+
+        Args:
+            on_ready: Optional ``(name, error)`` callback, called from the
+                background thread as each subsystem finishes.
+        """
+        if on_ready is not None:
+            self.subsystems.add_listener(on_ready)
+        self.subsystems.start('commands', self.setup_commands)
+        self.subsystems.start('voice', self.setup_voice)
+        self.subsystems.start('gmail', self.setup_gmail, requires=('commands',))
+        self.subsystems.start('llm', self.setup_llm)
+        self.subsystems.start('nltk', self.test_nltk_components)
+
+    def setup_voice(self):
+        """Load speech recognition and synthesis and open the microphone."""
+        import speech_recognition as sr
+        import pyttsx3
+        from .voice_processing.backends import load_backend
+        from .voice_processing.microphone import MicrophoneStream
+        from .speech_worker import SpeechWorker
+
+        self.recognizer = sr.Recognizer()
+        self.microphone = MicrophoneStream(self.recognizer)
+        self.asr_backend = load_backend(self.recognizer)
+        self.speech = SpeechWorker(pyttsx3.init)
+        self.speech.start()
+        self.engine = self.speech.engine
         self.test_voice_components()
+
+    def setup_commands(self):
+        """Create the command processor and check intent matching."""
+        from .command_processor import CommandProcessor
+
+        self.command_processor = CommandProcessor()
         self.test_nlu_processing()
-        logger.info("Initialization complete!")
+
+    def setup_gmail(self):
+        """Authenticate, build the Gmail service and check its endpoints."""
+        self.setup_gmail_service()
+        self.test_api_endpoints()
+
+    def setup_llm(self):
+        """Load the conversation model."""
+        from .llm_service import LLMService
+
+        self.llm_service = LLMService()
 
     def test_nltk_components(self):
         """Test NLTK components and data availability."""
         logger.info("Testing NLTK components...")
         try:
+            import nltk
+            from nltk.tokenize import sent_tokenize, word_tokenize
+            from nltk.tag import pos_tag
+
             # Download all required NLTK data first
             nltk.download('punkt', quiet=True)
             nltk.download('averaged_perceptron_tagger', quiet=True)
@@ -68,9 +137,9 @@ class GmailVoiceAssistant:
             # Test text-to-speech
             self.engine.getProperty('voices')  # Test engine initialization
             
-            # Test speech recognition initialization
-            with sr.Microphone() as source:
-                self.recognizer.adjust_for_ambient_noise(source, duration=1)
+            # Test speech recognition initialization; opening the stream
+            # calibrates it once if no threshold was saved
+            self.microphone.open()
             
             logger.info("Voice components test successful")
             return True
@@ -85,37 +154,13 @@ class GmailVoiceAssistant:
         try:
             # Test command
             command = "read latest email"
-            tokens = word_tokenize(command)
-            pos_tags = pos_tag(tokens)
+            match = self.command_processor.intent_engine.match(command)
             
             # Add debug logging
-            logger.debug(f"POS tags for '{command}': {pos_tags}")
-            
-            # Define valid command verbs (both base and inflected forms)
-            valid_command_verbs = {
-                'read', 'reads', 'reading',
-                'send', 'sends', 'sending',
-                'check', 'checks', 'checking',
-                'show', 'shows', 'showing',
-                'display', 'displays', 'displaying',
-                'write', 'writes', 'writing'
-            }
+            logger.debug(f"Intent for '{command}': {match}")
             
-            # Check for valid commands - FIXED: Check the actual word, not just splitting
-            command_verbs = []
-            for word, tag in pos_tags:
-                word = word.lower()
-                if tag.startswith('VB') or word in valid_command_verbs:
-                    command_verbs.append(word)
-                    
-            valid_command = any(verb in valid_command_verbs for verb in command_verbs)
-                    
-            if not valid_command:
-                logger.warning(f"Command: '{command}'")
-                logger.warning(f"Tokens: {tokens}")
-                logger.warning(f"POS tags: {pos_tags}")
-                logger.warning(f"Identified verbs: {command_verbs}")
-                raise GmailAssistantError(f"No valid command verb found in: {command}")
+            if match.intent != 'read_email':
+                raise GmailAssistantError(f"No read command matched in: {command}")
                 
             logger.info("NLU processing test successful")
             return True
@@ -128,13 +173,37 @@ class GmailVoiceAssistant:
     @handle_errors
     def setup_gmail_service(self):
         """Initialize Gmail service with OAuth credentials."""
-        creds = self.auth_handler.get_credentials()
-        self.gmail_service = build('gmail', 'v1', credentials=creds)
+        from .auth_handler import AuthHandler
+        from .gmail_service import get_gmail_service
+        from .message_store import MessageStore, MessageSync
+        from .summarizer import EmailSummarizer, PreSummarizer
+
+        self.auth_handler = self.auth_handler or AuthHandler()
+        self.gmail_service = get_gmail_service(self.auth_handler.store)
         self.command_processor.set_gmail_service(self.gmail_service)
 
+        self.message_store = MessageStore()
+        self.message_sync = MessageSync(
+            self.gmail_service, self.message_store,
+            body_decoder=self.command_processor._get_search_text)
+        self.command_processor.set_message_store(self.message_store)
+        self.message_sync.start()
+
+        summarizer = EmailSummarizer(self.message_store, self.summarize_email)
+        self.command_processor.set_summarizer(summarizer)
+        self.pre_summarizer = PreSummarizer(summarizer)
+        self.pre_summarizer.start()
+
+    def summarize_email(self, body):
+        """Summarize an email body with the conversation model."""
+        self.subsystems.wait('llm')
+        return self.llm_service.summarize_email(body)
+
     @handle_errors
     def test_api_endpoints(self):
         """Test Gmail API endpoints to ensure they're working."""
+        from googleapiclient.errors import HttpError
+
         logger.info("Testing Gmail API endpoints...")
         
         try:
@@ -172,35 +241,85 @@ class GmailVoiceAssistant:
 
     @handle_errors
     def listen(self):
-        """Listen for voice input and return recognized text."""
-        with sr.Microphone() as source:
-            logger.info("Listening for command...")
-            self.recognizer.adjust_for_ambient_noise(source)
-            audio = self.recognizer.listen(source)
-            
+        """Listen for voice input and return recognized text.
+
+        Audio is transcribed while it is captured, and each partial
+        hypothesis is passed to ``on_partial`` so lookups for the command
+        can start before the user stops talking.
+        """
+        import speech_recognition as sr
+
+        self.subsystems.wait('voice')
+        self.subsystems.wait('commands')
+        # Speech plays in the background; do not record our own voice
+        self.speech.wait()
+        logger.info("Listening for command...")
+        if self.pre_summarizer is not None:
+            self.pre_summarizer.touch()
+        self.command_processor.prefetcher.clear()
+        transcription = self.asr_backend.start_stream()
+
         try:
-            text = self.recognizer.recognize_google(audio)
-            logger.info(f"Recognized: {text}")
+            for chunk in self.microphone.listen_stream(timeout=None, phrase_time_limit=None):
+                partial = transcription.accept(chunk)
+                if partial:
+                    self.on_partial(partial)
+            result = transcription.finish()
+            if not result:
+                raise GmailAssistantError("Could not understand audio")
+            text, confidence = result
+            logger.info(f"Recognized: {text} (confidence {confidence:.2f})")
             return text
         except sr.UnknownValueError:
             raise GmailAssistantError("Could not understand audio")
         except sr.RequestError as e:
             raise GmailAssistantError(f"Could not request results: {str(e)}")
 
+    def on_partial(self, text):
+        """Handle a partial transcript by prefetching what it asks for."""
+        logger.debug(f"Partial: {text}")
+        self.command_processor.prefetch_for(text)
+
     def speak(self, text):
-        """Convert text to speech."""
+        """Queue text for speech and return without waiting for the audio."""
+        self.subsystems.wait('voice')
         logger.info(f"Speaking: {text}")
-        self.engine.say(text)
-        self.engine.runAndWait()
+        self.speech.say(text)
+
+    def interrupt_speech(self):
+        """Stop speaking, e.g. because the user started a new command."""
+        self._stream_stop.set()
+        if self.speech is not None:
+            self.speech.interrupt()
+
+    def speak_stream(self, tokens, on_text=None):
+        """Speak a token stream sentence by sentence as it is generated.
+
+        interrupt_speech() also stops the stream, so the model stops
+        generating speech that will not be heard.
+        """
+        self._stream_stop = threading.Event()
+        return speak_stream(tokens, self.speak, on_text, stop=self._stream_stop)
 
     def process_command(self, command_text):
         """Process the recognized command."""
+        # A new command barges in on whatever is still being said
+        self.interrupt_speech()
         # First try to identify if it's a specific email command
-        for cmd in self.command_processor.commands:
-            if cmd in command_text.lower():
-                return self.command_processor.process_command(command_text)
+        self.subsystems.wait('commands')
+        if self.pre_summarizer is not None:
+            self.pre_summarizer.touch()
+        result = self.command_processor.process_command(command_text)
+        if (result.response is None and result.intent in self.command_processor.commands
+                and self.command_processor.gmail_service is None):
+            # An email command that arrived while Gmail was still connecting
+            self.subsystems.wait('gmail')
+            result = self.command_processor.process_command(command_text)
+        if result.response is not None:
+            return result.response
         
         # If not a specific command, treat as conversation
+        self.subsystems.wait('llm')
         return self.llm_service.process_conversation(command_text)
 
     def run(self):
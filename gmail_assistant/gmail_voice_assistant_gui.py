@@ -1,62 +1,46 @@
 import customtkinter as ctk
 from .gmail_voice_assistant import GmailVoiceAssistant
 from .error_handler import handle_errors, GmailAssistantError
+from .startup import StartupProfiler
 import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Assistant subsystems and how they are named in the status log
+SUBSYSTEM_LABELS = {
+    'commands': "NLU system",
+    'voice': "Voice system",
+    'gmail': "Gmail API",
+    'llm': "Language model",
+    'nltk': "NLP components",
+}
+
 class GmailAssistantGUI:
-    def __init__(self):
+    def __init__(self, profiler=None):
         try:
+            self.profiler = profiler or StartupProfiler()
             logger.info("Initializing GUI...")
-            self.window = ctk.CTk()
-            self.window.title("Gmail Voice Assistant")
-            self.window.geometry("800x600")
+            with self.profiler.phase('gui.window'):
+                self.window = ctk.CTk()
+                self.window.title("Gmail Voice Assistant")
+                self.window.geometry("800x600")
             
-            # Initialize assistant first
-            logger.info("Creating voice assistant...")
-            self.assistant = GmailVoiceAssistant()
+            # Create the assistant without loading anything; its subsystems
+            # come up in the background once the window is showing
+            self.assistant = GmailVoiceAssistant(lazy=True, profiler=self.profiler)
             
             self.listening = False
             self.listen_thread = None
+            self._subsystems_shown = set()
             
             logger.info("Setting up GUI components...")
-            self.setup_gui()
+            with self.profiler.phase('gui.widgets'):
+                self.setup_gui()
             
-            # Show comprehensive test results
             self.log_output("\n=== System Status ===")
-            
-            try:
-                self.log_output("\n1. NLTK Components:")
-                self.assistant.test_nltk_components()
-                self.log_output("✓ NLP components ready")
-            except GmailAssistantError as e:
-                self.log_output(f"✗ NLP Error: {str(e)}")
-            
-            try:
-                self.log_output("\n2. Gmail API:")
-                self.assistant.test_api_endpoints()
-                self.log_output("✓ Gmail API connected")
-            except GmailAssistantError as e:
-                self.log_output(f"✗ API Error: {str(e)}")
-            
-            try:
-                self.log_output("\n3. Voice Components:")
-                self.assistant.test_voice_components()
-                self.log_output("✓ Voice system ready")
-            except GmailAssistantError as e:
-                self.log_output(f"✗ Voice Error: {str(e)}")
-            
-            try:
-                self.log_output("\n4. NLU Processing:")
-                self.assistant.test_nlu_processing()
-                self.log_output("✓ NLU system operational")
-            except GmailAssistantError as e:
-                self.log_output(f"✗ NLU Error: {str(e)}")
-            
-            self.log_output("\n=== Initialization Complete ===\n")
-            self.status_label.configure(text="Status: Ready")
+            self.status_label.configure(text="Status: Starting...")
+            self.window.after(0, self.start_subsystems)
             
             logger.info("GUI initialization complete")
             
@@ -64,6 +48,32 @@ class GmailAssistantGUI:
             logger.error(f"Failed to initialize GUI: {str(e)}")
             raise
 
+    def start_subsystems(self):
+        """Start the assistant's subsystems once the event loop is running."""
+        self.profiler.mark('gui.interactive')
+        self.assistant.start_background(on_ready=self.on_subsystem_ready)
+
+    def on_subsystem_ready(self, name, error):
+        """Report a subsystem from its startup thread to the GUI thread."""
+        self.window.after(0, self.show_subsystem_status, name, error)
+
+    def show_subsystem_status(self, name, error):
+        """Log a subsystem's startup result and finish once all are up."""
+        label = SUBSYSTEM_LABELS.get(name, name)
+        if error is None:
+            self.log_output(f"✓ {label} ready")
+        else:
+            self.log_output(f"✗ {label} Error: {str(error)}")
+        
+        self._subsystems_shown.add(name)
+        if self._subsystems_shown == set(self.assistant.subsystems.names):
+            report = self.profiler.report()
+            logger.info(report)
+            self.log_output("\n=== Initialization Complete ===\n")
+            self.log_output(report)
+            self.status_label.configure(
+                text="Status: Listening..." if self.listening else "Status: Ready")
+
     def setup_gui(self):
         """Setup GUI components."""
         # Status Frame
@@ -160,7 +170,8 @@ class GmailAssistantGUI:
         
     def clear_chat(self):
         """Clear chat history."""
-        self.assistant.llm_service.clear_conversation()
+        if self.assistant.llm_service is not None:
+            self.assistant.llm_service.clear_conversation()
         self.log_output("\nChat history cleared")
         
     def listen_loop(self):
@@ -172,14 +183,19 @@ class GmailAssistantGUI:
                     self.log_output(f"\nYou: {command}")
                     
                     if self.chat_mode:
-                        # In chat mode, everything goes to LLM
-                        response = self.assistant.llm_service.process_conversation(command)
+                        # In chat mode, everything goes to LLM, streamed into
+                        # the log and speech a sentence at a time
+                        self.log_output("\nAssistant:")
+                        self.assistant.subsystems.wait('llm')
+                        self.assistant.speak_stream(
+                            self.assistant.llm_service.stream_conversation(command),
+                            on_text=self.log_output)
                     else:
                         # In command mode, try commands first, then fall back to LLM
                         response = self.assistant.process_command(command)
                         
-                    self.log_output(f"\nAssistant: {response}")
-                    self.assistant.speak(response)
+                        self.log_output(f"\nAssistant: {response}")
+                        self.assistant.speak(response)
                     
             except GmailAssistantError as e:
                 logger.error(f"Error in listen loop: {str(e)}")
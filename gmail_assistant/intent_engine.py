@@ -0,0 +1,343 @@
+"""Match command text to intents with a compiled phrase automaton."""
+
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict
+
+UNKNOWN = "unknown"
+
+# Command phrases per intent, written in normalized tokens (see SYNONYMS and
+# FILLER_WORDS). Single verbs are weak: any longer phrase outranks them.
+# Verbs that change or send mail always need their object, so "what did bob
+# send me" or "do not delete anything" match nothing.
+INTENT_PHRASES = {
+    "read_email": [
+        "read email",
+        "check email",
+        "show email",
+        "open email",
+        "display email",
+    ],
+    "send_email": [
+        "send email",
+        "compose email",
+        "write email",
+        "new email",
+        "draft email",
+        "compose",
+    ],
+    "search_email": ["search email", "find email", "search for", "look for", "search"],
+    "check_inbox": ["check inbox", "inbox", "what is new", "any new email"],
+    "list_unread": ["unread", "unread email"],
+    "list_important": ["important", "important email", "starred email"],
+    "delete_email": [
+        "delete email",
+        "trash email",
+        "remove email",
+        "delete latest email",
+        "delete last email",
+        "trash latest email",
+        "delete everything",
+        "trash everything",
+    ],
+    "mark_read": [
+        "mark as read",
+        "mark read",
+        "mark email as read",
+        "mark email read",
+        "as read",
+    ],
+    "summarize_email": [
+        "summarize email",
+        "summarize",
+        "summary",
+        "sum up",
+        "give summary",
+    ],
+    "improve_writing": ["improve writing", "improve", "suggestion", "proofread"],
+    "help": ["help", "list commands", "what can you do"],
+}
+
+WEAK_PHRASES = {
+    "read_email": ["read", "check", "show", "latest email", "last email"],
+    "search_email": ["find"],
+}
+
+# Intents that change or send mail...
+DESTRUCTIVE_INTENTS = frozenset(["send_email", "delete_email", "mark_read"])
+# ...only run directly on a match at least this good; weak phrases score below it
+DIRECT_MATCH_SCORE = 0.8
+
+# Words that turn the command after them around, as in "don't delete"
+NEGATIONS = frozenset(["not", "don't", "dont", "never"])
+
+SYNONYMS = {
+    "emails": "email",
+    "mail": "email",
+    "mails": "email",
+    "e-mail": "email",
+    "message": "email",
+    "messages": "email",
+    "gmail": "email",
+    "suggestions": "suggestion",
+    "reading": "read",
+    "checking": "check",
+    "sending": "send",
+    "searching": "search",
+    "finding": "find",
+    "showing": "show",
+    "deleting": "delete",
+    "summarise": "summarize",
+    "summarizing": "summarize",
+    "summarising": "summarize",
+    "erase": "delete",
+    "newest": "latest",
+    "recent": "latest",
+    "what's": "what is",
+    "whats": "what is",
+}
+
+FILLER_WORDS = frozenset(
+    [
+        "a",
+        "an",
+        "the",
+        "my",
+        "me",
+        "please",
+        "can",
+        "could",
+        "would",
+        "you",
+        "i",
+        "want",
+        "some",
+        "all",
+        "just",
+        "now",
+        "hey",
+        "ok",
+        "okay",
+    ]
+)
+
+# Words that introduce a slot value, and the slot they fill
+SLOT_KEYWORDS = {
+    "from": "sender",
+    "to": "recipient",
+    "subject": "subject",
+    "about": "subject",
+    "since": "after",
+    "after": "after",
+    "page": "page",
+}
+
+NUMBER_WORDS = {
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9@._+'-]+")
+
+
+@dataclass
+class IntentMatch:
+    """Result of matching one command."""
+
+    intent: str
+    slots: Dict[str, object] = field(default_factory=dict)
+    score: float = 0.0
+
+    @property
+    def matched(self):
+        return self.intent != UNKNOWN
+
+    @property
+    def runnable(self):
+        """Whether the match is good enough to act on without asking."""
+        return self.matched and (
+            self.intent not in DESTRUCTIVE_INTENTS or self.score >= DIRECT_MATCH_SCORE
+        )
+
+
+def tokenize(text):
+    """Lower-case and split text, applying synonyms."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        token = token.strip(".'")
+        if not token:
+            continue
+        tokens.extend(SYNONYMS.get(token, token).split())
+    return tokens
+
+
+class IntentEngine:
+    """Aho-Corasick automaton over word tokens.
+
+    Every phrase of every intent is compiled into one automaton when the
+    engine is created, so matching is a single pass over the command's
+    tokens however many phrases there are. The longest matched phrase wins;
+    weak phrases only count when nothing else matched, and phrases after a
+    negation such as "don't" do not count at all.
+
+    Args:
+        phrases: Mapping of intent to command phrases.
+        weak_phrases: Mapping of intent to low-priority phrases.
+    """
+
+    def __init__(self, phrases=INTENT_PHRASES, weak_phrases=WEAK_PHRASES):
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        for intent, intent_phrases in phrases.items():
+            for phrase in intent_phrases:
+                self._add(intent, phrase, weak=False)
+        for intent, intent_phrases in weak_phrases.items():
+            for phrase in intent_phrases:
+                self._add(intent, phrase, weak=True)
+        self._build_failure_links()
+
+    def _add(self, intent, phrase, weak):
+        tokens = [token for token in tokenize(phrase) if token not in FILLER_WORDS]
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append((intent, len(tokens), weak))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(token, 0)
+                # Inherit phrases that end here as suffixes of this one
+                self._outputs[next_state] = (
+                    self._outputs[next_state] + self._outputs[self._fail[next_state]]
+                )
+
+    def _scan(self, tokens):
+        """Yield (intent, start, end, weak) for every phrase in ``tokens``."""
+        state = 0
+        for position, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for intent, length, weak in self._outputs[state]:
+                yield intent, position + 1 - length, position + 1, weak
+
+    def match(self, text):
+        """Match command text to an intent.
+
+        Returns:
+            IntentMatch with the intent (UNKNOWN if nothing matched), the
+            extracted slots and a score between 0 and 1.
+        """
+        words = tokenize(text)
+        content = [word for word in words if word not in FILLER_WORDS]
+        best = None
+        negated = next(
+            (index for index, word in enumerate(content) if word in NEGATIONS),
+            len(content),
+        )
+        for intent, start, end, weak in self._scan(content):
+            if start > negated:
+                continue
+            # Prefer strong over weak, then longer phrases, then earlier ones
+            rank = (not weak, end - start, -start)
+            if best is None or rank > best[0]:
+                best = (rank, intent, start, end)
+        if best is None:
+            return IntentMatch(UNKNOWN)
+
+        (strong, length, _), intent, start, end = best
+        rest = content[end:]
+        slots, used, first = extract_slots(rest)
+        if intent == "search_email":
+            # Free text between the phrase and the first slot is the query
+            terms = [word for word in rest[:first] if word != "email"]
+            if terms:
+                slots["query"] = " ".join(terms)
+                used += len(terms)
+        # Share of the command explained by the phrase and its slots
+        coverage = min(1.0, (length + used) / len(content))
+        score = (0.8 if strong else 0.55) + 0.2 * coverage
+        return IntentMatch(intent, slots, round(score, 2))
+
+
+def extract_slots(words):
+    """Extract slot values from the words following a command phrase.
+
+    Returns:
+        Tuple of (slots, number of words the slots used, index of the first
+        slot keyword or ``len(words)``).
+    """
+    slots = {}
+    used = 0
+    first = len(words)
+    index = 0
+    while index < len(words):
+        word = words[index]
+        if word in ("last", "latest") and index + 1 < len(words):
+            count = _parse_number(words[index + 1])
+            if count:
+                slots["count"] = count
+                first = min(first, index)
+                used += 2
+                index += 2
+                continue
+        slot = SLOT_KEYWORDS.get(word)
+        if slot is None or index + 1 >= len(words):
+            index += 1
+            continue
+        first = min(first, index)
+        end = index + 1
+        if slot == "subject":
+            # Subjects run until the next slot keyword
+            while end < len(words) and words[end] not in SLOT_KEYWORDS:
+                end += 1
+        else:
+            end += 1
+        value = " ".join(words[index + 1 : end])
+        if slot == "page":
+            value = _parse_number(value) or value
+        slots[slot] = value
+        used += end - index
+        index = end
+    return slots, used, first
+
+
+def _parse_number(word):
+    if word.isdigit():
+        return int(word)
+    return NUMBER_WORDS.get(word)
+
+
+_engine = None
+
+
+def get_engine():
+    """Return the shared engine, compiling it on first use."""
+    global _engine
+    if _engine is None:
+        _engine = IntentEngine()
+    return _engine
@@ -1,4 +1,12 @@
 """LLM service package for Gmail Assistant."""
-from .service import LLMService
 
-__all__ = ['LLMService'] 
\ No newline at end of file
+__all__ = ['LLMService']
+
+
+def __getattr__(name):
+    # Imported on first use so that loading a submodule such as
+    # llm.streaming does not pull in the HTTP client
+    if name == 'LLMService':
+        from .service import LLMService
+        return LLMService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,254 @@
+"""Interchangeable LLM backends behind one generate/stream/embed interface."""
+
+import json
+import os
+
+from ..error_handler import GmailAssistantError
+from ..utils import logger
+from .http_client import get_client
+from .streaming import iter_ndjson_tokens
+
+# Backends tried by the router, in order of preference until it has
+# measured their latency
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "llama_cpp,ollama")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama2")
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", OLLAMA_MODEL)
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
+
+MAX_TOKENS = 512
+TEMPERATURE = 0.7
+
+
+class LLMBackend:
+    """Interface for a text generation provider.
+
+    Every backend takes the same sampling options, so callers and the
+    router do not need to know which provider answers.
+    """
+
+    name = None
+    model = None
+
+    @property
+    def model_id(self):
+        """Backend and model that answer, e.g. to key cached responses by."""
+        return f"{self.name}:{self.model}"
+
+    def generate(
+        self, prompt, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, stop=None
+    ):
+        """Return the complete response to ``prompt``."""
+        return "".join(
+            self.stream(
+                prompt, max_tokens=max_tokens, temperature=temperature, stop=stop
+            )
+        )
+
+    def stream(self, prompt, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, stop=None):
+        """Yield response tokens as they are generated."""
+        raise NotImplementedError
+
+    def generate_json(self, prompt, schema, max_tokens=MAX_TOKENS, temperature=0):
+        """Return the response as a parsed JSON object.
+
+        Backends constrain decoding to JSON, so the model spends its tokens
+        on the answer rather than on prose around it. The prompt should
+        still describe ``schema``; only llama.cpp enforces it exactly.
+
+        Raises:
+            NotImplementedError: If the backend has no JSON mode.
+            ValueError: If the response is not a JSON object.
+        """
+        raise NotImplementedError
+
+    def embed(self, text):
+        """Return an embedding vector for ``text``.
+
+        Raises:
+            NotImplementedError: If the backend cannot embed.
+        """
+        raise NotImplementedError
+
+
+def parse_json_object(text):
+    """Parse a model's JSON response, which must be an object."""
+    value = json.loads(text)
+    if not isinstance(value, dict):
+        raise ValueError(f"Expected a JSON object, got {type(value).__name__}")
+    return value
+
+
+class OllamaBackend(LLMBackend):
+    """A model served by Ollama over HTTP."""
+
+    name = "ollama"
+
+    def __init__(self, model=OLLAMA_MODEL, embed_model=OLLAMA_EMBED_MODEL, client=None):
+        self.model = model
+        self.embed_model = embed_model
+        self.client = client or get_client()
+
+    def _payload(self, prompt, max_tokens, temperature, stop, stream):
+        options = {"num_predict": max_tokens, "temperature": temperature}
+        if stop:
+            options["stop"] = stop
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": options,
+        }
+
+    def generate(
+        self, prompt, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, stop=None
+    ):
+        response = self.client.post(
+            "/api/generate", self._payload(prompt, max_tokens, temperature, stop, False)
+        )
+        response.raise_for_status()
+        return response.json()["response"]
+
+    def stream(self, prompt, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, stop=None):
+        response = self.client.post(
+            "/api/generate",
+            self._payload(prompt, max_tokens, temperature, stop, True),
+            stream=True,
+        )
+        response.raise_for_status()
+        yield from iter_ndjson_tokens(response)
+
+    def generate_json(self, prompt, schema, max_tokens=MAX_TOKENS, temperature=0):
+        payload = self._payload(prompt, max_tokens, temperature, None, False)
+        payload["format"] = "json"
+        response = self.client.post("/api/generate", payload)
+        response.raise_for_status()
+        return parse_json_object(response.json()["response"])
+
+    def embed(self, text):
+        response = self.client.post(
+            "/api/embeddings", {"model": self.embed_model, "prompt": text}
+        )
+        response.raise_for_status()
+        return response.json()["embedding"]
+
+
+class LlamaCppBackend(LLMBackend):
+    """The local llama.cpp worker process.
+
+    The backend does not start the worker; while it is down, requests fail
+    fast and the router moves on.
+    """
+
+    name = "llama_cpp"
+
+    def __init__(self, client=None):
+        from ..llm_worker import LLMWorkerClient
+
+        self.client = client or LLMWorkerClient()
+
+    @property
+    def model_id(self):
+        from ..llm_worker import MODEL_ID
+
+        return f"{self.name}:{MODEL_ID}"
+
+    def stream(self, prompt, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, stop=None):
+        return self.client.stream(
+            prompt, max_tokens=max_tokens, temperature=temperature, stop=stop or []
+        )
+
+    def generate_json(self, prompt, schema, max_tokens=MAX_TOKENS, temperature=0):
+        # The worker compiles the schema into a grammar, so the output
+        # cannot deviate from it
+        return parse_json_object(
+            self.client.generate(
+                prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                json_schema=schema,
+            )
+        )
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI chat models; the prompt is sent as one user message."""
+
+    name = "openai"
+
+    def __init__(self, model=OPENAI_MODEL, embed_model=OPENAI_EMBED_MODEL, client=None):
+        self.model = model
+        self.embed_model = embed_model
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise GmailAssistantError("OPENAI_API_KEY is not set")
+            self._client = OpenAI(api_key=api_key)
+        return self._client
+
+    def _create(self, prompt, max_tokens, temperature, stop, stream, **extra):
+        return self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop or None,
+            stream=stream,
+            **extra,
+        )
+
+    def generate(
+        self, prompt, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, stop=None
+    ):
+        response = self._create(prompt, max_tokens, temperature, stop, False)
+        return response.choices[0].message.content
+
+    def stream(self, prompt, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, stop=None):
+        for chunk in self._create(prompt, max_tokens, temperature, stop, True):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def generate_json(self, prompt, schema, max_tokens=MAX_TOKENS, temperature=0):
+        response = self._create(
+            prompt,
+            max_tokens,
+            temperature,
+            None,
+            False,
+            response_format={"type": "json_object"},
+        )
+        return parse_json_object(response.choices[0].message.content)
+
+    def embed(self, text):
+        response = self.client.embeddings.create(model=self.embed_model, input=text)
+        return response.data[0].embedding
+
+
+BACKENDS = {
+    LlamaCppBackend.name: LlamaCppBackend,
+    OllamaBackend.name: OllamaBackend,
+    OpenAIBackend.name: OpenAIBackend,
+}
+
+
+def create_backend(name):
+    """Create an LLM backend by name."""
+    name = name.strip().lower()
+    if name not in BACKENDS:
+        raise GmailAssistantError(
+            f"Unknown LLM backend '{name}'. Choose one of: {', '.join(BACKENDS)}"
+        )
+    logger.info(f"Loading {name} LLM backend")
+    return BACKENDS[name]()
+
+
+def create_backends(names=None):
+    """Create the backends named in ``names`` or the LLM_BACKENDS variable."""
+    names = names or LLM_BACKENDS.split(",")
+    return [create_backend(name) for name in names if name.strip()]
@@ -0,0 +1,118 @@
+"""Shared, pooled HTTP client for the Ollama server."""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..utils import logger
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+
+# Connect fails fast when Ollama is down; reads wait for slow generations.
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 60
+HEALTH_READ_TIMEOUT = 2
+
+
+class OllamaClient:
+    """Keep-alive session with one retry/backoff and timeout policy."""
+
+    def __init__(
+        self,
+        base_url=OLLAMA_BASE_URL,
+        pool_size=4,
+        max_retries=2,
+        backoff_factor=0.5,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.available = None
+        self._health_thread = None
+
+        # Retry refused connections for any request, but gateway errors
+        # only for GETs: a POST that got a response may already have
+        # reached the model.
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            backoff_factor=backoff_factor,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def post(self, path, payload, stream=False, timeout=None):
+        """POST JSON to an Ollama endpoint over a pooled connection."""
+        return self.session.post(
+            self.url(path), json=payload, stream=stream, timeout=timeout or self.timeout
+        )
+
+    def check_health(self):
+        """Probe the server once without loading a model.
+
+        Returns:
+            True if Ollama answered, False otherwise.
+        """
+        try:
+            response = self.session.get(
+                self.url("/api/tags"), timeout=(self.timeout[0], HEALTH_READ_TIMEOUT)
+            )
+            self.available = response.status_code == 200
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Could not connect to Ollama server: {str(e)}")
+            self.available = False
+        if self.available:
+            logger.info("Successfully connected to Ollama")
+        return self.available
+
+    def check_health_async(self, callback=None):
+        """Run check_health on a background thread.
+
+        Args:
+            callback: Optional callable receiving the availability flag.
+        """
+
+        def run():
+            available = self.check_health()
+            if callback:
+                callback(available)
+
+        if self._health_thread and self._health_thread.is_alive():
+            return self._health_thread
+        self._health_thread = threading.Thread(
+            target=run, name="OllamaHealthCheck", daemon=True
+        )
+        self._health_thread.start()
+        return self._health_thread
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide OllamaClient."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+        return _client
@@ -1,28 +1,44 @@
 """Ollama LLM integration."""
-import requests
 from ..utils import handle_errors, logger
+from .http_client import get_client
+from .response_cache import DETERMINISTIC, cache_key, get_cache
+from .streaming import iter_ndjson_tokens
 
 class OllamaHandler:
-    def __init__(self, model="llama2"):
-        self.base_url = "http://localhost:11434/api"
+    def __init__(self, model="llama2", client=None, cache=None):
+        self.client = client or get_client()
+        self.cache = cache or get_cache()
         self.model = model
 
     @handle_errors
-    def generate(self, prompt, context=None):
+    def generate(self, prompt, context=None, options=None):
         """Generate response using Ollama"""
-        url = f"{self.base_url}/generate"
-        
         payload = {
             "model": self.model,
             "prompt": prompt,
             "context": context,
             "stream": False
         }
+        if options:
+            payload["options"] = options
 
-        response = requests.post(url, json=payload)
+        response = self.client.post("/api/generate", payload)
         response.raise_for_status()
         return response.json()['response']
 
+    def stream(self, prompt, context=None):
+        """Yield response tokens from Ollama as they are generated"""
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "context": context,
+            "stream": True
+        }
+
+        response = self.client.post("/api/generate", payload, stream=True)
+        response.raise_for_status()
+        yield from iter_ndjson_tokens(response)
+
     @handle_errors
     def analyze_command(self, text, context=None):
         """Analyze voice command with context"""
@@ -38,4 +54,6 @@ class OllamaHandler:
         
         Return analysis in a clear, structured way.
         """
-        return self.generate(prompt) 
\ No newline at end of file
+        key = cache_key(f"ollama:{self.model}", prompt, dict(DETERMINISTIC, context=context))
+        return self.cache.get_or_compute(
+            key, lambda: self.generate(prompt, context, options=DETERMINISTIC)) 
\ No newline at end of file
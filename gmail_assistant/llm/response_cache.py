@@ -0,0 +1,200 @@
+"""Content-addressed cache for deterministic LLM responses."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from ..utils import logger
+
+# Set LLM_CACHE_PATH to an empty string to keep the cache in memory only
+CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH", str(Path.home() / ".gmail_assistant" / "llm_cache.sqlite")
+)
+CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+MEMORY_ENTRIES = 256
+DISK_ENTRIES = 5000
+
+# Sampling options for calls whose responses are cached: greedy decoding
+# makes the same prompt give the same answer
+DETERMINISTIC = {"temperature": 0}
+
+
+def cache_key(model, prompt, params=None):
+    """Hash of everything that determines a response.
+
+    Whitespace in the prompt is normalized, so prompts built from templates
+    with different indentation share an entry.
+    """
+    document = json.dumps(
+        {
+            "model": model,
+            "prompt": " ".join(prompt.split()),
+            "params": params or {},
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(document.encode()).hexdigest()
+
+
+class ResponseCache:
+    """In-memory LRU in front of an optional SQLite store.
+
+    Entries expire ``ttl`` seconds after they were stored. The memory tier
+    holds at most ``max_entries`` and the disk tier ``max_disk_entries``,
+    evicting the least recently used. Values must be JSON serializable.
+
+    Args:
+        path: SQLite file for the disk tier, or None for memory only.
+        ttl: Seconds an entry stays valid.
+        max_entries: Capacity of the memory tier.
+        max_disk_entries: Capacity of the disk tier.
+        clock: Time source, for tests.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        ttl=CACHE_TTL,
+        max_entries=MEMORY_ENTRIES,
+        max_disk_entries=DISK_ENTRIES,
+        clock=time.time,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._db = None
+        if path:
+            try:
+                self._db = self._open(path)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"LLM response cache stays in memory: {str(e)}")
+
+    @staticmethod
+    def _open(path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(path), check_same_thread=False)
+        db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                          key TEXT PRIMARY KEY,
+                          value TEXT NOT NULL,
+                          created REAL NOT NULL,
+                          accessed REAL NOT NULL)""")
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        db.commit()
+        return db
+
+    def get(self, key):
+        """Return the cached value for ``key``, or None."""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            entry = self._load(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._remember(key, *entry)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """Store a value under ``key``."""
+        now = self._clock()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now),
+                )
+                self._db.execute(
+                    """DELETE FROM responses WHERE key IN (
+                           SELECT key FROM responses ORDER BY accessed DESC
+                           LIMIT -1 OFFSET ?)""",
+                    (self.max_disk_entries,),
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to store LLM response: {str(e)}")
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value, or compute and store it.
+
+        ``compute`` returning None is not cached, so failed calls are
+        retried next time.
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def clear(self):
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def _remember(self, key, created, value):
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key, now):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT created, value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[0] >= self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._db.commit()
+            return row[0], json.loads(row[1])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Failed to read LLM response cache: {str(e)}")
+            return None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide ResponseCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(CACHE_PATH)
+        return _cache
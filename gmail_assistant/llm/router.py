@@ -0,0 +1,236 @@
+"""Route LLM requests to the fastest healthy backend."""
+
+import threading
+import time
+from collections import deque
+
+from ..error_handler import GmailAssistantError
+from ..utils import logger
+from .backends import create_backends
+
+# Requests per backend and operation that the statistics cover
+WINDOW = 50
+# Backends failing more often than this are skipped...
+MAX_ERROR_RATE = 0.5
+# ...until they have had this many seconds to recover
+RETRY_AFTER = 30
+
+
+class LatencyStats:
+    """Rolling latency and error rate over the last ``window`` requests."""
+
+    def __init__(self, window=WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.last_failure = None
+
+    def record(self, seconds, ok, now=None):
+        with self._lock:
+            self._samples.append((seconds, ok))
+            if not ok:
+                self.last_failure = now
+
+    @property
+    def count(self):
+        return len(self._samples)
+
+    @property
+    def error_rate(self):
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(not ok for _, ok in self._samples) / len(self._samples)
+
+    def percentile(self, fraction):
+        """Latency below which ``fraction`` of successful requests finished.
+
+        Returns:
+            Seconds, or None before the first success.
+        """
+        with self._lock:
+            latencies = sorted(seconds for seconds, ok in self._samples if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, max(0, round(fraction * len(latencies)) - 1))
+        return latencies[index]
+
+    @property
+    def p50(self):
+        return self.percentile(0.5)
+
+    @property
+    def p95(self):
+        return self.percentile(0.95)
+
+
+class LLMRouter:
+    """Send each request to the fastest healthy backend, falling back on errors.
+
+    Backends are ranked per operation by their rolling p50 latency.
+    Backends without a measurement yet keep their configured order ahead
+    of measured ones, so each gets tried. A backend whose error rate
+    exceeds ``max_error_rate`` moves to the end until ``retry_after``
+    seconds have passed since its last failure. Streams are timed to their
+    first token and can only fall back before it arrives.
+
+    Args:
+        backends: LLMBackend instances in order of preference.
+        window: Requests the rolling statistics cover.
+        max_error_rate: Error rate above which a backend is unhealthy.
+        retry_after: Seconds before an unhealthy backend is tried again.
+        clock: Time source, for tests.
+    """
+
+    def __init__(
+        self,
+        backends,
+        window=WINDOW,
+        max_error_rate=MAX_ERROR_RATE,
+        retry_after=RETRY_AFTER,
+        clock=time.monotonic,
+    ):
+        if not backends:
+            raise GmailAssistantError("No LLM backends configured")
+        self.backends = list(backends)
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.retry_after = retry_after
+        self._clock = clock
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def stats_for(self, backend, operation):
+        key = (backend.name, operation)
+        with self._lock:
+            if key not in self._stats:
+                self._stats[key] = LatencyStats(self.window)
+            return self._stats[key]
+
+    def is_healthy(self, backend, operation):
+        stats = self.stats_for(backend, operation)
+        if stats.error_rate <= self.max_error_rate:
+            return True
+        return self._clock() - stats.last_failure >= self.retry_after
+
+    def ranked(self, operation):
+        """Backends in the order a request for ``operation`` tries them."""
+
+        def rank(indexed):
+            index, backend = indexed
+            p50 = self.stats_for(backend, operation).p50
+            return (
+                not self.is_healthy(backend, operation),
+                p50 is not None,
+                p50 or 0.0,
+                index,
+            )
+
+        return [backend for _, backend in sorted(enumerate(self.backends), key=rank)]
+
+    def generate(self, prompt, **options):
+        """Return the first backend's complete response."""
+        return self.route(
+            "generate", lambda backend: backend.generate(prompt, **options)
+        )
+
+    def generate_json(self, prompt, schema, **options):
+        """Return a JSON object from the first backend with a JSON mode.
+
+        A response that is not valid JSON counts as a failure, so the next
+        backend is tried.
+        """
+        return self.route(
+            "json", lambda backend: backend.generate_json(prompt, schema, **options)
+        )
+
+    def embed(self, text):
+        """Return an embedding from the first backend that supports it."""
+        return self.route("embed", lambda backend: backend.embed(text))
+
+    def stream(self, prompt, **options):
+        """Yield tokens from the first backend that starts answering."""
+        errors = []
+        for backend in self.ranked("stream"):
+            stats = self.stats_for(backend, "stream")
+            started = self._clock()
+            try:
+                tokens = iter(backend.stream(prompt, **options))
+                first = next(tokens, None)
+            except NotImplementedError:
+                continue
+            except Exception as e:
+                stats.record(self._clock() - started, False, self._clock())
+                logger.warning(
+                    f"{backend.name} stream failed, trying next backend: {str(e)}"
+                )
+                errors.append(f"{backend.name}: {str(e)}")
+                continue
+            stats.record(self._clock() - started, True)
+            if first is None:
+                return
+            yield first
+            try:
+                yield from tokens
+            except Exception as e:
+                stats.record(self._clock() - started, False, self._clock())
+                raise GmailAssistantError(f"{backend.name} stream failed: {str(e)}")
+            return
+        raise GmailAssistantError(
+            f"All LLM backends failed: {'; '.join(errors) or 'none support stream'}"
+        )
+
+    def route(self, operation, request):
+        """Return ``request(backend)`` from the first backend that succeeds.
+
+        Args:
+            operation: Name the latency statistics are kept under.
+            request: ``(backend) -> result``, raising NotImplementedError
+                for backends that lack the operation.
+        """
+        errors = []
+        for backend in self.ranked(operation):
+            stats = self.stats_for(backend, operation)
+            started = self._clock()
+            try:
+                result = request(backend)
+            except NotImplementedError:
+                continue
+            except Exception as e:
+                stats.record(self._clock() - started, False, self._clock())
+                logger.warning(
+                    f"{backend.name} {operation} failed, trying next backend: {str(e)}"
+                )
+                errors.append(f"{backend.name}: {str(e)}")
+                continue
+            stats.record(self._clock() - started, True)
+            return result
+        reason = "; ".join(errors) or f"none support {operation}"
+        raise GmailAssistantError(f"All LLM backends failed: {reason}")
+
+    def report(self):
+        """Statistics per backend and operation, for logs and diagnostics."""
+        with self._lock:
+            items = sorted(self._stats.items())
+        return {
+            f"{name}.{operation}": {
+                "requests": stats.count,
+                "p50": stats.p50,
+                "p95": stats.p95,
+                "error_rate": stats.error_rate,
+            }
+            for (name, operation), stats in items
+            if stats.count
+        }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Return the process-wide router over the LLM_BACKENDS backends."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = LLMRouter(create_backends())
+        return _router
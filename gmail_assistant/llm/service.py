@@ -1,187 +1,251 @@
 """LLM service for analyzing and processing commands using Ollama/Llama."""
-import requests
-import time
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from ..utils import logger, handle_errors
+from ..intent_engine import DIRECT_MATCH_SCORE, INTENT_PHRASES, UNKNOWN, get_engine
+from .http_client import get_client
+from .response_cache import DETERMINISTIC, cache_key, get_cache
+from .router import get_router
+
+# A JSON analysis fits in this many tokens
+ANALYSIS_MAX_TOKENS = 96
+
+# Seconds an ambiguous command waits for the LLM before the rule-based
+# analysis is used instead
+ANALYSIS_BUDGET = float(os.getenv('ANALYSIS_BUDGET', '1.5'))
+
+# Intent engine intents reported as analysis query types
+QUERY_TYPES = {
+    'read_email': 'email_read',
+    'check_inbox': 'email_read',
+    'list_unread': 'email_read',
+    'list_important': 'email_read',
+    'send_email': 'email_send',
+    'search_email': 'email_search',
+    'improve_writing': 'improve_writing',
+}
+
+# Slots the model may fill, with their JSON types
+SLOT_TYPES = {
+    'sender': 'string',
+    'recipient': 'string',
+    'subject': 'string',
+    'query': 'string',
+    'after': 'string',
+    'count': 'integer',
+    'page': 'integer',
+}
+
+INTENT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'intent': {'type': 'string', 'enum': list(INTENT_PHRASES) + [UNKNOWN]},
+        'slots': {
+            'type': 'object',
+            'properties': {name: {'type': kind} for name, kind in SLOT_TYPES.items()},
+            'additionalProperties': False,
+        },
+        'confidence': {'type': 'number', 'minimum': 0, 'maximum': 1},
+    },
+    'required': ['intent', 'slots', 'confidence'],
+    'additionalProperties': False,
+}
+
+ANALYSIS_PROMPT = """You are a Gmail voice assistant. Classify the user's command.
+Answer with JSON only, in the form
+{{"intent": "<one of: {intents}>", "slots": {{<any of: {slots}>}}, "confidence": <0 to 1>}}
+
+Command: {text}
+"""
 
 class LLMService:
-    def __init__(self, max_retries=3):
+    def __init__(self, client=None, cache=None, router=None, analysis_budget=ANALYSIS_BUDGET):
         self.context = {}
-        self.ollama_url = "http://localhost:11434/api/generate"
-        self.is_ollama_available = False
+        self.client = client or get_client()
+        self.cache = cache or get_cache()
+        self._router = router
+        self.analysis_budget = analysis_budget
+        self.intent_engine = get_engine()
+        # LLM analyses run here, one at a time, so callers can stop waiting on them
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Analysis")
+        self._pending = {}
+        self._pending_lock = threading.Lock()
         logger.info("Initializing LLM Service with Ollama")
         
-        # Try to connect to Ollama with retries
-        for attempt in range(max_retries):
-            try:
-                self._test_ollama_connection()
-                self.is_ollama_available = True
-                break
-            except ConnectionError as e:
-                if attempt < max_retries - 1:
-                    logger.warning(f"Attempt {attempt + 1} failed, retrying in 2 seconds...")
-                    time.sleep(2)
-                else:
-                    logger.warning("Falling back to rule-based processing (Ollama not available)")
-                    # Don't raise the error, just continue without Ollama
-        
-    def _test_ollama_connection(self):
-        """Test connection to Ollama server"""
-        try:
-            response = requests.post(
-                self.ollama_url,
-                json={
-                    "model": "llama2",
-                    "prompt": "test",
-                    "stream": False
-                },
-                timeout=5  # Add timeout
-            )
-            if response.status_code == 200:
-                logger.info("Successfully connected to Ollama")
-            else:
-                logger.warning(f"Failed to connect to Ollama. Status code: {response.status_code}")
-                raise ConnectionError("Could not connect to Ollama server")
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Could not connect to Ollama server: {str(e)}")
-            raise ConnectionError("Could not connect to Ollama server")
+        # Probe Ollama in the background; until it answers, use rule-based
+        # processing instead of blocking startup on retries
+        self.client.check_health_async(callback=self._on_health_check)
+
+    @property
+    def router(self):
+        """Router over the configured backends, for free-form generation"""
+        if self._router is None:
+            self._router = get_router()
+        return self._router
+
+    @property
+    def is_ollama_available(self):
+        return bool(self.client.available)
+
+    def _on_health_check(self, available):
+        if not available:
+            logger.warning("Falling back to rule-based processing (Ollama not available)")
     
     @handle_errors
     def analyze_query(self, text):
-        """Analyze the user's query using Llama or fallback to rule-based"""
+        """Analyze the user's query with the intent engine and the LLM.
+
+        The intent engine answers in microseconds, so a confident match is
+        returned before any LLM request is sent. Otherwise the LLM answer
+        is used if it arrives within ``analysis_budget`` seconds, and the
+        rule-based analysis if not.
+        """
         logger.info(f"Analyzing query: {text}")
-        
-        # If Ollama is not available, use rule-based analysis
-        if not self.is_ollama_available:
-            return self._rule_based_analysis(text)
-            
+
+        match = self.intent_engine.match(text)
+        if match.intent in QUERY_TYPES and match.score >= DIRECT_MATCH_SCORE:
+            return self._rule_based_analysis(text, match)
+
+        prompt = ANALYSIS_PROMPT.format(
+            intents=", ".join(INTENT_SCHEMA['properties']['intent']['enum']),
+            slots=", ".join(SLOT_TYPES), text=text)
+        future = None
         try:
-            # Attempt LLM analysis
-            system_prompt = "You are a Gmail voice assistant. Analyze the user's command and categorize it."
-            prompt = f"{system_prompt}\n\nUser command: {text}\n\nAnalyze the command type and any parameters."
-            
-            response = requests.post(
-                self.ollama_url,
-                json={
-                    "model": "llama2",
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                llm_response = response.json()
-                analysis = {
-                    'query_type': self._determine_query_type(text, llm_response),
-                    'parameters': self._extract_parameters(text, llm_response),
-                    'confidence': self._calculate_confidence(llm_response),
-                }
-                return analysis
-                
+            future = self._start_analysis(prompt)
+            if future is None:
+                backend = self.router.ranked('json')[0]
+                result = self.cache.get(self._analysis_key(backend, prompt))
+            else:
+                result = future.result(timeout=self.analysis_budget)
+            if result is not None:
+                return self._structured_analysis(result, match)
+        except TimeoutError:
+            # A running analysis still lands in the cache for next time;
+            # one that has not started yet is not worth starting
+            if future.cancel():
+                self._forget(prompt, future)
+            logger.info(f"LLM analysis exceeded {self.analysis_budget}s, using rule-based")
         except Exception as e:
             logger.warning(f"LLM analysis failed, falling back to rule-based: {str(e)}")
             
         # Fallback to rule-based analysis
-        return self._rule_based_analysis(text)
+        return self._rule_based_analysis(text, match)
+
+    def _start_analysis(self, prompt):
+        """Submit an LLM analysis, sharing one that is already running.
+
+        Returns None instead while another command is being analyzed: the
+        new analysis would only queue behind it and miss its budget too.
+        """
+        with self._pending_lock:
+            future = self._pending.get(prompt)
+            if future is not None:
+                return future
+            if self._pending:
+                logger.info("LLM busy with another analysis, using rule-based")
+                return None
+            future = self._executor.submit(self._generate_analysis, prompt)
+            self._pending[prompt] = future
+        # Runs at once if the analysis already finished
+        future.add_done_callback(lambda done: self._forget(prompt, done))
+        return future
+
+    def _forget(self, prompt, future):
+        with self._pending_lock:
+            if self._pending.get(prompt) is future:
+                del self._pending[prompt]
+
+    @staticmethod
+    def _analysis_key(backend, prompt):
+        """Cache key of an analysis, which depends on the model giving it"""
+        params = dict(DETERMINISTIC, schema=INTENT_SCHEMA)
+        return cache_key(backend.model_id, prompt, params)
+
+    def _generate_analysis(self, prompt):
+        """Ask the model for a JSON analysis, or None if it is malformed.
+
+        Answers are cached per backend and model, so switching models
+        does not serve the previous model's answers.
+        """
+        def analyze(backend):
+            return self.cache.get_or_compute(
+                self._analysis_key(backend, prompt),
+                lambda: self._request_analysis(backend, prompt))
+
+        return self.router.route('json', analyze)
+
+    def _request_analysis(self, backend, prompt):
+        result = backend.generate_json(
+            prompt, INTENT_SCHEMA, max_tokens=ANALYSIS_MAX_TOKENS, **DETERMINISTIC)
+        confidence = result.get('confidence')
+        if (result.get('intent') not in INTENT_SCHEMA['properties']['intent']['enum']
+                or not isinstance(result.get('slots'), dict)
+                or isinstance(confidence, bool)
+                or not isinstance(confidence, (int, float))):
+            logger.warning(f"LLM analysis did not match the schema: {result}")
+            return None
+        return result
+
+    def _structured_analysis(self, result, match):
+        """Analysis from the model's JSON, checked against the schema"""
+        parameters = {}
+        for name, value in result['slots'].items():
+            kind = SLOT_TYPES.get(name)
+            if kind == 'string' and isinstance(value, str) and value:
+                parameters[name] = value
+            elif kind == 'integer' and isinstance(value, int) and not isinstance(value, bool):
+                parameters[name] = value
+        # Slots the intent engine read from the text itself take precedence
+        parameters.update(match.slots)
+
+        query_type = QUERY_TYPES.get(result['intent'], 'unknown')
+        confidence = min(1.0, max(0.0, float(result['confidence'])))
+        return {
+            'query_type': query_type,
+            'parameters': parameters,
+            'confidence': confidence if query_type != 'unknown' else 0.0,
+        }
     
-    def _rule_based_analysis(self, text):
-        """Simple rule-based analysis when LLM is not available"""
-        text = text.lower()
-        query_type = self._determine_query_type(text, None)
-        parameters = self._extract_parameters(text, None)
+    def _rule_based_analysis(self, text, match=None):
+        """Rule-based analysis from the intent engine's match"""
+        match = match or self.intent_engine.match(text)
+        query_type = QUERY_TYPES.get(match.intent, 'unknown')
+        parameters = dict(match.slots)
         
         return {
             'query_type': query_type,
             'parameters': parameters,
-            'confidence': 0.7 if query_type != 'unknown' else 0.0
+            'confidence': match.score if query_type != 'unknown' else 0.0
         }
     
     def update_context(self, new_context):
         """Update the conversation context"""
         self.context.update(new_context)
     
-    def _determine_query_type(self, text, llm_response):
-        """Determine the type of query based on text and LLM response"""
-        text = text.lower()
-        
-        # First try direct keyword matching
-        if 'read' in text or 'check' in text:
-            return 'email_read'
-        elif 'send' in text or 'compose' in text:
-            return 'email_send'
-        elif 'search' in text or 'find' in text:
-            return 'email_search'
-        elif 'improve' in text or 'suggestion' in text:
-            return 'improve_writing'
-            
-        # If no direct match, analyze LLM response
-        response_text = llm_response.get('response', '').lower()
-        if 'read' in response_text or 'check' in response_text:
-            return 'email_read'
-        elif 'send' in response_text or 'compose' in response_text:
-            return 'email_send'
-        elif 'search' in response_text or 'find' in response_text:
-            return 'email_search'
-        elif 'improve' in response_text or 'suggestion' in response_text:
-            return 'improve_writing'
-            
-        return 'unknown'
-    
-    def _extract_parameters(self, text, llm_response):
-        """Extract relevant parameters from the query and LLM response"""
-        params = {}
-        text = text.lower()
-        
-        # Extract email recipient if present
-        if 'to' in text:
-            words = text.split()
-            try:
-                to_index = words.index('to')
-                if to_index + 1 < len(words):
-                    params['recipient'] = words[to_index + 1]
-            except ValueError:
-                pass
-        
-        # Try to extract additional parameters from LLM response
-        response_text = llm_response.get('response', '')
-        if 'recipient:' in response_text.lower():
-            try:
-                recipient = response_text.split('recipient:')[1].split()[0]
-                params['recipient'] = recipient
-            except:
-                pass
-                
-        return params
-    
-    def _calculate_confidence(self, llm_response):
-        """Calculate confidence score for the analysis"""
-        # Basic confidence calculation
-        if llm_response and 'response' in llm_response:
-            # If we got a non-empty response, consider it relatively confident
-            return 0.8 if len(llm_response['response'].strip()) > 0 else 0.0
-        return 0.0
-
     def improve_writing(self, text):
         """Improve the writing of a given text"""
         try:
             prompt = f"Please improve the following text while maintaining its meaning:\n\n{text}"
-            
-            response = requests.post(
-                self.ollama_url,
-                json={
-                    "model": "llama2",
-                    "prompt": prompt,
-                    "stream": False
-                }
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', text)  # Return original text if no improvement
-            else:
-                logger.error(f"Error improving writing: {response.status_code}")
-                return text
+            return self.router.generate(prompt) or text  # Return original text if no improvement
                 
         except Exception as e:
             logger.error(f"Error in improve_writing: {str(e)}")
-            return text
\ No newline at end of file
+            return text
+
+    def stream_completion(self, prompt):
+        """Yield tokens for a prompt from the fastest available backend"""
+        yield from self.router.stream(prompt)
+
+    def stream_improve_writing(self, text):
+        """Streaming variant of improve_writing that yields tokens as they arrive"""
+        prompt = f"Please improve the following text while maintaining its meaning:\n\n{text}"
+        produced = False
+        try:
+            for token in self.stream_completion(prompt):
+                produced = True
+                yield token
+        except Exception as e:
+            logger.error(f"Error in stream_improve_writing: {str(e)}")
+            if not produced:
+                yield text  # Return original text if no improvement
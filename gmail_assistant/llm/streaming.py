@@ -0,0 +1,144 @@
+"""Helpers for consuming streamed LLM output."""
+
+import json
+import queue
+import re
+import threading
+
+# A sentence ends at terminal punctuation (plus closing quotes/brackets)
+# followed by whitespace, or at a line break.
+SENTENCE_END = re.compile(r'[.!?;:]["\')\]]*\s+|\n+')
+
+
+def iter_ndjson_tokens(response):
+    """Yield response tokens from an Ollama NDJSON stream.
+
+    Args:
+        response: A ``requests`` response opened with ``stream=True``.
+    """
+    try:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise RuntimeError(f"Ollama stream error: {chunk['error']}")
+            if chunk.get("response"):
+                yield chunk["response"]
+            if chunk.get("done"):
+                break
+    finally:
+        response.close()
+
+
+def iter_sentences(tokens, min_length=20, max_length=200):
+    """Group a token stream into sentence-sized pieces for speech.
+
+    Pieces shorter than ``min_length`` are merged with what follows so TTS
+    is not fed single words, and run-on text is cut at a word boundary once
+    it exceeds ``max_length``.
+    """
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        while True:
+            end = _split_point(buffer, min_length, max_length)
+            if end is None:
+                break
+            piece, buffer = buffer[:end].strip(), buffer[end:]
+            if piece:
+                yield piece
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def speak_stream(tokens, speak, on_text=None, stop=None):
+    """Speak a token stream sentence by sentence as it is generated.
+
+    Args:
+        tokens: Iterable of text tokens, e.g. from an LLM stream.
+        speak: ``(text) -> None`` that speaks one sentence.
+        on_text: Optional callback that receives each sentence before
+            it is spoken.
+        stop: Optional threading.Event that, once set, stops speaking and
+            closes the stream, e.g. when the user barges in.
+
+    Returns:
+        The text that was spoken.
+    """
+    sentences = []
+    background = iter_in_background(tokens, stop=stop)
+    try:
+        for sentence in iter_sentences(background):
+            if stop is not None and stop.is_set():
+                break
+            if on_text:
+                on_text(sentence)
+            speak(sentence)
+            sentences.append(sentence)
+    finally:
+        background.close()
+    return " ".join(sentences)
+
+
+def _split_point(buffer, min_length, max_length):
+    for match in SENTENCE_END.finditer(buffer):
+        if match.end() >= min_length:
+            return match.end()
+    if len(buffer) > max_length:
+        space = buffer.rfind(" ", 0, max_length)
+        return space + 1 if space > 0 else max_length
+    return None
+
+
+def iter_in_background(iterable, maxsize=0, stop=None):
+    """Consume ``iterable`` on a worker thread and yield its items.
+
+    Keeps generation running while the caller is busy with each item, for
+    example while a sentence is being spoken. Once ``stop`` is set, or the
+    caller closes this generator, the worker stops at the next item and
+    closes ``iterable``, so an abandoned LLM stream stops generating.
+    """
+    items = queue.Queue(maxsize)
+    done = object()
+    finished = threading.Event()
+
+    def stopped():
+        return finished.is_set() or (stop is not None and stop.is_set())
+
+    def put(entry):
+        # Give up once the caller is gone, rather than block on a full queue
+        while not finished.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        iterator = None
+        try:
+            iterator = iter(iterable)
+            for item in iterator:
+                if stopped():
+                    break
+                put((item, None))
+        except Exception as e:
+            put((None, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        put((done, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done or (stop is not None and stop.is_set()):
+                return
+            yield item
+    finally:
+        finished.set()
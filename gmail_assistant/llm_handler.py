@@ -2,16 +2,19 @@
 from openai import OpenAI
 from .utils import handle_errors, logger
 from .config import OPENAI_API_KEY
+from .llm.response_cache import DETERMINISTIC, cache_key, get_cache
 
 class LLMHandler:
-    def __init__(self):
+    def __init__(self, cache=None, model="gpt-3.5-turbo"):
         self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.cache = cache or get_cache()
+        self.model = model
 
     @handle_errors
     def generate_email(self, prompt):
         """Generate email content using GPT"""
         response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=self.model,
             messages=[
                 {"role": "system", "content": "You are an email writing assistant."},
                 {"role": "user", "content": prompt}
@@ -23,8 +26,13 @@ class LLMHandler:
     def summarize_email(self, email_content):
         """Summarize email content"""
         prompt = f"Summarize this email concisely:\n{email_content}"
+        key = cache_key(f"openai:{self.model}", prompt, DETERMINISTIC)
+        return self.cache.get_or_compute(key, lambda: self._complete(prompt))
+
+    def _complete(self, prompt):
         response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}]
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            **DETERMINISTIC
         )
         return response.choices[0].message.content 
\ No newline at end of file
@@ -1,87 +1,69 @@
 """LLM Service for natural language conversation using Llama with Metal acceleration."""
-import os
-from llama_cpp import Llama
 from .error_handler import handle_errors, GmailAssistantError
-import platform
+from .llm_worker import N_CTX, LLMWorkerClient
+from .conversation_memory import ConversationMemory
 import logging
 
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = """You are a helpful email assistant that can help with reading, sending, and managing emails.
+You should provide clear and concise responses and maintain context of the conversation."""
+
+SUMMARY_PROMPT = """Update the summary of a conversation between a user and their email assistant.
+Keep names, email addresses, dates and anything the user asked to be done.
+Reply with the summary only, in at most 120 words."""
+
+EMAIL_SUMMARY_PROMPT = "<s>[INST] Summarize this email concisely:\n{email} [/INST]"
+# Tokens an email summary may take
+EMAIL_SUMMARY_TOKENS = 200
+
 class LLMService:
-    def __init__(self):
+    def __init__(self, client=None):
         try:
-            # Get project root directory (where setup.py is)
-            project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            
-            # Default model path in project's models directory
-            default_model_path = os.path.join(project_root, 'models', 'llama-2-7b-chat.Q4_K_M.gguf')
-            
-            # Use environment variable if set, otherwise use default path
-            model_path = os.getenv('LLAMA_MODEL_PATH', default_model_path)
-            
-            # Create models directory if it doesn't exist
-            os.makedirs(os.path.dirname(model_path), exist_ok=True)
-            
-            if not os.path.exists(model_path):
-                raise GmailAssistantError(
-                    f"Llama model not found at: {model_path}\n"
-                    f"Please download the model using either:\n\n"
-                    f"1. curl (built-in):\n"
-                    f"mkdir -p {os.path.dirname(model_path)}\n"
-                    f"curl -L https://huggingface.co/TheBloke/Llama-2-7B-Chat-GGUF/resolve/main/llama-2-7b-chat.Q4_K_M.gguf "
-                    f"-o {model_path}\n\n"
-                    f"2. wget (requires 'brew install wget'):\n"
-                    f"mkdir -p {os.path.dirname(model_path)}\n"
-                    f"wget https://huggingface.co/TheBloke/Llama-2-7B-Chat-GGUF/resolve/main/llama-2-7b-chat.Q4_K_M.gguf "
-                    f"-O {model_path}"
-                )
-            
-            # Check if running on macOS
-            is_macos = platform.system().lower() == "darwin"
-            
-            # Initialize Llama with Metal acceleration on macOS
-            self.llm = Llama(
-                model_path=model_path,
-                n_ctx=4096,  # Increased context window
-                n_threads=8,  # Reduced thread count when using GPU
-                n_gpu_layers=-1,  # Use all layers on GPU
-                use_mlock=True,  # Keep model in memory
-                use_metal=is_macos,  # Enable Metal on macOS
-                main_gpu=0,  # Use primary GPU
-                tensor_split=None,  # Auto split between CPU/GPU
-                rope_freq_scale=1.0,  # RoPE frequency scaling
-                verbose=True  # Show loading progress
-            )
-            
-            # Test the model
-            logger.info("Testing LLM with a simple prompt...")
-            test_response = self.llm(
-                "Hello, are you working?",
-                max_tokens=20,
-                echo=False
+            # The model lives in a separate worker process that outlives the
+            # app, so only the first launch pays for loading it
+            self.client = client or LLMWorkerClient()
+            self.client.ensure_running()
+            self.client.warm(self._system_prefix())
+            
+            # Recent exchanges within a token budget, older ones summarized
+            self.memory = ConversationMemory(
+                count_tokens=self.client.count_tokens,
+                summarize=self._summarize
             )
-            logger.info(f"LLM test response: {test_response['choices'][0]['text']}")
-            
-            # Store conversation history
-            self.conversation_history = []
             
         except Exception as e:
             raise GmailAssistantError(f"Failed to initialize Llama: {str(e)}")
         
+    @property
+    def conversation_history(self):
+        """Exchanges kept verbatim, as ``{'user', 'assistant'}`` dicts."""
+        return [{'user': turn.user, 'assistant': turn.assistant}
+                for turn in self.memory.turns]
+
+    def _system_prefix(self):
+        """The fixed start of every conversation prompt."""
+        return f"<s>[INST] <<SYS>>\n{SYSTEM_PROMPT}\n"
+
     def _build_prompt(self, user_input):
-        """Build prompt with conversation history."""
-        system_prompt = """You are a helpful email assistant that can help with reading, sending, and managing emails.
-        You should provide clear and concise responses and maintain context of the conversation."""
-        
-        # Build conversation history
-        conversation = f"<s>[INST] <<SYS>>{system_prompt}<</SYS>>\n\n"
+        """Build prompt with conversation history.
+
+        Each turn's prompt extends the previous turn's prompt and response,
+        so the worker only evaluates the tokens of the newest exchange.
+        Only when older exchanges are folded into the summary does the
+        prompt change after the system prefix.
+        """
+        conversation = self._system_prefix()
+        if self.memory.summary:
+            conversation += f"\nSummary of the conversation so far: {self.memory.summary}\n"
+        conversation += "<</SYS>>\n\n"
         
         # Add previous exchanges
-        for exchange in self.conversation_history[-5:]:  # Keep last 5 exchanges for context
-            conversation += f"User: {exchange['user']}\nAssistant: {exchange['assistant']}\n\n"
+        for exchange in self.conversation_history:
+            conversation += f"{exchange['user']} [/INST] {exchange['assistant']} </s><s>[INST] "
             
         # Add current input
-        conversation += f"User: {user_input}\nAssistant:[/INST]"
+        conversation += f"{user_input} [/INST]"
         
         return conversation
         
@@ -93,27 +75,83 @@ class LLMService:
             prompt = self._build_prompt(user_input)
             
             # Generate response
-            response = self.llm(
+            assistant_response = self.client.generate(
                 prompt,
                 max_tokens=512,
                 temperature=0.7,
-                stop=["User:", "[INST]"],
-                echo=False
-            )
-            
-            assistant_response = response['choices'][0]['text'].strip()
+                stop=["</s>", "[INST]"]
+            ).strip()
             
             # Store the exchange in conversation history
-            self.conversation_history.append({
-                'user': user_input,
-                'assistant': assistant_response
-            })
+            self.memory.add(user_input, assistant_response)
             
             return assistant_response
             
         except Exception as e:
             raise GmailAssistantError(f"Llama processing failed: {str(e)}")
             
+    def stream_conversation(self, user_input, context=None):
+        """Yield response tokens as Llama generates them.
+
+        The exchange is added to the conversation history once the stream
+        has been consumed.
+        """
+        prompt = self._build_prompt(user_input)
+        try:
+            tokens = self.client.stream(
+                prompt,
+                max_tokens=512,
+                temperature=0.7,
+                stop=["</s>", "[INST]"]
+            )
+            parts = []
+            for token in tokens:
+                parts.append(token)
+                yield token
+        except Exception as e:
+            raise GmailAssistantError(f"Llama processing failed: {str(e)}")
+
+        self.memory.add(user_input, ''.join(parts).strip())
+
+    def _summarize(self, summary, turns):
+        """Fold exchanges into the running summary."""
+        transcript = "\n".join(
+            f"User: {turn.user}\nAssistant: {turn.assistant}" for turn in turns)
+        prompt = (f"<s>[INST] {SUMMARY_PROMPT}\n\n"
+                  f"Current summary: {summary or 'none'}\n\n"
+                  f"New exchanges:\n{transcript} [/INST]")
+        return self.client.generate(
+            prompt,
+            max_tokens=200,
+            temperature=0.2,
+            stop=["</s>", "[INST]"]
+        ).strip()
+
+    def summarize_email(self, email_content):
+        """Summarize an email without touching the conversation.
+
+        Long emails are cut so the prompt and summary fit the context window.
+        """
+        template_tokens = self.client.count_tokens(EMAIL_SUMMARY_PROMPT.format(email=''))
+        budget = N_CTX - template_tokens - EMAIL_SUMMARY_TOKENS
+        prompt = EMAIL_SUMMARY_PROMPT.format(
+            email=self._clip_to_tokens(email_content, budget))
+        return self.client.generate(
+            prompt,
+            max_tokens=EMAIL_SUMMARY_TOKENS,
+            temperature=0,
+            stop=["</s>", "[INST]"]
+        ).strip()
+
+    def _clip_to_tokens(self, text, budget):
+        """Longest start of ``text`` that is at most ``budget`` tokens."""
+        tokens = self.client.count_tokens(text)
+        while tokens > budget and text:
+            # Cut in proportion, a little more to converge in a few steps
+            text = text[:int(len(text) * budget / tokens * 0.95)]
+            tokens = self.client.count_tokens(text)
+        return text
+
     def clear_conversation(self):
         """Clear conversation history."""
-        self.conversation_history = []
\ No newline at end of file
+        self.memory.clear()
\ No newline at end of file
@@ -0,0 +1,596 @@
+"""Long-lived llama.cpp inference worker reached over a local connection.
+
+The worker loads the model once and keeps it resident between app
+sessions: the app starts it on demand and leaves it running, so the next
+launch connects to the warm model instead of loading 4 GB again. Requests
+from any number of connections are queued and generated one at a time on
+the worker's inference thread.
+
+Clients connect with ``multiprocessing.connection`` on a localhost TCP
+port, which works on every platform, and both ends prove they know the
+key in ``KEY_PATH`` before anything is sent. Messages are dicts. A client
+sends ``{"type": "generate", "prompt": ..., "options": {...}}`` and
+receives ``{"token": ...}`` messages followed by ``{"done": True}`` or
+``{"error": ...}``. ``{"type": "warm", "prompt": ...}`` evaluates a
+prompt prefix ahead of time and answers ``{"done": True}``.
+``{"type": "tokenize", "prompt": ...}`` is answered with
+``{"count": n}``, the prompt's length in model tokens.
+``{"type": "ping"}`` is answered with ``{"ok": True}``. Closing the
+connection cancels the request.
+
+Prompt evaluation is incremental: llama.cpp skips the tokens a new prompt
+shares with what is already in its KV cache, a RAM cache keeps the states
+of recent prompts for when conversations interleave, and warmed prefixes
+(the system prompt) are saved to disk and restored when a worker starts.
+
+Run it directly with ``python -m gmail_assistant.llm_worker``. A frozen
+app cannot start it that way, since its executable is the app itself, so
+there the worker is served from a thread of the app instead.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import platform
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Client, Listener
+from pathlib import Path
+
+from .error_handler import GmailAssistantError
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = Path.home() / ".gmail_assistant"
+ADDRESS = ("127.0.0.1", int(os.getenv("LLM_WORKER_PORT", "47615")))
+# Shared secret clients and the worker authenticate each other with
+KEY_PATH = STATE_DIR / "llm_worker.key"
+LOG_PATH = STATE_DIR / "llm_worker.log"
+PREFIX_STATE_DIR = STATE_DIR / "llm_prefix_states"
+
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "models",
+    "llama-2-7b-chat.Q4_K_M.gguf",
+)
+MODEL_URL = (
+    "https://huggingface.co/TheBloke/Llama-2-7B-Chat-GGUF/resolve/main/"
+    "llama-2-7b-chat.Q4_K_M.gguf"
+)
+MODEL_PATH = os.getenv("LLAMA_MODEL_PATH", DEFAULT_MODEL_PATH)
+N_THREADS = int(os.getenv("LLAMA_THREADS", "8"))
+N_CTX = int(os.getenv("LLAMA_CTX", "4096"))
+# Identifies the loaded model, e.g. for saved states and cached responses
+MODEL_ID = f"{MODEL_PATH}:{N_CTX}"
+# Memory for KV states of recent prompts
+CACHE_MB = int(os.getenv("LLAMA_CACHE_MB", "1024"))
+
+# The worker exits after this many idle seconds (0 keeps it running)
+IDLE_TIMEOUT = float(os.getenv("LLM_WORKER_IDLE_TIMEOUT", "3600"))
+
+# Loading a 7B model from a cold disk cache can take a while
+START_TIMEOUT = 180
+
+# Generation options a client may set; json_schema constrains the output
+# to JSON matching the schema with a llama.cpp grammar
+OPTIONS = ("max_tokens", "temperature", "top_p", "stop", "json_schema")
+
+
+class _Request:
+    def __init__(self, prompt, options, kind="generate"):
+        self.kind = kind
+        self.prompt = prompt
+        self.options = {key: value for key, value in options.items() if key in OPTIONS}
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+
+
+def load_authkey(path=None):
+    """Return the worker key, creating it readable by this user only."""
+    path = Path(path or KEY_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return path.read_bytes()
+    key = secrets.token_bytes(32)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+class LLMWorker:
+    """Serve a loaded model to clients connecting on a localhost port.
+
+    Args:
+        llm: A ``llama_cpp.Llama`` instance, or any callable with the same
+            streaming interface.
+        address: ``(host, port)`` to listen on; port 0 picks a free one,
+            which ``address`` holds once the worker is listening.
+        authkey: Key clients must know, by default from ``KEY_PATH``.
+        idle_timeout: Seconds without requests before shutting down; 0
+            disables the timeout.
+        state_dir: Directory for saved prefix states, or None to keep
+            them in memory only.
+        model_id: Identifies the model and context size; saved states are
+            kept in a directory per model id, so states of another model
+            are never loaded.
+        grammar_factory: ``(schema json) -> grammar`` for ``json_schema``
+            requests; defaults to ``LlamaGrammar.from_json_schema``.
+    """
+
+    def __init__(
+        self,
+        llm,
+        address=ADDRESS,
+        authkey=None,
+        idle_timeout=IDLE_TIMEOUT,
+        state_dir=PREFIX_STATE_DIR,
+        model_id="",
+        grammar_factory=None,
+    ):
+        self.llm = llm
+        self.grammar_factory = grammar_factory or json_schema_grammar
+        self._grammars = {}
+        self.address = tuple(address)
+        self.authkey = authkey
+        self.idle_timeout = idle_timeout
+        self.state_dir = Path(state_dir) if state_dir else None
+        self.model_id = model_id
+        self.requests = queue.Queue()
+        self.listener = None
+        self.listening = threading.Event()
+        self._stopping = False
+        self._active = 0
+        self._last_activity = time.monotonic()
+        self._lock = threading.Lock()
+
+    def serve_forever(self):
+        """Listen until shut down or idle for ``idle_timeout`` seconds."""
+        if self.authkey is None:
+            self.authkey = load_authkey()
+        self.listener = Listener(self.address, authkey=self.authkey)
+        self.address = self.listener.address
+        threading.Thread(
+            target=self._inference_loop, name="LLMInference", daemon=True
+        ).start()
+        if self.idle_timeout:
+            threading.Thread(
+                target=self._idle_watchdog, name="LLMIdle", daemon=True
+            ).start()
+        logger.info(f"LLM worker listening on {self.address[0]}:{self.address[1]}")
+        self.listening.set()
+        try:
+            while not self._stopping:
+                try:
+                    conn = self.listener.accept()
+                except (AuthenticationError, EOFError, OSError) as e:
+                    if not self._stopping:
+                        logger.warning(f"Rejected LLM worker connection: {str(e)}")
+                    continue
+                if self._stopping:
+                    conn.close()
+                    break
+                threading.Thread(
+                    target=self._serve_connection,
+                    args=(conn,),
+                    name="LLMConnection",
+                    daemon=True,
+                ).start()
+        finally:
+            self.listener.close()
+
+    def shutdown(self):
+        """Stop serving; safe to call from any thread."""
+        if self.listener is None or self._stopping:
+            return
+        self._stopping = True
+        # accept() only returns for a connection, so make one
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except (AuthenticationError, OSError):
+            pass
+
+    def submit(self, prompt, options, kind="generate"):
+        """Queue a generation or warm-up request and return it."""
+        request = _Request(prompt, options, kind)
+        with self._lock:
+            self._active += 1
+        self.requests.put(request)
+        return request
+
+    def finished(self, request):
+        """Record that a client is done with a request."""
+        request.cancelled.set()
+        with self._lock:
+            self._active -= 1
+            self._last_activity = time.monotonic()
+
+    def _inference_loop(self):
+        # llama.cpp contexts are not thread-safe, so every request is
+        # generated here, one at a time, in arrival order.
+        self._restore_latest_prefix()
+        while True:
+            request = self.requests.get()
+            if request.cancelled.is_set():
+                continue
+            try:
+                if request.kind == "warm":
+                    self.warm(request.prompt)
+                    request.events.put(("done", None))
+                    continue
+                options = dict(request.options)
+                schema = options.pop("json_schema", None)
+                if schema is not None:
+                    options["grammar"] = self._grammar(schema)
+                chunks = self.llm(request.prompt, stream=True, echo=False, **options)
+                for chunk in chunks:
+                    if request.cancelled.is_set():
+                        break
+                    request.events.put(("token", chunk["choices"][0]["text"]))
+                request.events.put(("done", None))
+            except Exception as e:
+                logger.error(f"Generation failed: {str(e)}")
+                request.events.put(("error", str(e)))
+
+    def _grammar(self, schema):
+        # Compiling a grammar takes milliseconds; the same schemas repeat
+        key = json.dumps(schema, sort_keys=True)
+        if key not in self._grammars:
+            self._grammars[key] = self.grammar_factory(key)
+        return self._grammars[key]
+
+    def warm(self, prefix):
+        """Bring the KV cache to the state after ``prefix``.
+
+        The state is loaded from disk if this prefix was warmed before, and
+        evaluated and saved otherwise. Prompts that start with the prefix
+        then only evaluate their remaining tokens.
+        """
+        tokens = self.llm.tokenize(prefix.encode())
+        path = self._state_path(prefix)
+        state = None
+        if path is not None and path.exists():
+            try:
+                with open(path, "rb") as f:
+                    state = pickle.load(f)
+                self.llm.load_state(state)
+                logger.info(f"Restored prompt prefix state from {path}")
+            except Exception as e:
+                logger.warning(f"Could not restore {path}: {str(e)}")
+                state = None
+        if state is None:
+            self.llm.reset()
+            self.llm.eval(tokens)
+            state = self.llm.save_state()
+            if path is not None:
+                self._save_state(path, state)
+        if getattr(self.llm, "cache", None) is not None:
+            self.llm.cache[tokens] = state
+
+    def _model_state_dir(self):
+        if self.state_dir is None:
+            return None
+        return self.state_dir / hashlib.sha1(self.model_id.encode()).hexdigest()[:16]
+
+    def _state_path(self, prefix):
+        directory = self._model_state_dir()
+        if directory is None:
+            return None
+        return directory / f"{hashlib.sha1(prefix.encode()).hexdigest()}.state"
+
+    def _save_state(self, path, state):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            partial = path.with_suffix(".tmp")
+            with open(partial, "wb") as f:
+                pickle.dump(state, f)
+            os.replace(partial, path)
+        except OSError as e:
+            logger.warning(f"Could not save prompt prefix state: {str(e)}")
+
+    def _restore_latest_prefix(self):
+        # Start from the most recently warmed prefix, normally the system
+        # prompt, so the first request after a restart is already warm.
+        # Loading a state file is much faster than evaluating its prompt.
+        directory = self._model_state_dir()
+        if directory is None or not directory.is_dir():
+            return
+        states = sorted(directory.glob("*.state"), key=lambda p: p.stat().st_mtime)
+        if not states:
+            return
+        try:
+            with open(states[-1], "rb") as f:
+                state = pickle.load(f)
+            self.llm.load_state(state)
+            logger.info(f"Restored prompt prefix state from {states[-1]}")
+        except Exception as e:
+            logger.warning(f"Could not restore {states[-1]}: {str(e)}")
+
+    def _idle_watchdog(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 30))
+            with self._lock:
+                idle = (
+                    not self._active
+                    and time.monotonic() - self._last_activity > self.idle_timeout
+                )
+            if idle:
+                logger.info("LLM worker idle, shutting down")
+                self.shutdown()
+                return
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if message.get("type") == "ping":
+                    conn.send({"ok": True})
+                    continue
+                if message.get("type") == "tokenize":
+                    # The tokenizer only reads the vocabulary, so it need not
+                    # wait behind generations in the inference queue
+                    tokens = self.llm.tokenize(
+                        message["prompt"].encode(), add_bos=False
+                    )
+                    conn.send({"count": len(tokens)})
+                    continue
+                request = self.submit(
+                    message["prompt"],
+                    message.get("options", {}),
+                    kind=message.get("type", "generate"),
+                )
+                try:
+                    self._relay(conn, request)
+                except OSError:
+                    logger.info("Client disconnected, cancelling generation")
+                    return
+                finally:
+                    self.finished(request)
+
+    @staticmethod
+    def _relay(conn, request):
+        while True:
+            kind, value = request.events.get()
+            if kind == "token":
+                conn.send({"token": value})
+            elif kind == "done":
+                conn.send({"done": True})
+                return
+            else:
+                conn.send({"error": value})
+                return
+
+
+class LLMWorkerClient:
+    """Talk to the worker, starting it first if it is not running.
+
+    Args:
+        address: The worker's ``(host, port)``.
+        authkey: The worker's key, by default from ``KEY_PATH``.
+        start_timeout: Seconds to wait for a newly started worker to load
+            its model.
+    """
+
+    def __init__(self, address=ADDRESS, authkey=None, start_timeout=START_TIMEOUT):
+        self.address = tuple(address)
+        self._authkey = authkey
+        self.start_timeout = start_timeout
+        self._thread = None
+        self._thread_error = None
+
+    @property
+    def authkey(self):
+        if self._authkey is None:
+            self._authkey = load_authkey()
+        return self._authkey
+
+    def ping(self):
+        """True if a worker is answering at the address."""
+        try:
+            with self._connect() as conn:
+                conn.send({"type": "ping"})
+                if not conn.poll(2):
+                    return False
+                return conn.recv().get("ok", False)
+        except (AuthenticationError, EOFError, OSError):
+            return False
+
+    def ensure_running(self):
+        """Connect to the worker, or start one and wait for its model.
+
+        Raises:
+            GmailAssistantError: If the worker exits or does not come up
+                within ``start_timeout`` seconds.
+        """
+        if self.ping():
+            return
+        if getattr(sys, "frozen", False):
+            process = None
+            self._start_in_process()
+        else:
+            process = self._start_process()
+        deadline = time.monotonic() + self.start_timeout
+        while time.monotonic() < deadline:
+            failure = self._startup_failure(process)
+            if failure:
+                raise GmailAssistantError(failure)
+            if self.ping():
+                logger.info("LLM worker ready")
+                return
+            time.sleep(0.5)
+        raise GmailAssistantError(
+            f"LLM worker did not start within {self.start_timeout} seconds"
+        )
+
+    def _startup_failure(self, process):
+        if process is not None:
+            if process.poll() is not None:
+                return f"LLM worker exited during startup:\n{_log_tail()}"
+        elif not self._thread.is_alive():
+            return f"LLM worker failed to start: {self._thread_error}"
+        return None
+
+    def _start_process(self):
+        logger.info("Starting LLM worker process...")
+        LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(LOG_PATH, "ab") as log:
+            # A new session keeps the worker alive after the app exits
+            return subprocess.Popen(
+                [sys.executable, "-m", "gmail_assistant.llm_worker"],
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                env=dict(os.environ, LLM_WORKER_PORT=str(self.address[1])),
+                start_new_session=True,
+            )
+
+    def _start_in_process(self):
+        # sys.executable of a frozen app is the app, not Python, so the
+        # worker cannot be spawned; it is served from a thread instead and
+        # lives as long as the app
+        logger.info("Starting LLM worker in the app process...")
+
+        def serve():
+            try:
+                LLMWorker(
+                    load_model(),
+                    address=self.address,
+                    authkey=self.authkey,
+                    idle_timeout=0,
+                    model_id=MODEL_ID,
+                ).serve_forever()
+            except Exception as e:
+                logger.error(f"LLM worker failed: {str(e)}")
+                self._thread_error = e
+
+        self._thread = threading.Thread(target=serve, name="LLMWorker", daemon=True)
+        self._thread.start()
+
+    def stream(self, prompt, **options):
+        """Yield generated tokens as the worker produces them.
+
+        Closing the generator early cancels the generation in the worker.
+        """
+        with self._connect() as conn:
+            conn.send({"type": "generate", "prompt": prompt, "options": options})
+            while True:
+                message = self._receive(conn)
+                if "token" in message:
+                    yield message["token"]
+                elif message.get("done"):
+                    return
+                else:
+                    raise GmailAssistantError(
+                        f"LLM worker error: {message.get('error')}"
+                    )
+
+    def generate(self, prompt, **options):
+        """Return the complete generated text."""
+        return "".join(self.stream(prompt, **options))
+
+    def warm(self, prefix):
+        """Have the worker evaluate, or restore, a prompt prefix now."""
+        with self._connect() as conn:
+            conn.send({"type": "warm", "prompt": prefix})
+            message = self._receive(conn)
+        if not message.get("done"):
+            raise GmailAssistantError(f"LLM worker error: {message.get('error')}")
+
+    def count_tokens(self, text):
+        """Number of model tokens in ``text``."""
+        with self._connect() as conn:
+            conn.send({"type": "tokenize", "prompt": text})
+            message = self._receive(conn)
+        if "count" not in message:
+            raise GmailAssistantError("LLM worker closed the connection")
+        return message["count"]
+
+    def _connect(self):
+        return Client(self.address, authkey=self.authkey)
+
+    @staticmethod
+    def _receive(conn):
+        try:
+            return conn.recv()
+        except (EOFError, OSError):
+            raise GmailAssistantError("LLM worker closed the connection")
+
+
+def _log_tail(lines=20):
+    try:
+        with open(LOG_PATH, errors="replace") as f:
+            return "".join(f.readlines()[-lines:])
+    except OSError:
+        return ""
+
+
+def json_schema_grammar(schema):
+    """Compile a JSON schema into a llama.cpp grammar."""
+    from llama_cpp import LlamaGrammar
+
+    return LlamaGrammar.from_json_schema(schema, verbose=False)
+
+
+def load_model(
+    model_path=MODEL_PATH, n_threads=N_THREADS, n_ctx=N_CTX, cache_mb=CACHE_MB
+):
+    """Load the GGUF model with llama.cpp."""
+    if not os.path.exists(model_path):
+        raise GmailAssistantError(
+            f"Llama model not found at: {model_path}\n"
+            f"Please download the model using either:\n\n"
+            f"1. curl (built-in):\n"
+            f"mkdir -p {os.path.dirname(model_path)}\n"
+            f"curl -L {MODEL_URL} "
+            f"-o {model_path}\n\n"
+            f"2. wget (requires 'brew install wget'):\n"
+            f"mkdir -p {os.path.dirname(model_path)}\n"
+            f"wget {MODEL_URL} "
+            f"-O {model_path}"
+        )
+
+    from llama_cpp import Llama, LlamaRAMCache
+
+    # Check if running on macOS
+    is_macos = platform.system().lower() == "darwin"
+
+    # Initialize Llama with Metal acceleration on macOS
+    llm = Llama(
+        model_path=model_path,
+        n_ctx=n_ctx,
+        n_threads=n_threads,
+        n_gpu_layers=-1,  # Use all layers on GPU
+        use_mlock=True,  # Keep model in memory
+        use_metal=is_macos,  # Enable Metal on macOS
+        main_gpu=0,  # Use primary GPU
+        tensor_split=None,  # Auto split between CPU/GPU
+        rope_freq_scale=1.0,  # RoPE frequency scaling
+        verbose=True,  # Show loading progress
+    )
+    if cache_mb:
+        # Reload the longest cached prefix of each prompt instead of
+        # evaluating it again
+        llm.set_cache(LlamaRAMCache(capacity_bytes=cache_mb << 20))
+    return llm
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s"
+    )
+    logger.info(f"Loading {MODEL_PATH} with {N_THREADS} threads")
+    LLMWorker(load_model(), model_id=MODEL_ID).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Fetch Gmail messages in batches instead of one request per id."""
+
+import logging
+
+from googleapiclient.errors import HttpError
+
+from .error_handler import GmailAssistantError
+from .rate_limiter import get_rate_limiter, is_rate_limited
+
+logger = logging.getLogger(__name__)
+
+# Gmail accepts up to 100 calls per batch but starts rate limiting above 50.
+MAX_BATCH_SIZE = 50
+
+DEFAULT_HEADERS = ("From", "Subject", "Date")
+
+
+class MessageFetcher:
+    """Resolve lists of message ids through Gmail batch HTTP requests.
+
+    Args:
+        gmail_service: Gmail API service.
+        batch_size: Requests per batch, at most MAX_BATCH_SIZE.
+        limiter: RateLimiter whose backoff paces retries of throttled
+            parts, or None for the process-wide one.
+    """
+
+    def __init__(self, gmail_service, batch_size=MAX_BATCH_SIZE, limiter=None):
+        self.gmail_service = gmail_service
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.limiter = limiter or get_rate_limiter()
+
+    def fetch(self, message_ids, fmt="metadata", headers=DEFAULT_HEADERS):
+        """Fetch messages by id, preserving the order of ``message_ids``.
+
+        Args:
+            message_ids: Message ids, or message stubs as returned by
+                ``messages().list()``.
+            fmt: Gmail ``format`` parameter ('metadata', 'full', 'minimal').
+            headers: Headers to request when ``fmt`` is 'metadata'.
+
+        Returns:
+            List of message resources. Messages that failed to load are
+            skipped and logged.
+
+        Raises:
+            HttpError: If Gmail still throttles some messages after the
+                rate limiter's retries, so callers try again later instead
+                of skipping them for good.
+        """
+        ids = [m["id"] if isinstance(m, dict) else m for m in message_ids]
+        if not ids:
+            return []
+
+        results = {}
+        errors = {}
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                errors[request_id] = exception
+            else:
+                results[request_id] = response
+
+        messages = self.gmail_service.users().messages()
+        pending = ids
+        attempt = 0
+        while pending:
+            for start in range(0, len(pending), self.batch_size):
+                batch = self.gmail_service.new_batch_http_request(callback=on_response)
+                for message_id in pending[start : start + self.batch_size]:
+                    batch.add(
+                        self._get_request(messages, message_id, fmt, headers),
+                        request_id=message_id,
+                    )
+                batch.execute()
+
+            # Throttled parts arrive inside a successful batch response
+            throttled = [
+                message_id
+                for message_id, error in errors.items()
+                if is_throttled(error)
+            ]
+            if not throttled:
+                break
+            if not self.limiter.retry_throttled(
+                "messages.get", len(throttled), attempt
+            ):
+                raise errors[throttled[0]]
+            for message_id in throttled:
+                del errors[message_id]
+            pending = throttled
+            attempt += 1
+
+        for message_id, error in errors.items():
+            logger.warning(f"Failed to fetch message {message_id}: {str(error)}")
+
+        if errors and not results:
+            error = next(iter(errors.values()))
+            if isinstance(error, HttpError):
+                raise error
+            raise GmailAssistantError(f"Failed to fetch messages: {str(error)}")
+
+        return [results[message_id] for message_id in ids if message_id in results]
+
+    def fetch_headers(self, message_ids, headers=DEFAULT_HEADERS):
+        """Fetch only the requested headers for each message.
+
+        Returns:
+            List of dicts mapping lower-cased header names to values, with
+            the message id under ``'id'``.
+        """
+        summaries = []
+        for message in self.fetch(message_ids, fmt="metadata", headers=headers):
+            summary = get_headers(message, headers)
+            summary["id"] = message["id"]
+            summaries.append(summary)
+        return summaries
+
+    @staticmethod
+    def _get_request(messages, message_id, fmt, headers):
+        if fmt == "metadata":
+            return messages.get(
+                userId="me", id=message_id, format=fmt, metadataHeaders=list(headers)
+            )
+        return messages.get(userId="me", id=message_id, format=fmt)
+
+
+def is_throttled(error):
+    """True if a batch part failed because of Gmail's rate limits."""
+    return isinstance(error, HttpError) and is_rate_limited(
+        error.resp.status, error.content
+    )
+
+
+def get_headers(message, names=DEFAULT_HEADERS):
+    """Return a dict of lower-cased header name to value for ``names``."""
+    wanted = {name.lower() for name in names}
+    found = {}
+    for header in message.get("payload", {}).get("headers", []):
+        name = header["name"].lower()
+        if name in wanted and name not in found:
+            found[name] = header["value"]
+    return found
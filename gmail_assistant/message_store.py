@@ -0,0 +1,667 @@
+"""Local SQLite store of Gmail message metadata, kept fresh via history sync."""
+
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from googleapiclient.errors import HttpError
+
+from .message_fetcher import MessageFetcher, get_headers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = Path.home() / ".gmail_assistant" / "messages.db"
+
+# Labels that Gmail hides from an unfiltered messages().list() call.
+HIDDEN_LABELS = ("TRASH", "SPAM")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT UNIQUE NOT NULL,
+    thread_id TEXT,
+    subject TEXT,
+    sender TEXT,
+    date TEXT,
+    internal_date INTEGER,
+    snippet TEXT,
+    body_indexed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_messages_internal_date
+    ON messages (internal_date);
+CREATE TABLE IF NOT EXISTS message_labels (
+    label_id TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    PRIMARY KEY (label_id, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_message_labels_message
+    ON message_labels (message_id);
+CREATE TABLE IF NOT EXISTS summaries (
+    message_id TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    subject, sender, date, body,
+    tokenize = 'porter unicode61'
+);
+"""
+
+# bm25 weights for the subject, sender, date and body columns.
+RANK_WEIGHTS = (4.0, 3.0, 0.5, 1.0)
+
+# Above this many hits relevance ranking costs more than it is worth.
+MAX_RANKED_HITS = 5000
+
+
+class MessageStore:
+    """On-disk cache of message headers keyed by message id and label."""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        if db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            if db_path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            columns = {
+                row["name"] for row in self._conn.execute("PRAGMA table_info(messages)")
+            }
+            if "body_indexed" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE messages ADD COLUMN "
+                    "body_indexed INTEGER NOT NULL DEFAULT 0"
+                )
+
+    @property
+    def history_id(self):
+        """Last Gmail historyId the store is known to be consistent with."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM sync_state WHERE key = 'history_id'"
+            ).fetchone()
+        return row["value"] if row else None
+
+    @history_id.setter
+    def history_id(self, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) "
+                "VALUES ('history_id', ?)",
+                (str(value),),
+            )
+
+    def is_ready(self):
+        """Return True once an initial sync has populated the store."""
+        return self.history_id is not None
+
+    def upsert_messages(self, messages):
+        """Insert or update messages fetched with format 'metadata' or 'full'."""
+        with self._lock, self._conn:
+            for message in messages:
+                headers = get_headers(message, ("From", "Subject", "Date"))
+                self._conn.execute(
+                    """
+                    INSERT INTO messages
+                        (id, thread_id, subject, sender, date, internal_date, snippet)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET
+                        thread_id = excluded.thread_id,
+                        subject = excluded.subject,
+                        sender = excluded.sender,
+                        date = excluded.date,
+                        internal_date = excluded.internal_date,
+                        snippet = excluded.snippet
+                    """,
+                    (
+                        message["id"],
+                        message.get("threadId"),
+                        headers.get("subject"),
+                        headers.get("from"),
+                        headers.get("date"),
+                        int(message.get("internalDate", 0)),
+                        message.get("snippet"),
+                    ),
+                )
+                self._set_labels(message["id"], message.get("labelIds", []))
+                self._index_headers(message["id"], headers)
+
+    def delete_messages(self, message_ids):
+        """Remove messages and their labels from the store."""
+        with self._lock, self._conn:
+            for message_id in message_ids:
+                self._conn.execute(
+                    "DELETE FROM messages_fts WHERE rowid = "
+                    "(SELECT rowid FROM messages WHERE id = ?)",
+                    (message_id,),
+                )
+                self._conn.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+                self._conn.execute(
+                    "DELETE FROM message_labels WHERE message_id = ?", (message_id,)
+                )
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE message_id = ?", (message_id,)
+                )
+
+    def add_labels(self, message_id, label_ids):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO message_labels (label_id, message_id) "
+                "VALUES (?, ?)",
+                [(label_id, message_id) for label_id in label_ids],
+            )
+            self._update_visibility(message_id)
+
+    def remove_labels(self, message_id, label_ids):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM message_labels WHERE label_id = ? AND message_id = ?",
+                [(label_id, message_id) for label_id in label_ids],
+            )
+            self._update_visibility(message_id)
+
+    def modify_labels(self, message_ids, add=(), remove=()):
+        """Add and remove labels on many messages in one transaction."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO message_labels (label_id, message_id) "
+                "VALUES (?, ?)",
+                [
+                    (label_id, message_id)
+                    for message_id in message_ids
+                    for label_id in add
+                ],
+            )
+            self._conn.executemany(
+                "DELETE FROM message_labels WHERE label_id = ? AND message_id = ?",
+                [
+                    (label_id, message_id)
+                    for message_id in message_ids
+                    for label_id in remove
+                ],
+            )
+            for message_id in message_ids:
+                self._update_visibility(message_id)
+
+    def has_message(self, message_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM messages WHERE id = ?", (message_id,)
+            ).fetchone()
+        return row is not None
+
+    def list_messages(self, label_id=None, limit=5):
+        """Return the newest messages, optionally restricted to one label.
+
+        Like ``messages().list()``, this leaves out trash and spam unless
+        they are the label asked for.
+
+        Returns:
+            List of dicts with id, subject, from, date and snippet keys.
+        """
+        visible, params = self._visible_clause(label_id)
+        if label_id is None:
+            query = f"""
+                SELECT m.* FROM messages m
+                WHERE {visible}
+                ORDER BY m.internal_date DESC LIMIT ?
+            """
+        else:
+            query = f"""
+                SELECT m.* FROM message_labels l
+                JOIN messages m ON m.id = l.message_id
+                WHERE l.label_id = ? AND {visible}
+                ORDER BY m.internal_date DESC LIMIT ?
+            """
+            params = (label_id, *params)
+        with self._lock:
+            rows = self._conn.execute(query, (*params, limit)).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _visible_clause(label_id=None):
+        """SQL condition on ``m`` leaving out hidden labels other than ``label_id``."""
+        hidden = tuple(label for label in HIDDEN_LABELS if label != label_id)
+        clause = f"""NOT EXISTS (
+                    SELECT 1 FROM message_labels h
+                    WHERE h.message_id = m.id
+                    AND h.label_id IN ({",".join("?" * len(hidden))}))"""
+        return clause, hidden
+
+    def oldest_date(self):
+        """Return when the oldest cached message was received, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(internal_date) FROM messages"
+            ).fetchone()
+        if row[0] is None:
+            return None
+        return datetime.fromtimestamp(row[0] / 1000)
+
+    def count_messages(self, label_id):
+        visible, params = self._visible_clause(label_id)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM message_labels l "
+                "JOIN messages m ON m.id = l.message_id "
+                f"WHERE l.label_id = ? AND {visible}",
+                (label_id, *params),
+            ).fetchone()
+        return row[0]
+
+    def index_body(self, message_id, body):
+        """Add the decoded body of a cached message to the search index."""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT rowid FROM messages WHERE id = ?", (message_id,)
+            ).fetchone()
+            if row is None:
+                return
+            self._conn.execute(
+                "UPDATE messages_fts SET body = ? WHERE rowid = ?", (body, row[0])
+            )
+            self._conn.execute(
+                "UPDATE messages SET body_indexed = 1 WHERE rowid = ?", (row[0],)
+            )
+
+    def unindexed_ids(self, limit=50):
+        """Return ids of cached messages whose bodies are not indexed yet."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM messages WHERE body_indexed = 0 "
+                "ORDER BY internal_date DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def get_body(self, message_id):
+        """Return the indexed body of a cached message, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT f.body FROM messages m "
+                "JOIN messages_fts f ON f.rowid = m.rowid "
+                "WHERE m.id = ? AND m.body_indexed = 1",
+                (message_id,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_summary(self, message_id, content_hash):
+        """Return the stored summary of a message body, or None.
+
+        A summary made from a body with a different hash is not returned.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary FROM summaries "
+                "WHERE message_id = ? AND content_hash = ?",
+                (message_id, content_hash),
+            ).fetchone()
+        return row["summary"] if row else None
+
+    def save_summary(self, message_id, content_hash, summary):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (message_id, content_hash, summary) "
+                "VALUES (?, ?, ?)",
+                (message_id, content_hash, summary),
+            )
+
+    def unsummarized_ids(self, label_id="UNREAD", limit=5):
+        """Return ids of messages with a label and an indexed body but no summary."""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT m.id FROM message_labels l
+                JOIN messages m ON m.id = l.message_id
+                JOIN messages_fts f ON f.rowid = m.rowid
+                WHERE l.label_id = ? AND m.body_indexed = 1 AND f.body != ''
+                    AND NOT EXISTS (SELECT 1 FROM summaries s WHERE s.message_id = m.id)
+                ORDER BY m.internal_date DESC LIMIT ?
+                """,
+                (label_id, limit),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def search(
+        self, terms=(), sender=None, subject=None, after=None, limit=5, offset=0
+    ):
+        """Full-text search over cached subjects, senders, dates and bodies.
+
+        Args:
+            terms: Words that must appear in any indexed column.
+            sender: Word that must appear in the From header.
+            subject: Word that must appear in the subject.
+            after: Only return messages received on or after this datetime.
+            limit: Page size.
+            offset: Number of ranked results to skip.
+
+        Returns:
+            Tuple of (page of message summaries best match first, total hits).
+        """
+        match = build_match_query(terms, sender=sender, subject=subject)
+        if not match:
+            return [], 0
+
+        source = "messages_fts JOIN messages m ON m.rowid = messages_fts.rowid"
+        where = "messages_fts MATCH ?"
+        params = [match]
+        if after is not None:
+            where += " AND m.internal_date >= ?"
+            params.append(int(after.timestamp() * 1000))
+
+        with self._lock:
+            total = self._conn.execute(
+                f"SELECT COUNT(*) FROM {source} WHERE {where}", params
+            ).fetchone()[0]
+            # bm25 scores every hit, so very broad queries list newest first.
+            if total <= MAX_RANKED_HITS:
+                weights = ", ".join(str(weight) for weight in RANK_WEIGHTS)
+                order = f"bm25(messages_fts, {weights})"
+            else:
+                order = "m.internal_date DESC"
+            rowids = [
+                row[0]
+                for row in self._conn.execute(
+                    f"SELECT messages_fts.rowid FROM {source} WHERE {where} "
+                    f"ORDER BY {order} LIMIT ? OFFSET ?",
+                    [*params, limit, offset],
+                )
+            ]
+            placeholders = ",".join("?" * len(rowids))
+            rows = self._conn.execute(
+                f"SELECT * FROM messages WHERE rowid IN ({placeholders})",
+                rowids,
+            ).fetchall()
+        by_rowid = {row["rowid"]: row for row in rows}
+        return [self._row_to_dict(by_rowid[rowid]) for rowid in rowids], total
+
+    def clear(self):
+        """Drop all cached messages and the sync checkpoint."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages_fts")
+            self._conn.execute("DELETE FROM messages")
+            self._conn.execute("DELETE FROM message_labels")
+            self._conn.execute("DELETE FROM summaries")
+            self._conn.execute("DELETE FROM sync_state")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _set_labels(self, message_id, label_ids):
+        self._conn.execute(
+            "DELETE FROM message_labels WHERE message_id = ?", (message_id,)
+        )
+        self._conn.executemany(
+            "INSERT INTO message_labels (label_id, message_id) VALUES (?, ?)",
+            [(label_id, message_id) for label_id in label_ids],
+        )
+
+    def _index_headers(self, message_id, headers):
+        rowid = self._conn.execute(
+            "SELECT rowid FROM messages WHERE id = ?", (message_id,)
+        ).fetchone()[0]
+        # Keep an already indexed body when only the headers changed.
+        existing = self._conn.execute(
+            "SELECT body FROM messages_fts WHERE rowid = ?", (rowid,)
+        ).fetchone()
+        self._conn.execute("DELETE FROM messages_fts WHERE rowid = ?", (rowid,))
+        self._conn.execute(
+            "INSERT INTO messages_fts (rowid, subject, sender, date, body) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                rowid,
+                headers.get("subject"),
+                headers.get("from"),
+                headers.get("date"),
+                existing[0] if existing else None,
+            ),
+        )
+        self._update_visibility(message_id)
+
+    def _update_visibility(self, message_id):
+        """Keep trash and spam out of the search index."""
+        row = self._conn.execute(
+            "SELECT rowid, subject, sender, date FROM messages WHERE id = ?",
+            (message_id,),
+        ).fetchone()
+        if row is None:
+            return
+        hidden = (
+            self._conn.execute(
+                f"SELECT 1 FROM message_labels WHERE message_id = ? "
+                f"AND label_id IN ({','.join('?' * len(HIDDEN_LABELS))})",
+                (message_id, *HIDDEN_LABELS),
+            ).fetchone()
+            is not None
+        )
+        indexed = (
+            self._conn.execute(
+                "SELECT 1 FROM messages_fts WHERE rowid = ?", (row["rowid"],)
+            ).fetchone()
+            is not None
+        )
+        if hidden and indexed:
+            self._conn.execute(
+                "DELETE FROM messages_fts WHERE rowid = ?", (row["rowid"],)
+            )
+            # Nothing to index until the message is restored.
+            self._conn.execute(
+                "UPDATE messages SET body_indexed = 1 WHERE rowid = ?", (row["rowid"],)
+            )
+        elif not hidden and not indexed:
+            self._conn.execute(
+                "INSERT INTO messages_fts (rowid, subject, sender, date) "
+                "VALUES (?, ?, ?, ?)",
+                (row["rowid"], row["subject"], row["sender"], row["date"]),
+            )
+            self._conn.execute(
+                "UPDATE messages SET body_indexed = 0 WHERE rowid = ?", (row["rowid"],)
+            )
+
+    @staticmethod
+    def _row_to_dict(row):
+        # Leave out missing headers so callers can apply their own defaults.
+        fields = {
+            "subject": row["subject"],
+            "from": row["sender"],
+            "date": row["date"],
+            "snippet": row["snippet"],
+        }
+        summary = {key: value for key, value in fields.items() if value is not None}
+        summary["id"] = row["id"]
+        return summary
+
+
+class MessageSync:
+    """Keep a MessageStore in step with Gmail using users.history.list."""
+
+    HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+
+    def __init__(self, gmail_service, store, max_messages=500, body_decoder=None):
+        self.gmail_service = gmail_service
+        self.store = store
+        self.max_messages = max_messages
+        self.body_decoder = body_decoder
+        self.fetcher = MessageFetcher(gmail_service)
+        self._sync_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def sync(self):
+        """Bring the store up to date, bootstrapping it on first use."""
+        with self._sync_lock:
+            if not self.store.is_ready():
+                self._full_sync()
+                return
+            self._incremental_sync()
+
+    def index_bodies(self, max_messages=500):
+        """Fetch and index bodies of cached messages that lack one.
+
+        Returns:
+            Number of message bodies indexed.
+        """
+        if self.body_decoder is None:
+            return 0
+        indexed = 0
+        while indexed < max_messages and not self._stop_event.is_set():
+            ids = self.store.unindexed_ids(limit=self.fetcher.batch_size)
+            if not ids:
+                break
+            fetched = {m["id"]: m for m in self.fetcher.fetch(ids, fmt="full")}
+            for message_id in ids:
+                message = fetched.get(message_id)
+                # Unfetchable messages get an empty body so they are not retried.
+                body = self.body_decoder(message) if message else ""
+                self.store.index_body(message_id, body)
+            indexed += len(ids)
+        return indexed
+
+    def start(self, interval=30):
+        """Run sync() now and then every ``interval`` seconds in the background."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="MessageSync", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self, interval):
+        while not self._stop_event.is_set():
+            try:
+                self.sync()
+                self.index_bodies()
+            except Exception as e:
+                logger.warning(f"Message sync failed: {str(e)}")
+            self._stop_event.wait(interval)
+
+    def _full_sync(self):
+        messages = self.gmail_service.users().messages()
+        # Take the checkpoint before listing so changes made meanwhile replay.
+        profile = self.gmail_service.users().getProfile(userId="me").execute()
+        ids = []
+        page_token = None
+        while len(ids) < self.max_messages:
+            results = messages.list(
+                userId="me",
+                maxResults=min(500, self.max_messages - len(ids)),
+                pageToken=page_token,
+            ).execute()
+            ids.extend(m["id"] for m in results.get("messages", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+
+        fetched = self.fetcher.fetch(ids)
+        self.store.clear()
+        self.store.upsert_messages(fetched)
+        self.store.history_id = profile["historyId"]
+        logger.info(f"Full sync stored {len(fetched)} messages")
+
+    def _incremental_sync(self):
+        history = self.gmail_service.users().history()
+        added, deleted = set(), set()
+        label_changes = []
+        history_id = self.store.history_id
+        page_token = None
+        while True:
+            try:
+                results = history.list(
+                    userId="me",
+                    startHistoryId=history_id,
+                    historyTypes=self.HISTORY_TYPES,
+                    pageToken=page_token,
+                ).execute()
+            except HttpError as error:
+                if error.resp.status != 404:
+                    raise
+                # The stored historyId is too old for Gmail to replay.
+                logger.info("History checkpoint expired, running full sync")
+                self._full_sync()
+                return
+            for record in results.get("history", []):
+                for item in record.get("messagesAdded", []):
+                    added.add(item["message"]["id"])
+                    deleted.discard(item["message"]["id"])
+                for item in record.get("messagesDeleted", []):
+                    deleted.add(item["message"]["id"])
+                    added.discard(item["message"]["id"])
+                for item in record.get("labelsAdded", []):
+                    label_changes.append(
+                        (item["message"]["id"], item["labelIds"], True)
+                    )
+                for item in record.get("labelsRemoved", []):
+                    label_changes.append(
+                        (item["message"]["id"], item["labelIds"], False)
+                    )
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                new_history_id = results.get("historyId", history_id)
+                break
+
+        if added:
+            # Messages deleted since they were added fail to load and are
+            # skipped; their deletion arrives with the next history page.
+            self.store.upsert_messages(self.fetcher.fetch(sorted(added)))
+        for message_id, label_ids, is_added in label_changes:
+            if (
+                message_id in added
+                or message_id in deleted
+                or not self.store.has_message(message_id)
+            ):
+                continue
+            if is_added:
+                self.store.add_labels(message_id, label_ids)
+            else:
+                self.store.remove_labels(message_id, label_ids)
+        if deleted:
+            self.store.delete_messages(deleted)
+        self.store.history_id = new_history_id
+
+        if added or deleted or label_changes:
+            logger.info(
+                f"History sync: {len(added)} added, {len(deleted)} deleted, "
+                f"{len(label_changes)} label changes"
+            )
+
+
+def build_match_query(terms=(), sender=None, subject=None):
+    """Build an FTS5 MATCH expression from spoken words.
+
+    Every word is quoted so punctuation and FTS operators in speech are
+    matched literally rather than parsed as query syntax.
+    """
+
+    def quote(word):
+        return '"' + word.replace('"', '""') + '"'
+
+    clauses = [quote(term) for term in terms if term.strip()]
+    if sender:
+        clauses.append(f"sender : {quote(sender)}")
+    if subject:
+        clauses.append(f"subject : {quote(subject)}")
+    return " AND ".join(clauses)
+
+
+def parse_date(value):
+    """Parse a Gmail style date such as 2024/01/31, or return None."""
+    for fmt in ("%Y/%m/%d", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
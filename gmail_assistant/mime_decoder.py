@@ -0,0 +1,192 @@
+"""Extract readable text from Gmail message payloads, decoding only what is used."""
+
+import codecs
+import re
+from base64 import urlsafe_b64decode
+from html.parser import HTMLParser
+
+# Base64 characters decoded per step; a multiple of 4 so steps split cleanly
+CHUNK_CHARS = 8192
+
+CHARSET_PATTERN = re.compile(r'charset\s*=\s*"?([\w.:-]+)', re.IGNORECASE)
+
+
+def iter_leaves(part):
+    """Yield the parts of a payload that are not multipart, in document order."""
+    children = part.get("parts")
+    if children:
+        for child in children:
+            yield from iter_leaves(child)
+    else:
+        yield part
+
+
+def is_attachment(part):
+    body = part.get("body", {})
+    return bool(part.get("filename")) or "attachmentId" in body
+
+
+def text_part(payload):
+    """Return the part to read a message from: the first text/plain part,
+    else the first text/html one, at any depth.
+
+    A single-part message with a body of any other type is read as is.
+    """
+    html = None
+    for part in iter_leaves(payload):
+        if is_attachment(part) or not part.get("body", {}).get("data"):
+            continue
+        mime_type = part.get("mimeType", "").lower()
+        if mime_type == "text/plain":
+            return part
+        if mime_type == "text/html" and html is None:
+            html = part
+    if (
+        html is None
+        and not payload.get("parts")
+        and payload.get("body", {}).get("data")
+    ):
+        return payload
+    return html
+
+
+def charset_of(part):
+    for header in part.get("headers", []):
+        if header["name"].lower() == "content-type":
+            match = CHARSET_PATTERN.search(header["value"])
+            if match:
+                return match.group(1)
+    return "utf-8"
+
+
+def iter_decoded(data, charset="utf-8", chunk_chars=CHUNK_CHARS):
+    """Yield the text of base64url ``data`` a chunk at a time.
+
+    Characters split across chunks are decoded whole, and undecodable
+    bytes are replaced rather than failing the message.
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    chunk_chars -= chunk_chars % 4
+    for start in range(0, len(data), chunk_chars):
+        chunk = data[start : start + chunk_chars]
+        # Gmail sometimes leaves the final padding out
+        chunk += "=" * (-len(chunk) % 4)
+        text = decoder.decode(urlsafe_b64decode(chunk))
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+class HTMLText(HTMLParser):
+    """Collect the visible text of HTML fed to it piece by piece."""
+
+    SKIPPED = {"script", "style", "head", "title"}
+    BLOCKS = {
+        "p",
+        "div",
+        "br",
+        "li",
+        "tr",
+        "table",
+        "ul",
+        "ol",
+        "blockquote",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.length = 0
+        self._pieces = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self._skipping += 1
+        elif tag in self.BLOCKS:
+            self._append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self.BLOCKS:
+            self._append("\n")
+
+    def handle_data(self, data):
+        if self._skipping:
+            return
+        text = " ".join(data.split())
+        if not text:
+            return
+        if self._pieces and not self._pieces[-1].endswith("\n"):
+            text = " " + text
+        self._append(text)
+
+    def _append(self, text):
+        if text == "\n" and (not self._pieces or self._pieces[-1].endswith("\n")):
+            return
+        self._pieces.append(text)
+        self.length += len(text)
+
+    @property
+    def text(self):
+        return "".join(self._pieces).strip()
+
+
+def html_to_text(pieces, limit):
+    """Visible text of HTML arriving in ``pieces``, up to ``limit`` characters."""
+    parser = HTMLText()
+    for piece in pieces:
+        parser.feed(piece)
+        if parser.length >= limit:
+            break
+    else:
+        parser.close()
+    return parser.text[:limit]
+
+
+def take(pieces, limit):
+    """Join text pieces, stopping once ``limit`` characters are collected."""
+    collected = []
+    length = 0
+    for piece in pieces:
+        collected.append(piece)
+        length += len(piece)
+        if limit is not None and length >= limit:
+            break
+    return "".join(collected)[:limit]
+
+
+def extract_text(payload, limit=None):
+    """Return up to ``limit`` characters of a message's text, or None.
+
+    Only as much of the body is decoded as the budget needs, so a huge
+    newsletter costs about the same as a short note. HTML is reduced to
+    its visible text as it is decoded; html2text, which is slower and
+    works on the whole document, only runs without a budget.
+
+    Args:
+        payload: The ``payload`` of a Gmail message in 'full' format.
+        limit: Most characters to return, or None for the whole body.
+    """
+    part = text_part(payload)
+    if part is None:
+        return None
+    pieces = iter_decoded(part["body"]["data"], charset_of(part))
+    if part.get("mimeType", "").lower() != "text/html":
+        return take(pieces, limit)
+    if limit is None:
+        import html2text
+
+        return html2text.html2text("".join(pieces))
+    return html_to_text(pieces, limit)
@@ -0,0 +1,219 @@
+"""Asyncio command pipeline: capture -> recognition -> action -> speech."""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import logger
+
+# Set when the microphone cancels the assistant's own speech, so that
+# listening can go on while it talks
+ECHO_CANCELLED = os.getenv("ECHO_CANCELLED", "") == "1"
+
+
+class CommandPipeline:
+    """Run each stage as its own task, connected by bounded queues.
+
+    Capture of the next utterance overlaps with recognition, handling and
+    speech of the current one. Full queues make upstream stages wait
+    (backpressure), and an utterance captured while a command is still
+    being handled or spoken barges in: stale work is dropped, the running
+    action is cancelled and speech is interrupted.
+
+    Without echo cancellation the microphone would hear the assistant's
+    own speech and barge in on it, so capture then pauses while the speech
+    stage plays, and audio that overlapped speech is discarded.
+
+    Stage callables are blocking and each runs on a dedicated thread so
+    that, for example, the TTS engine is always driven from one thread.
+
+    Args:
+        capture: ``() -> audio`` returning None when nothing was heard.
+        recognize: ``(audio) -> text`` returning None if not understood.
+        handle: ``(text) -> response`` returning text to speak or None.
+        speak: ``(text) -> None`` that plays speech to completion.
+        interrupt: Optional ``() -> None`` that stops speech in progress.
+        queue_size: Capacity of each inter-stage queue.
+        echo_cancelled: Whether captured audio is free of the speech played,
+            letting the user barge in on it.
+    """
+
+    STAGES = ("capture", "recognize", "handle", "speak")
+
+    def __init__(
+        self,
+        capture,
+        recognize,
+        handle,
+        speak,
+        interrupt=None,
+        queue_size=2,
+        echo_cancelled=ECHO_CANCELLED,
+    ):
+        self.capture = capture
+        self.recognize = recognize
+        self.handle = handle
+        self.speak = speak
+        self.interrupt = interrupt
+        self.queue_size = queue_size
+        self.echo_cancelled = echo_cancelled
+        self.generation = 0
+        self._local = threading.local()
+        self._loop = None
+        self._stop_event = None
+        self._action_task = None
+        self._speaking = False
+        self._spoken = 0
+        self._quiet = None
+        self._executors = {}
+
+    async def run(self):
+        """Run all stages until stop() is called."""
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self._quiet = asyncio.Event()
+        self._quiet.set()
+        self._executors = {
+            stage: ThreadPoolExecutor(max_workers=1, thread_name_prefix=stage)
+            for stage in self.STAGES + ("interrupt",)
+        }
+        self._audio = asyncio.Queue(self.queue_size)
+        self._text = asyncio.Queue(self.queue_size)
+        self._speech = asyncio.Queue(self.queue_size)
+
+        tasks = [
+            asyncio.ensure_future(self._capture_loop()),
+            asyncio.ensure_future(self._recognize_loop()),
+            asyncio.ensure_future(self._handle_loop()),
+            asyncio.ensure_future(self._speak_loop()),
+        ]
+        try:
+            await self._stop_event.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for executor in self._executors.values():
+                executor.shutdown(wait=False)
+
+    def stop(self):
+        """Stop the pipeline; safe to call from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    def say(self, text):
+        """Queue text for the speech stage; safe to call from any thread.
+
+        Speech requested by an action that has since been barged in on is
+        dropped by the speech stage.
+        """
+        generation = getattr(self._local, "generation", None)
+        item = (self.generation if generation is None else generation, text)
+        if self._in_loop():
+            asyncio.ensure_future(self._speech.put(item))
+        else:
+            # Blocks the calling stage while the speech queue is full
+            asyncio.run_coroutine_threadsafe(
+                self._speech.put(item), self._loop
+            ).result()
+
+    def is_busy(self):
+        """True while a command is queued, being handled or being spoken."""
+        action_running = self._action_task is not None and not self._action_task.done()
+        return (
+            action_running
+            or self._speaking
+            or not self._text.empty()
+            or not self._speech.empty()
+        )
+
+    def barge_in(self):
+        """Drop in-flight work so the newest utterance is served next."""
+        self.generation += 1
+        for pending in (self._text, self._speech):
+            while not pending.empty():
+                pending.get_nowait()
+        if self._action_task is not None and not self._action_task.done():
+            self._action_task.cancel()
+        if self._speaking and self.interrupt is not None:
+            self._run_in("interrupt", self.interrupt)
+        logger.info("Barge-in: cancelled current command")
+
+    def _in_loop(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _run_in(self, stage, func, *args, generation=None):
+        def call():
+            self._local.generation = generation
+            return func(*args)
+
+        return self._loop.run_in_executor(self._executors[stage], call)
+
+    async def _capture_loop(self):
+        while True:
+            if not self.echo_cancelled:
+                await self._quiet.wait()
+            spoken = self._spoken
+            audio = await self._run_in("capture", self.capture)
+            if audio is None:
+                continue
+            if not self.echo_cancelled and (self._speaking or self._spoken != spoken):
+                # May be the assistant hearing itself
+                continue
+            if self.is_busy():
+                self.barge_in()
+            await self._audio.put((self.generation, audio))
+
+    async def _recognize_loop(self):
+        while True:
+            generation, audio = await self._audio.get()
+            try:
+                text = await self._run_in(
+                    "recognize", self.recognize, audio, generation=generation
+                )
+            except Exception as e:
+                logger.error(f"Recognition failed: {str(e)}")
+                continue
+            if text and generation == self.generation:
+                await self._text.put((generation, text))
+
+    async def _handle_loop(self):
+        while True:
+            generation, text = await self._text.get()
+            if generation != self.generation:
+                continue
+            self._action_task = asyncio.ensure_future(
+                self._run_in("handle", self.handle, text, generation=generation)
+            )
+            # Wait without awaiting the task itself, so a barge-in cancels the
+            # action and not this loop.
+            await asyncio.wait({self._action_task})
+            if self._action_task.cancelled():
+                continue
+            try:
+                response = self._action_task.result()
+            except Exception as e:
+                logger.error(f"Command failed: {str(e)}")
+                continue
+            if isinstance(response, str) and response and generation == self.generation:
+                await self._speech.put((generation, response))
+
+    async def _speak_loop(self):
+        while True:
+            generation, text = await self._speech.get()
+            if generation != self.generation:
+                continue
+            self._speaking = True
+            self._spoken += 1
+            self._quiet.clear()
+            try:
+                await self._run_in("speak", self.speak, text, generation=generation)
+            except Exception as e:
+                logger.error(f"Speech failed: {str(e)}")
+            finally:
+                self._speaking = False
+                self._quiet.set()
@@ -0,0 +1,74 @@
+"""Start Gmail lookups early, while the command is still being spoken."""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Run lookups in the background and hand their results to handlers.
+
+    Partial transcripts propose lookups keyed by everything that determines
+    their result. A key that keeps being proposed across ``min_votes``
+    consecutive hypotheses is considered stable and is started. When the
+    final command runs, ``get`` returns the prefetched result for the same
+    key, or performs the lookup itself if it was never started.
+
+    Args:
+        min_votes: Number of partial hypotheses that must propose a key
+            before it is fetched.
+        max_workers: Number of lookups that may run at once.
+    """
+
+    def __init__(self, min_votes=2, max_workers=2):
+        self.min_votes = min_votes
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="Prefetch"
+        )
+        self._lock = threading.Lock()
+        self._votes = {}
+        self._futures = {}
+
+    def propose(self, candidates):
+        """Vote for the lookups implied by one partial hypothesis.
+
+        Args:
+            candidates: Iterable of ``(key, func, args)`` tuples. Keys absent
+                from this hypothesis lose their votes.
+        """
+        with self._lock:
+            votes = {}
+            for key, func, args in candidates:
+                if key in self._futures:
+                    continue
+                votes[key] = self._votes.get(key, 0) + 1
+                if votes[key] >= self.min_votes:
+                    logger.info(f"Prefetching {key}")
+                    self._futures[key] = self._executor.submit(func, *args)
+            self._votes = votes
+
+    def get(self, key, func, *args):
+        """Return the prefetched result for ``key``, or compute it now."""
+        with self._lock:
+            future = self._futures.pop(key, None)
+        if future is not None and not future.cancel():
+            try:
+                return future.result()
+            except Exception as e:
+                logger.warning(f"Prefetch of {key} failed, retrying: {str(e)}")
+        return func(*args)
+
+    def clear(self):
+        """Forget votes and unused results before the next utterance."""
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures = {}
+            self._votes = {}
+
+    def shutdown(self):
+        """Stop the worker threads."""
+        self.clear()
+        self._executor.shutdown(wait=False)
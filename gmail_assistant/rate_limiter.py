@@ -0,0 +1,312 @@
+"""Keep Gmail API calls within the per-user quota and back off when throttled."""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Gmail allows each user 250 quota units per second
+QUOTA_PER_SECOND = float(os.getenv("GMAIL_QUOTA_PER_SECOND", 250))
+# Never slow down below this many units per second
+MIN_RATE = 10
+MAX_RETRIES = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 32.0
+# Seconds of history the throughput figures cover
+METRICS_WINDOW = 60
+
+# Quota units per method, from Gmail's usage limits
+METHOD_COSTS = {
+    "getProfile": 1,
+    "drafts.create": 10,
+    "drafts.send": 100,
+    "history.list": 2,
+    "labels.get": 1,
+    "labels.list": 1,
+    "messages.attachments.get": 5,
+    "messages.batchDelete": 50,
+    "messages.batchModify": 50,
+    "messages.delete": 10,
+    "messages.get": 5,
+    "messages.import": 25,
+    "messages.insert": 25,
+    "messages.list": 5,
+    "messages.modify": 5,
+    "messages.send": 100,
+    "messages.trash": 5,
+    "messages.untrash": 5,
+    "threads.get": 10,
+    "threads.list": 10,
+    "threads.modify": 10,
+    "threads.trash": 10,
+}
+DEFAULT_COST = 5
+
+# Path segments that name a method rather than a resource id
+VERBS = {"send", "batchModify", "batchDelete", "import", "modify", "trash", "untrash"}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+BATCH_PART = re.compile(rb"^(GET|POST|PUT|PATCH|DELETE) (\S+) HTTP/1\.1", re.MULTILINE)
+
+
+def method_for(http_method, uri):
+    """Name of the Gmail API method a request calls, e.g. 'messages.get'."""
+    parts = urlparse(uri).path.strip("/").split("/")
+    if "users" not in parts:
+        return None
+    # Skip the user id after 'users'
+    parts = parts[parts.index("users") + 2 :]
+    if not parts:
+        return None
+    if parts == ["profile"]:
+        return "getProfile"
+    resource = parts[0]
+    if len(parts) == 1:
+        return f"{resource}.{'list' if http_method == 'GET' else 'insert'}"
+    if parts[1] in VERBS:
+        return f"{resource}.{parts[1]}"
+    if len(parts) == 2:
+        return f"{resource}.{'delete' if http_method == 'DELETE' else 'get'}"
+    if parts[2] in VERBS:
+        return f"{resource}.{parts[2]}"
+    return f"{resource}.{parts[2]}.get"
+
+
+def request_cost(http_method, uri, body=None):
+    """Quota units a request uses; a batch costs the sum of its parts."""
+    if urlparse(uri).path.startswith("/batch"):
+        if isinstance(body, str):
+            body = body.encode()
+        return sum(
+            request_cost(method.decode(), path.decode())
+            for method, path in BATCH_PART.findall(body or b"")
+        )
+    return METHOD_COSTS.get(method_for(http_method, uri), DEFAULT_COST)
+
+
+def is_rate_limited(status, content):
+    """True for a 429, or a 403 whose reason is a rate limit."""
+    if status == 429:
+        return True
+    if status != 403:
+        return False
+    try:
+        errors = json.loads(content)["error"]["errors"]
+    except (ValueError, KeyError, TypeError):
+        return False
+    return any(error.get("reason") in RATE_LIMIT_REASONS for error in errors)
+
+
+class TokenBucket:
+    """Hand out quota units at ``rate`` per second, with bursts up to ``capacity``.
+
+    Args:
+        rate: Units added per second.
+        capacity: Most units that can accumulate while idle.
+        clock: Time source, for tests.
+        sleep: ``(seconds) -> None``, for tests.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, units):
+        """Take ``units``, waiting until they are available.
+
+        A request costing more than the capacity waits for a full bucket.
+
+        Returns:
+            Seconds spent waiting.
+        """
+        units = min(units, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                # Allow for rounding in the refill arithmetic
+                if self.tokens >= units - 1e-9:
+                    self.tokens = max(0.0, self.tokens - units)
+                    return waited
+                delay = (units - self.tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+
+class RateLimiter:
+    """Pace Gmail requests by quota cost and retry the ones that get throttled.
+
+    Requests draw their method's quota units from a token bucket before
+    they are sent. A throttled response is retried after a jittered
+    exponential delay, and halves the bucket's rate; each successful
+    request then raises it by one unit per second, back up to
+    ``quota_per_second``. Bulk work thus settles at the highest rate Gmail
+    accepts instead of failing halfway.
+
+    Args:
+        quota_per_second: Quota units per second to aim for.
+        max_retries: Retries of a throttled request before giving up and
+            returning the throttled response.
+        base_delay: Delay cap of the first retry, doubling per retry.
+        max_delay: Largest delay cap.
+        clock: Time source, for tests.
+        sleep: ``(seconds) -> None``, for tests.
+        rand: ``() -> float`` in [0, 1), for tests.
+    """
+
+    def __init__(
+        self,
+        quota_per_second=QUOTA_PER_SECOND,
+        max_retries=MAX_RETRIES,
+        base_delay=BASE_DELAY,
+        max_delay=MAX_DELAY,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        rand=random.random,
+    ):
+        self.quota_per_second = quota_per_second
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(quota_per_second, clock=clock, sleep=sleep)
+        self._clock = clock
+        self._sleep = sleep
+        self._rand = rand
+        self._lock = threading.Lock()
+        self._recent = deque()
+        self._counts = {}
+        self.throttled = 0
+        self.retries = 0
+        self.waited = 0.0
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def backoff_delay(self, attempt):
+        """Full-jitter delay before retry ``attempt`` (0 for the first)."""
+        return self._rand() * min(self.max_delay, self.base_delay * 2**attempt)
+
+    def send(self, http_method, uri, body, request):
+        """Send a request within the quota, retrying it while it is throttled.
+
+        Args:
+            http_method: HTTP method of the request.
+            uri: Request URI, used to look up its quota cost.
+            body: Request body; batch bodies are costed per part.
+            request: ``() -> (response, content)`` sending the request.
+
+        Returns:
+            The ``(response, content)`` of the last attempt.
+        """
+        cost = request_cost(http_method, uri, body)
+        name = method_for(http_method, uri) or "batch"
+        for attempt in range(self.max_retries + 1):
+            waited = self.bucket.acquire(cost)
+            response, content = request()
+            limited = is_rate_limited(response.status, content)
+            self._record(name, cost, waited, limited)
+            if not limited or attempt == self.max_retries:
+                return response, content
+            self._wait_before_retry(name, attempt)
+
+    def retry_throttled(self, name, count, attempt):
+        """Back off before re-sending parts of a batch that were throttled.
+
+        Gmail answers a batch with 200 and reports throttling per part, so
+        ``send`` never sees it. Callers collect the throttled parts, call
+        this, and send them again in a new batch if it returns True.
+
+        Args:
+            name: Method the parts call, for the log.
+            count: Number of throttled parts.
+            attempt: Retries already made (0 for the first).
+
+        Returns:
+            False, without waiting, once ``max_retries`` retries were made.
+        """
+        if attempt >= self.max_retries:
+            return False
+        with self._lock:
+            self.throttled += count
+            self.bucket.rate = max(MIN_RATE, self.bucket.rate / 2)
+        self._wait_before_retry(f"{name} ({count} batch parts)", attempt)
+        return True
+
+    def _wait_before_retry(self, name, attempt):
+        delay = self.backoff_delay(attempt)
+        logger.warning(
+            f"Gmail {name} throttled, retrying in {delay:.1f}s "
+            f"at {self.rate:.0f} units/s"
+        )
+        with self._lock:
+            self.retries += 1
+            self.waited += delay
+        self._sleep(delay)
+
+    def _record(self, name, cost, waited, limited):
+        now = self._clock()
+        with self._lock:
+            self.waited += waited
+            count = self._counts.setdefault(name, {"requests": 0, "units": 0})
+            count["requests"] += 1
+            count["units"] += cost
+            self._recent.append((now, cost))
+            while self._recent and now - self._recent[0][0] > METRICS_WINDOW:
+                self._recent.popleft()
+            bucket = self.bucket
+            if limited:
+                self.throttled += 1
+                bucket.rate = max(MIN_RATE, bucket.rate / 2)
+            else:
+                bucket.rate = min(self.quota_per_second, bucket.rate + 1)
+
+    def report(self):
+        """Throughput and throttling figures, for logs and diagnostics."""
+        now = self._clock()
+        with self._lock:
+            recent = [
+                units for stamp, units in self._recent if now - stamp <= METRICS_WINDOW
+            ]
+            return {
+                "rate": self.rate,
+                "units_per_second": sum(recent) / METRICS_WINDOW,
+                "requests_per_second": len(recent) / METRICS_WINDOW,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "seconds_waited": self.waited,
+                "methods": {
+                    name: dict(count) for name, count in sorted(self._counts.items())
+                },
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide limiter; Gmail's quota is per user, not per client."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
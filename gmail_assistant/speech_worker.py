@@ -0,0 +1,167 @@
+"""Text to speech on a dedicated thread, so callers never wait for audio."""
+
+import logging
+import threading
+from collections import deque
+
+from .error_handler import GmailAssistantError
+
+logger = logging.getLogger(__name__)
+
+# Queued utterances are spoken together while the result stays under this
+# many characters, saving the engine's pause between separate say() calls
+MERGE_CHARS = 200
+SENTENCE_END = ".!?:;"
+
+
+def merge_text(first, second):
+    """Join two utterances so the engine still pauses between them."""
+    if first[-1] not in SENTENCE_END:
+        first += "."
+    return f"{first} {second}"
+
+
+class SpeechWorker:
+    """Queue utterances for one thread that owns the TTS engine.
+
+    pyttsx3 has to be driven from a single thread, and ``runAndWait``
+    blocks until the audio has played. The worker creates the engine on
+    its own thread and plays queued text there, so ``say`` returns at once
+    and Gmail or LLM work carries on while speech plays. Short utterances
+    that queue up behind each other are merged into one. ``interrupt``
+    drops everything queued and cuts off the current utterance at its next
+    word, for barge-in when a new command arrives.
+
+    Args:
+        engine_factory: ``() -> engine`` such as ``pyttsx3.init``.
+        rate: Speaking rate in words per minute, or None for the default.
+        merge_chars: Longest text that merged utterances may form.
+    """
+
+    def __init__(self, engine_factory, rate=None, merge_chars=MERGE_CHARS):
+        self.engine_factory = engine_factory
+        self.rate = rate
+        self.merge_chars = merge_chars
+        self.engine = None
+        self.generation = 0
+        self._playing = None
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._ready = threading.Event()
+        self._error = None
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        """Start the speech thread and wait for the engine to load.
+
+        Raises:
+            GmailAssistantError: If the engine cannot be created.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._error = None
+        self._ready.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="SpeechWorker", daemon=True
+        )
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise GmailAssistantError(f"Text to speech unavailable: {str(self._error)}")
+
+    def stop(self, timeout=None):
+        """Drop pending speech and end the speech thread."""
+        self.interrupt()
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def say(self, text):
+        """Queue text to be spoken and return immediately."""
+        text = (text or "").strip()
+        if not text:
+            return
+        with self._condition:
+            self._queue.append(text)
+            self._condition.notify_all()
+
+    def say_and_wait(self, text):
+        """Speak text and block until it has played or was interrupted."""
+        self.say(text)
+        self.wait()
+
+    def interrupt(self):
+        """Drop queued speech and stop the current utterance."""
+        with self._condition:
+            self.generation += 1
+            dropped = len(self._queue)
+            self._queue.clear()
+            speaking = self._playing is not None
+            self._condition.notify_all()
+        if speaking or dropped:
+            logger.info(f"Speech interrupted ({dropped} queued utterances dropped)")
+
+    @property
+    def is_speaking(self):
+        """True while speech is playing or queued."""
+        with self._condition:
+            return self._playing is not None or bool(self._queue)
+
+    def wait(self, timeout=None):
+        """Block until everything queued has been spoken.
+
+        Returns:
+            False if ``timeout`` seconds passed first.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._playing is None and not self._queue or self._stopped,
+                timeout,
+            )
+
+    def _next_utterance(self):
+        text = self._queue.popleft()
+        while self._queue and len(merge_text(text, self._queue[0])) <= self.merge_chars:
+            text = merge_text(text, self._queue.popleft())
+        return text
+
+    def _on_word(self, name, location, length):
+        # Called by the engine on this thread between words; stop() is only
+        # safe to call from inside the engine's loop
+        if self._playing is not None and self._playing != self.generation:
+            self.engine.stop()
+
+    def _run(self):
+        try:
+            self.engine = self.engine_factory()
+            if self.rate is not None:
+                self.engine.setProperty("rate", self.rate)
+            self.engine.connect("started-word", self._on_word)
+        except Exception as e:
+            logger.error(f"Failed to start text to speech: {str(e)}")
+            self._error = e
+            return
+        finally:
+            self._ready.set()
+
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._stopped)
+                if self._stopped:
+                    return
+                text = self._next_utterance()
+                self._playing = self.generation
+            try:
+                logger.debug(f"Playing: {text}")
+                self.engine.say(text)
+                self.engine.runAndWait()
+            except Exception as e:
+                logger.error(f"Speech failed: {str(e)}")
+            finally:
+                with self._condition:
+                    self._playing = None
+                    self._condition.notify_all()
@@ -0,0 +1,160 @@
+"""Startup timing and background initialization of assistant subsystems."""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from .error_handler import GmailAssistantError
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfiler:
+    """Record how long each startup phase took and on which thread."""
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._origin = clock()
+        self._lock = threading.Lock()
+        self._records = []
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as one phase."""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self._record(name, start, self._clock() - start)
+
+    def mark(self, name):
+        """Record an instant, e.g. the first event loop iteration."""
+        self._record(name, self._clock(), 0.0)
+
+    def _record(self, name, start, duration):
+        with self._lock:
+            self._records.append(
+                (name, start - self._origin, duration, threading.current_thread().name)
+            )
+
+    @property
+    def records(self):
+        """List of (name, start offset, duration, thread) in seconds."""
+        with self._lock:
+            return sorted(self._records, key=lambda record: record[1])
+
+    def report(self):
+        """Format the recorded phases as a table, in start order."""
+        lines = ["Startup timing (ms):"]
+        for name, start, duration, thread in self.records:
+            started, took = start * 1000, duration * 1000
+            lines.append(
+                f"  {name:<24} at {started:8.1f}  took {took:8.1f}  [{thread}]"
+            )
+        return "\n".join(lines)
+
+
+class Subsystems:
+    """Bring named subsystems up, in the foreground or on background threads.
+
+    Each subsystem is a setup callable. Listeners are told when a subsystem
+    finished, with the exception it raised or None, from the thread that
+    ran it. Code that needs a subsystem calls ``wait`` first.
+
+    Args:
+        profiler: StartupProfiler that times each setup.
+    """
+
+    def __init__(self, profiler=None):
+        self.profiler = profiler or StartupProfiler()
+        self._lock = threading.Lock()
+        self._events = {}
+        self._errors = {}
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call ``callback(name, error)`` as each subsystem finishes."""
+        self._listeners.append(callback)
+
+    def run(self, name, setup):
+        """Set a subsystem up on the calling thread.
+
+        Raises:
+            Whatever ``setup`` raised.
+        """
+        self._register(name)
+        self._setup(name, setup, ())
+        error = self._errors.get(name)
+        if error is not None:
+            raise error
+
+    def start(self, name, setup, requires=()):
+        """Set a subsystem up on a daemon thread.
+
+        Args:
+            name: Subsystem name.
+            setup: Callable that initializes it.
+            requires: Names of subsystems that must be ready first.
+        """
+        self._register(name)
+        thread = threading.Thread(
+            target=self._setup,
+            args=(name, setup, requires),
+            name=f"Startup-{name}",
+            daemon=True,
+        )
+        thread.start()
+
+    def wait(self, name, timeout=None):
+        """Block until a subsystem is ready.
+
+        Raises:
+            GmailAssistantError: If it was never started, failed or did not
+                finish within ``timeout`` seconds.
+        """
+        with self._lock:
+            event = self._events.get(name)
+        if event is None:
+            raise GmailAssistantError(f"{name} was not started")
+        if not event.wait(timeout):
+            raise GmailAssistantError(f"{name} is still starting")
+        error = self._errors.get(name)
+        if error is not None:
+            raise GmailAssistantError(f"{name} failed to start: {str(error)}")
+
+    def is_ready(self, name):
+        """True once a subsystem finished without error."""
+        event = self._events.get(name)
+        return event is not None and event.is_set() and name not in self._errors
+
+    @property
+    def names(self):
+        """Names of all subsystems started so far."""
+        with self._lock:
+            return list(self._events)
+
+    def _register(self, name):
+        with self._lock:
+            if name in self._events:
+                raise GmailAssistantError(f"{name} was already started")
+            self._events[name] = threading.Event()
+
+    def _setup(self, name, setup, requires):
+        error = None
+        try:
+            for required in requires:
+                self.wait(required)
+            with self.profiler.phase(name):
+                setup()
+        except Exception as e:
+            logger.error(f"Failed to start {name}: {str(e)}")
+            error = e
+        if error is not None:
+            self._errors[name] = error
+        self._events[name].set()
+        for listener in self._listeners:
+            try:
+                listener(name, error)
+            except Exception as e:
+                logger.error(f"Startup listener failed for {name}: {str(e)}")
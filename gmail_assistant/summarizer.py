@@ -0,0 +1,136 @@
+"""Email summaries stored per message, made ahead of time while idle."""
+
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds without a command before the assistant counts as idle
+IDLE_AFTER = 10
+
+
+def content_hash(body):
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+class EmailSummarizer:
+    """Summarize message bodies once and keep the result in a MessageStore.
+
+    Summaries are stored by message id and a hash of the body they were
+    made from, so an edited draft or a re-sent message is summarized again.
+
+    Args:
+        store: MessageStore holding the summaries.
+        summarize: ``(body) -> str`` calling the model.
+    """
+
+    def __init__(self, store, summarize):
+        self.store = store
+        self.summarize = summarize
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def summary_for(self, message_id, body):
+        """Return the summary of a message body, making it if needed.
+
+        A request for a message the background job is already summarizing
+        waits for that summary instead of asking the model twice.
+        """
+        digest = content_hash(body)
+        while True:
+            summary = self.store.get_summary(message_id, digest)
+            if summary is not None:
+                return summary
+            with self._lock:
+                pending = self._pending.get(message_id)
+                if pending is None:
+                    done = self._pending[message_id] = threading.Event()
+                    break
+            pending.wait()
+        try:
+            summary = self.summarize(body)
+            self.store.save_summary(message_id, digest, summary)
+            return summary
+        finally:
+            with self._lock:
+                del self._pending[message_id]
+            done.set()
+
+
+class PreSummarizer:
+    """Summarize newly arrived unread messages while the assistant is idle.
+
+    Bodies come from the store's search index, which MessageSync fills, so
+    pre-summarizing costs no Gmail requests. Work stops as soon as a
+    command arrives and resumes once the assistant has been idle for
+    ``idle_after`` seconds.
+
+    Args:
+        summarizer: EmailSummarizer storing the summaries.
+        label_id: Label of the messages to summarize ahead of time.
+        idle_after: Seconds without activity before work starts.
+        clock: Time source, for tests.
+    """
+
+    def __init__(
+        self, summarizer, label_id="UNREAD", idle_after=IDLE_AFTER, clock=time.monotonic
+    ):
+        self.summarizer = summarizer
+        self.store = summarizer.store
+        self.label_id = label_id
+        self.idle_after = idle_after
+        self._clock = clock
+        self._last_activity = clock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def touch(self):
+        """Record activity, pausing background work."""
+        self._last_activity = self._clock()
+
+    def is_idle(self):
+        return self._clock() - self._last_activity >= self.idle_after
+
+    def run_once(self, limit=5):
+        """Summarize up to ``limit`` messages while idle.
+
+        Returns:
+            Number of messages summarized.
+        """
+        done = 0
+        for message_id in self.store.unsummarized_ids(self.label_id, limit=limit):
+            if self._stop_event.is_set() or not self.is_idle():
+                break
+            body = self.store.get_body(message_id)
+            if not body:
+                continue
+            self.summarizer.summary_for(message_id, body)
+            done += 1
+        if done:
+            logger.info(f"Pre-summarized {done} messages")
+        return done
+
+    def start(self, interval=30):
+        """Check for new messages every ``interval`` seconds in the background."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="PreSummarizer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self, interval):
+        while not self._stop_event.is_set():
+            try:
+                # Keep going while there is a backlog and nobody is talking
+                while self.run_once() and not self._stop_event.is_set():
+                    pass
+            except Exception as e:
+                logger.warning(f"Pre-summarization failed: {str(e)}")
+            self._stop_event.wait(interval)
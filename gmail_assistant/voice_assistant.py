@@ -1,29 +1,54 @@
 """Core voice assistant functionality."""
+import asyncio
+import threading
 import speech_recognition as sr
 import pyttsx3
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 import os
-import pickle
 import json
 from .utils import handle_errors
 from .config.secrets import SCOPES, CREDENTIALS_PATH, TOKEN_PATH
 from .llm.service import LLMService
+from .llm.streaming import speak_stream
 from .voice_processing.service import VoiceProcessor
+from .voice_processing.microphone import MicrophoneStream
+from .message_fetcher import MessageFetcher
+from .message_store import MessageStore, MessageSync
+from .gmail_service import CredentialStore, get_gmail_service
+from .pipeline import CommandPipeline
+from .speech_worker import SpeechWorker
+from .intent_engine import DIRECT_MATCH_SCORE, get_engine
 from datetime import datetime
 from .utils.logger import logger
 
+# Intents handled directly, mapped to their entry in self.commands
+COMMAND_INTENTS = {
+    'read_email': "read email",
+    'send_email': "send email",
+    'check_inbox': "check inbox",
+    'delete_email': "delete email",
+    'mark_read': "mark as read",
+    'help': "help",
+}
+
+# Half the usual default of about 200 words per minute
+SPEECH_RATE = 100
+
 class GmailVoiceAssistant:
     @handle_errors
     def __init__(self):
         logger.info("Initializing Gmail Voice Assistant")
         try:
             self.recognizer = sr.Recognizer()
-            self.engine = pyttsx3.init()
+            self.microphone = MicrophoneStream(self.recognizer)
+            self.speech = SpeechWorker(pyttsx3.init, rate=SPEECH_RATE)
+            self.speech.start()
+            self.engine = self.speech.engine
             self.credentials = None
             self.service = None
+            self.pipeline = None
+            self._stream_stop = threading.Event()
+            self.message_store = None
+            self.message_sync = None
             
             logger.info("Setting up Gmail API...")
             self.setup_gmail_api()
@@ -43,6 +68,7 @@ class GmailVoiceAssistant:
                 "mark as read": self.mark_as_read,
                 "help": self.list_commands
             }
+            self.intent_engine = get_engine()
             
             logger.info("Voice assistant initialization complete")
             
@@ -53,97 +79,133 @@ class GmailVoiceAssistant:
     @handle_errors
     def setup_gmail_api(self):
         logger.info("Setting up Gmail API")
-        if os.path.exists(TOKEN_PATH):
-            with open(TOKEN_PATH, 'rb') as token:
-                self.credentials = pickle.load(token)
+        store = CredentialStore(TOKEN_PATH, CREDENTIALS_PATH, SCOPES, port=8080)
+        self.service = get_gmail_service(store)
+        self.credentials = store.credentials
 
-        if not self.credentials or not self.credentials.valid:
-            if self.credentials and self.credentials.expired and self.credentials.refresh_token:
-                self.credentials.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    CREDENTIALS_PATH, 
-                    SCOPES
-                )
-                self.credentials = flow.run_local_server(port=8080)
-            with open(TOKEN_PATH, 'wb') as token:
-                pickle.dump(self.credentials, token)
-
-        self.service = build('gmail', 'v1', credentials=self.credentials)
+        # Answer inbox queries from a local store kept fresh in the background
+        self.message_store = MessageStore()
+        self.message_sync = MessageSync(self.service, self.message_store)
+        self.message_sync.start()
 
     @handle_errors
     def listen(self):
         """Listen for voice commands"""
         logger.info("Listening for commands...")
+        # Finish speaking before capturing, so our own voice is not recorded
+        self.speech.say_and_wait("Listening...")
         try:
-            with sr.Microphone() as source:
-                logger.debug("Microphone initialized")
-                logger.debug("Adjusting for ambient noise...")
-                self.recognizer.adjust_for_ambient_noise(source, duration=1)
-                logger.info("Adjusted for ambient noise")
-                
-                self.speak("Listening...")
-                logger.debug("Waiting for audio input...")
-                
-                try:
-                    audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=5)
-                    logger.info("Audio captured successfully")
-                    
-                    # Process the command
-                    logger.debug("Processing captured audio...")
-                    return self.process_command(audio)
-                    
-                except sr.WaitTimeoutError:
-                    logger.warning("No audio input received (timeout)")
-                    self.speak("I didn't hear anything. Please try again.")
-                    return None
-                except Exception as e:
-                    logger.error(f"Error during audio capture: {str(e)}", exc_info=True)
-                    self.speak("Sorry, there was an error. Please try again.")
-                    return None
-                
+            audio = self.capture_audio()
         except Exception as e:
             logger.error(f"Critical error in listen method: {str(e)}", exc_info=True)
             self.speak("Sorry, there was a problem with the microphone.")
             return None
 
+        if audio is None:
+            logger.warning("No audio input received (timeout)")
+            self.speak("I didn't hear anything. Please try again.")
+            return None
+
+        # Process the command
+        logger.debug("Processing captured audio...")
+        return self.process_command(audio)
+
+    def capture_audio(self, timeout=5, phrase_time_limit=5):
+        """Capture one utterance, or return None if nothing was heard"""
+        # The stream stays open and calibrated between commands
+        logger.debug("Waiting for audio input...")
+        try:
+            audio = self.microphone.listen(
+                timeout=timeout, phrase_time_limit=phrase_time_limit)
+        except sr.WaitTimeoutError:
+            return None
+        logger.info("Audio captured successfully")
+        return audio
+
+    def run_pipeline(self):
+        """Run the assistant on the asyncio capture/recognize/act/speak pipeline.
+
+        Blocks until self.pipeline.stop() is called from another thread.
+        """
+        self.pipeline = CommandPipeline(
+            capture=self.capture_audio,
+            recognize=self.recognize,
+            handle=self.dispatch_text,
+            speak=self.speech.say_and_wait,
+            interrupt=self.interrupt_speech
+        )
+        try:
+            asyncio.run(self.pipeline.run())
+        finally:
+            self.pipeline = None
+
     @handle_errors
     def speak(self, text):
         """Convert text to speech"""
         logger.info(f"Speaking: {text}")
         
-        # Get current engine properties
-        rate = self.engine.getProperty('rate')
-        
-        # Set the speaking rate to half the default speed
-        # Default is usually around 200 words per minute
-        self.engine.setProperty('rate', 100)  # Reduce to half speed
-        
-        self.engine.say(text)
-        self.engine.runAndWait()
+        # Inside the pipeline, speech is played by its own stage
+        if self.pipeline is not None:
+            self.pipeline.say(text)
+            return
+
+        self.speech.say(text)
+
+    def interrupt_speech(self):
+        """Stop speaking, and any token stream being spoken."""
+        self._stream_stop.set()
+        self.speech.interrupt()
+
+    def speak_stream(self, tokens, on_text=None):
+        """Speak a token stream sentence by sentence as it is generated.
+
+        interrupt_speech() also stops the stream, so the model stops
+        generating speech that will not be heard.
+        """
+        self._stream_stop = threading.Event()
+        return speak_stream(tokens, self.speak, on_text, stop=self._stream_stop)
 
     @handle_errors
     def process_command(self, audio_data):
         """Process voice command"""
+        # A new command barges in on whatever is still being said
+        self.interrupt_speech()
         try:
             # First try to get the text from the audio
-            result = self.voice_processor.process_audio(audio_data)
-            
-            if not result:
-                self.speak("I couldn't understand that. Please try again.")
+            text = self.recognize(audio_data)
+            if not text:
                 return False
+        except Exception as e:
+            logger.error(f"Error processing command: {str(e)}")
+            self.speak("Sorry, there was an error processing your command.")
+            return False
+
+        return self.dispatch_text(text)
+
+    def recognize(self, audio_data):
+        """Convert captured audio to command text, or None"""
+        result = self.voice_processor.process_audio(audio_data)
+        if not result:
+            self.speak("I couldn't understand that. Please try again.")
+            return None
+        return result.text
+
+    def dispatch_text(self, text):
+        """Run the command matching the recognized text"""
+        try:
+            logger.info(f"Processing command: {text}")
             
-            logger.info(f"Processing command: {result.text}")
-            
-            # Check for direct command matches first
-            for command_phrase, command_func in self.commands.items():
-                if command_phrase in result.text:
-                    logger.info(f"Executing command: {command_phrase}")
-                    command_func()
-                    return True
+            # Check for direct command matches first; weaker matches are
+            # left to the LLM analysis rather than acted on
+            match = self.intent_engine.match(text)
+            command_phrase = COMMAND_INTENTS.get(match.intent)
+            if command_phrase and match.score >= DIRECT_MATCH_SCORE:
+                logger.info(f"Executing command: {command_phrase} (score {match.score:.2f})")
+                self.commands[command_phrase]()
+                return True
             
             # If no direct match, use LLM analysis
-            analysis = self.llm_service.analyze_query(result.text)
+            analysis = self.llm_service.analyze_query(text)
             logger.info(f"LLM analysis: {analysis}")
             
             if analysis['confidence'] > 0.7:
@@ -170,12 +232,25 @@ class GmailVoiceAssistant:
             return self.search_emails(params)
         # ... handle other command types ...
 
+    def _store_ready(self):
+        return self.message_store is not None and self.message_store.is_ready()
+
     @handle_errors
     def read_latest_email(self):
         """Read the latest email"""
+        if self._store_ready():
+            latest = self.message_store.list_messages(limit=1)
+            if latest:
+                self.speak(f"Latest email subject: {latest[0].get('subject', 'No subject')}")
+            else:
+                self.speak("No emails found")
+            return
+
         results = self.service.users().messages().list(userId='me', maxResults=1).execute()
         if 'messages' in results:
-            message = self.service.users().messages().get(userId='me', id=results['messages'][0]['id']).execute()
+            message = self.service.users().messages().get(
+                userId='me', id=results['messages'][0]['id'], format='metadata',
+                metadataHeaders=['Subject']).execute()
             subject = next(header['value'] for header in message['payload']['headers'] if header['name'] == 'Subject')
             self.speak(f"Latest email subject: {subject}")
         else:
@@ -208,13 +283,16 @@ class GmailVoiceAssistant:
     def check_inbox(self):
         """Check inbox for recent emails"""
         logger.info("Checking inbox")
-        results = self.service.users().messages().list(userId='me', maxResults=5).execute()
-        if 'messages' in results:
+        if self._store_ready():
+            messages = self.message_store.list_messages(limit=5)
+        else:
+            results = self.service.users().messages().list(userId='me', maxResults=5).execute()
+            messages = MessageFetcher(self.service).fetch_headers(
+                results.get('messages', []), headers=('Subject',))
+        if messages:
             self.speak("Recent emails:")
-            for msg in results['messages']:
-                message = self.service.users().messages().get(userId='me', id=msg['id']).execute()
-                subject = next(header['value'] for header in message['payload']['headers'] if header['name'] == 'Subject')
-                self.speak(subject)
+            for message in messages:
+                self.speak(message.get('subject', 'No subject'))
         else:
             self.speak("No emails found")
 
@@ -226,6 +304,8 @@ class GmailVoiceAssistant:
         if 'messages' in results:
             msg_id = results['messages'][0]['id']
             self.service.users().messages().trash(userId='me', id=msg_id).execute()
+            if self.message_store is not None:
+                self.message_store.add_labels(msg_id, ['TRASH'])
             self.speak("Email deleted")
         else:
             self.speak("No emails to delete")
@@ -234,14 +314,20 @@ class GmailVoiceAssistant:
     def mark_as_read(self):
         """Mark the latest email as read"""
         logger.info("Marking latest email as read")
-        results = self.service.users().messages().list(userId='me', maxResults=1).execute()
-        if 'messages' in results:
-            msg_id = results['messages'][0]['id']
+        if self._store_ready():
+            messages = self.message_store.list_messages(limit=1)
+        else:
+            results = self.service.users().messages().list(userId='me', maxResults=1).execute()
+            messages = results.get('messages', [])
+        if messages:
+            msg_id = messages[0]['id']
             self.service.users().messages().modify(
                 userId='me',
                 id=msg_id,
                 body={'removeLabelIds': ['UNREAD']}
             ).execute()
+            if self.message_store is not None:
+                self.message_store.remove_labels(msg_id, ['UNREAD'])
             self.speak("Email marked as read")
         else:
             self.speak("No emails to mark as read")
@@ -0,0 +1,257 @@
+"""Pluggable speech recognition (ASR) backends."""
+
+import json
+import math
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import speech_recognition as sr
+
+from ..error_handler import GmailAssistantError
+from ..utils import logger
+
+# Backend selection: google (remote), vosk or whisper (local CPU)
+ASR_BACKEND = os.getenv("ASR_BACKEND", "google")
+VOSK_MODEL_PATH = os.getenv(
+    "VOSK_MODEL_PATH",
+    str(Path.home() / ".gmail_assistant" / "models" / "vosk-model-small-en-us-0.15"),
+)
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base.en")
+ASR_THREADS = int(os.getenv("ASR_THREADS", "0"))  # 0 lets the engine decide
+
+SAMPLE_RATE = 16000
+
+
+class ASRBackend(ABC):
+    """Interface for turning captured audio into text."""
+
+    name = None
+
+    @abstractmethod
+    def transcribe(self, audio_data):
+        """Recognize an ``sr.AudioData`` utterance.
+
+        Returns:
+            Tuple of (text, confidence between 0 and 1), or None if nothing
+            was recognized.
+        """
+
+    def start_stream(self):
+        """Begin incremental transcription of one utterance.
+
+        Backends without partial results buffer the audio and transcribe it
+        once the utterance is complete.
+        """
+        return TranscriptionStream(self)
+
+    def warm_up(self):
+        """Run a throwaway inference so the first real utterance is fast."""
+        silence = sr.AudioData(b"\x00\x00" * (SAMPLE_RATE // 2), SAMPLE_RATE, 2)
+        try:
+            self.transcribe(silence)
+        except Exception as e:
+            logger.warning(f"{self.name} warm-up failed: {str(e)}")
+
+
+class TranscriptionStream:
+    """Feed an utterance chunk by chunk and read back partial hypotheses."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._chunks = []
+        self._sample_rate = SAMPLE_RATE
+        self._sample_width = 2
+
+    def accept(self, audio_chunk):
+        """Add an ``sr.AudioData`` chunk.
+
+        Returns:
+            The current partial hypothesis, or None if there is none yet.
+        """
+        self._sample_rate = audio_chunk.sample_rate
+        self._sample_width = audio_chunk.sample_width
+        self._chunks.append(audio_chunk.get_raw_data())
+        return None
+
+    def finish(self):
+        """Return the final (text, confidence), or None if nothing was heard."""
+        audio = sr.AudioData(
+            b"".join(self._chunks), self._sample_rate, self._sample_width
+        )
+        return self.backend.transcribe(audio)
+
+
+class GoogleBackend(ASRBackend):
+    """Google Web Speech API, a remote call per utterance."""
+
+    name = "google"
+
+    def __init__(self, recognizer=None):
+        self.recognizer = recognizer or sr.Recognizer()
+
+    def transcribe(self, audio_data):
+        # show_all exposes the service's own confidence for the top result
+        result = self.recognizer.recognize_google(audio_data, show_all=True)
+        if not result or not result.get("alternative"):
+            return None
+        best = result["alternative"][0]
+        return best["transcript"], best.get("confidence", 0.0)
+
+    def warm_up(self):
+        pass  # Nothing local to warm
+
+
+class VoskBackend(ASRBackend):
+    """Offline Kaldi recognizer; the model is loaded once and reused."""
+
+    name = "vosk"
+
+    def __init__(self, model_path=VOSK_MODEL_PATH):
+        try:
+            import vosk
+        except ImportError:
+            raise GmailAssistantError("The vosk ASR backend requires: pip install vosk")
+        if not os.path.isdir(model_path):
+            raise GmailAssistantError(
+                f"Vosk model not found at: {model_path}\n"
+                f"Download one from https://alphacephei.com/vosk/models and set "
+                f"VOSK_MODEL_PATH"
+            )
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self.model = vosk.Model(model_path)
+
+    def new_recognizer(self):
+        recognizer = self._vosk.KaldiRecognizer(self.model, SAMPLE_RATE)
+        recognizer.SetWords(True)
+        return recognizer
+
+    def transcribe(self, audio_data):
+        stream = self.start_stream()
+        stream.accept(audio_data)
+        return stream.finish()
+
+    def start_stream(self):
+        return VoskStream(self.new_recognizer())
+
+    @staticmethod
+    def _parse(raw_result):
+        result = json.loads(raw_result)
+        text = result.get("text", "").strip()
+        if not text:
+            return None
+        words = result.get("result", [])
+        confidence = sum(w["conf"] for w in words) / len(words) if words else 0.0
+        return text, confidence
+
+
+class VoskStream:
+    """Streaming Kaldi decoding with a partial result after every chunk."""
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        # Vosk closes a segment at each pause; keep the closed ones
+        self._segments = []
+
+    def accept(self, audio_chunk):
+        raw = audio_chunk.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2)
+        if self.recognizer.AcceptWaveform(raw):
+            segment = VoskBackend._parse(self.recognizer.Result())
+            if segment:
+                self._segments.append(segment)
+            partial = ""
+        else:
+            partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        text = " ".join([text for text, _ in self._segments] + [partial]).strip()
+        return text or None
+
+    def finish(self):
+        last = VoskBackend._parse(self.recognizer.FinalResult())
+        segments = self._segments + ([last] if last else [])
+        if not segments:
+            return None
+        text = " ".join(text for text, _ in segments)
+        confidence = sum(conf for _, conf in segments) / len(segments)
+        return text, confidence
+
+
+class WhisperBackend(ASRBackend):
+    """faster-whisper on CPU with int8 weights, kept resident."""
+
+    name = "whisper"
+
+    def __init__(self, model_size=WHISPER_MODEL, cpu_threads=ASR_THREADS):
+        try:
+            import numpy
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise GmailAssistantError(
+                "The whisper ASR backend requires: pip install faster-whisper"
+            )
+        self._numpy = numpy
+        self.model = WhisperModel(
+            model_size, device="cpu", compute_type="int8", cpu_threads=cpu_threads
+        )
+
+    def transcribe(self, audio_data):
+        raw = audio_data.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2)
+        samples = (
+            self._numpy.frombuffer(raw, self._numpy.int16).astype(self._numpy.float32)
+            / 32768.0
+        )
+        segments, _ = self.model.transcribe(
+            samples, language="en", beam_size=1, condition_on_previous_text=False
+        )
+        segments = list(segments)
+        text = " ".join(segment.text.strip() for segment in segments).strip()
+        if not text:
+            return None
+        # Mean per-token log probability, weighted by segment length
+        total = sum(len(segment.text) for segment in segments) or 1
+        avg_logprob = (
+            sum(segment.avg_logprob * len(segment.text) for segment in segments) / total
+        )
+        return text, math.exp(avg_logprob)
+
+
+BACKENDS = {
+    GoogleBackend.name: GoogleBackend,
+    VoskBackend.name: VoskBackend,
+    WhisperBackend.name: WhisperBackend,
+}
+
+
+def create_backend(name=None):
+    """Create the configured ASR backend.
+
+    Args:
+        name: Backend name; defaults to the ASR_BACKEND environment variable.
+    """
+    name = (name or ASR_BACKEND).lower()
+    if name not in BACKENDS:
+        raise GmailAssistantError(
+            f"Unknown ASR backend '{name}'. Choose one of: {', '.join(BACKENDS)}"
+        )
+    logger.info(f"Loading {name} speech recognition backend")
+    return BACKENDS[name]()
+
+
+def load_backend(recognizer=None):
+    """Create and warm the configured backend, falling back to Google.
+
+    Args:
+        recognizer: ``sr.Recognizer`` to reuse for the Google fallback.
+    """
+    try:
+        backend = create_backend()
+        backend.warm_up()
+        return backend
+    except Exception as e:
+        # Missing packages, bad model paths, failed downloads and corrupt
+        # models all leave Google as the way to recognize speech
+        logger.warning(
+            f"Could not load {ASR_BACKEND} speech recognition: {str(e)}\n"
+            f"Falling back to Google speech recognition"
+        )
+        return GoogleBackend(recognizer)
@@ -0,0 +1,172 @@
+"""Long-lived microphone stream with background noise calibration."""
+
+import audioop
+import json
+import threading
+from collections import deque
+from pathlib import Path
+
+import speech_recognition as sr
+
+from ..utils import logger
+
+STATE_PATH = Path.home() / ".gmail_assistant" / "voice_state.json"
+
+
+class MicrophoneStream:
+    """Keep one microphone open and its energy threshold calibrated.
+
+    Between utterances a background thread samples the ambient level over
+    a rolling window and updates ``recognizer.energy_threshold``, so
+    ``listen()`` can start capturing immediately instead of spending a
+    second in ``adjust_for_ambient_noise``. The threshold is saved to disk
+    and restored in the next session.
+    """
+
+    def __init__(
+        self,
+        recognizer,
+        window_seconds=3.0,
+        min_threshold=300,
+        state_path=STATE_PATH,
+        save_interval=30.0,
+    ):
+        self.recognizer = recognizer
+        self.window_seconds = window_seconds
+        self.min_threshold = min_threshold
+        self.state_path = Path(state_path)
+        self.save_interval = save_interval
+        self.source = None
+        self._microphone = None
+        self._energies = None
+        self._lock = threading.Lock()
+        self._listen_pending = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def open(self):
+        """Open the microphone and start background calibration."""
+        if self.source is not None:
+            return
+        self._microphone = sr.Microphone()
+        self.source = self._microphone.__enter__()
+
+        frames_per_second = self.source.SAMPLE_RATE / self.source.CHUNK
+        self._energies = deque(
+            maxlen=max(1, int(self.window_seconds * frames_per_second))
+        )
+
+        saved = self._load_threshold()
+        if saved:
+            self.recognizer.energy_threshold = saved
+            logger.info(f"Restored energy threshold {saved:.0f}")
+        else:
+            # Only the very first session pays for a blocking calibration.
+            self.recognizer.adjust_for_ambient_noise(self.source, duration=0.5)
+            self._save_threshold()
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._calibrate_loop, name="MicCalibration", daemon=True
+        )
+        self._thread.start()
+
+    def listen(self, timeout=5, phrase_time_limit=5):
+        """Capture one utterance using the current threshold.
+
+        Raises:
+            sr.WaitTimeoutError: If no speech starts within ``timeout``.
+        """
+        self.open()
+        self._listen_pending.set()
+        try:
+            with self._lock:
+                return self.recognizer.listen(
+                    self.source, timeout=timeout, phrase_time_limit=phrase_time_limit
+                )
+        finally:
+            self._listen_pending.clear()
+
+    def listen_stream(self, timeout=5, phrase_time_limit=5):
+        """Yield one utterance as ``sr.AudioData`` chunks while it is spoken.
+
+        The device stays reserved until the generator is exhausted or closed.
+
+        Raises:
+            sr.WaitTimeoutError: If no speech starts within ``timeout``.
+        """
+        self.open()
+        self._listen_pending.set()
+        try:
+            with self._lock:
+                for chunk in self.recognizer.listen(
+                    self.source,
+                    timeout=timeout,
+                    phrase_time_limit=phrase_time_limit,
+                    stream=True,
+                ):
+                    yield chunk
+        finally:
+            self._listen_pending.clear()
+
+    def close(self):
+        """Stop calibration, persist the threshold and release the device."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        if self.source is not None:
+            self._save_threshold()
+            self._microphone.__exit__(None, None, None)
+            self.source = None
+
+    def _calibrate_loop(self):
+        last_save = 0.0
+        elapsed = 0.0
+        frame_seconds = self.source.CHUNK / self.source.SAMPLE_RATE
+        while not self._stop_event.is_set():
+            # Calibration only reads frames while nobody is listening, and
+            # steps aside as soon as listen() is waiting for the device.
+            if self._listen_pending.is_set():
+                self._stop_event.wait(frame_seconds)
+                continue
+            with self._lock:
+                if self.source is None:
+                    return
+                try:
+                    buffer = self.source.stream.read(self.source.CHUNK)
+                except OSError as e:
+                    logger.warning(f"Microphone calibration read failed: {str(e)}")
+                    buffer = None
+            if buffer is None:
+                self._stop_event.wait(1)
+                continue
+            self._energies.append(audioop.rms(buffer, self.source.SAMPLE_WIDTH))
+            elapsed += frame_seconds
+            if len(self._energies) == self._energies.maxlen:
+                self._update_threshold()
+                if elapsed - last_save >= self.save_interval:
+                    self._save_threshold()
+                    last_save = elapsed
+
+    def _update_threshold(self):
+        # A low percentile tracks the noise floor without being pulled up
+        # by speech that happens between commands.
+        ambient = sorted(self._energies)[len(self._energies) // 5]
+        self.recognizer.energy_threshold = max(
+            self.min_threshold, ambient * self.recognizer.dynamic_energy_ratio
+        )
+
+    def _load_threshold(self):
+        try:
+            with open(self.state_path) as f:
+                return float(json.load(f)["energy_threshold"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_threshold(self):
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.state_path, "w") as f:
+                json.dump({"energy_threshold": self.recognizer.energy_threshold}, f)
+        except OSError as e:
+            logger.warning(f"Could not save microphone state: {str(e)}")
@@ -2,6 +2,7 @@
 import speech_recognition as sr
 from dataclasses import dataclass
 from ..utils import logger, handle_errors
+from .backends import load_backend
 
 @dataclass
 class AudioResult:
@@ -9,21 +10,27 @@ class AudioResult:
     confidence: float = 0.0
 
 class VoiceProcessor:
-    def __init__(self):
+    def __init__(self, backend=None):
         self.recognizer = sr.Recognizer()
         self.recognizer.dynamic_energy_threshold = True
         self.recognizer.energy_threshold = 4000  # Adjust if needed
+
+        self.backend = backend or load_backend(self.recognizer)
         
     @handle_errors
     def process_audio(self, audio_data):
         """Process audio data and return recognized text"""
         try:
-            text = self.recognizer.recognize_google(audio_data)
-            logger.info(f"Recognized text: {text}")
-            return AudioResult(text=text.lower(), confidence=0.9)
+            result = self.backend.transcribe(audio_data)
+            if not result:
+                logger.warning("Could not understand audio")
+                return None
+            text, confidence = result
+            logger.info(f"Recognized text: {text} (confidence {confidence:.2f})")
+            return AudioResult(text=text.lower(), confidence=confidence)
         except sr.UnknownValueError:
             logger.warning("Could not understand audio")
             return None
         except sr.RequestError as e:
             logger.error(f"Could not request results from speech recognition service: {str(e)}")
-            return None 
\ No newline at end of file
+            return None
@@ -1,9 +1,7 @@
 import speech_recognition as sr
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
+from gmail_assistant.gmail_service import CredentialStore, get_gmail_service
+from gmail_assistant.mime_decoder import extract_text
 import os.path
 import nltk
 from nltk.tokenize import word_tokenize, sent_tokenize  
@@ -29,29 +27,20 @@ def speak(text):
     engine.runAndWait()
 
 def authenticate_gmail():
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_config(
-                {
-                    'installed': {
-                        'client_id': GMAIL_CLIENT_ID,
-                        'client_secret': GMAIL_CLIENT_SECRET,
-                        'redirect_uris': [GMAIL_REDIRECT_URI],
-                        'auth_uri': 'https://accounts.googlehttps://www.thaifriendly.com/Xxbeauty57.com/o/oauth2/auth',
-                        'token_uri': 'https://oauth2.googleapis.com/token'
-                    }
-                },
-                SCOPES
-            )
-            creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-    return build('gmail', 'v1', credentials=creds)
+    store = CredentialStore(
+        'token.json',
+        scopes=SCOPES,
+        client_config={
+            'installed': {
+                'client_id': GMAIL_CLIENT_ID,
+                'client_secret': GMAIL_CLIENT_SECRET,
+                'redirect_uris': [GMAIL_REDIRECT_URI],
+                'auth_uri': 'https://accounts.google.com/o/oauth2/auth',
+                'token_uri': 'https://oauth2.googleapis.com/token'
+            }
+        }
+    )
+    return get_gmail_service(store)
 
 def listen_for_command():
     recognizer = sr.Recognizer()
@@ -95,14 +84,9 @@ def read_latest_email():
         subject = next(header['value'] for header in headers if header['name'] == 'Subject')
         sender = next(header['value'] for header in headers if header['name'] == 'From')
 
-        if 'parts' in payload:
-            body = payload['parts'][0]['body']['data']
-        else:
-            body = payload['body']['data']
-
-        body = base64.urlsafe_b64decode(body).decode('utf-8')
+        body = extract_text(payload, limit=100) or ""
 
-        return f"Latest email from {sender}\nSubject: {subject}\n\n{body[:100]}..."
+        return f"Latest email from {sender}\nSubject: {subject}\n\n{body}..."
 
 def send_email():
     recipient = input("To whom would you like to send the email? ")
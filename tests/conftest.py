@@ -13,4 +13,10 @@ def mock_credentials():
         "refresh_token": "test_refresh_token",
         "client_id": "test_client_id",
         "client_secret": "test_client_secret"
-    } 
\ No newline at end of file
+    } 
+
+@pytest.fixture(autouse=True)
+def memory_response_cache(monkeypatch):
+    """Keep LLM responses cached by one test from leaking into another."""
+    from gmail_assistant.llm import response_cache
+    monkeypatch.setattr(response_cache, '_cache', response_cache.ResponseCache())
@@ -0,0 +1,133 @@
+"""Tests for pluggable speech recognition backends."""
+
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+import speech_recognition as sr
+
+from gmail_assistant.error_handler import GmailAssistantError
+from gmail_assistant.voice_processing.backends import (
+    ASRBackend,
+    GoogleBackend,
+    VoskBackend,
+    VoskStream,
+    create_backend,
+    load_backend,
+)
+from gmail_assistant.voice_processing.service import VoiceProcessor
+
+
+class StubBackend(ASRBackend):
+    name = "stub"
+
+    def __init__(self, result):
+        self.result = result
+
+    def transcribe(self, audio_data):
+        return self.result
+
+
+def test_google_backend_reports_service_confidence():
+    recognizer = MagicMock()
+    recognizer.recognize_google.return_value = {
+        "alternative": [{"transcript": "Check Inbox", "confidence": 0.83}]
+    }
+    assert GoogleBackend(recognizer).transcribe("audio") == ("Check Inbox", 0.83)
+    recognizer.recognize_google.assert_called_once_with("audio", show_all=True)
+
+
+def test_google_backend_returns_none_when_nothing_heard():
+    recognizer = MagicMock()
+    recognizer.recognize_google.return_value = []
+    assert GoogleBackend(recognizer).transcribe("audio") is None
+
+
+def test_vosk_result_parsing_averages_word_confidence():
+    raw = json.dumps(
+        {
+            "text": "read email",
+            "result": [{"word": "read", "conf": 1.0}, {"word": "email", "conf": 0.6}],
+        }
+    )
+    assert VoskBackend._parse(raw) == ("read email", pytest.approx(0.8))
+    assert VoskBackend._parse(json.dumps({"text": ""})) is None
+
+
+def test_create_backend_rejects_unknown_name():
+    with pytest.raises(GmailAssistantError):
+        create_backend("nonexistent")
+
+
+def test_voice_processor_uses_backend_confidence():
+    processor = VoiceProcessor(backend=StubBackend(("Send Email", 0.42)))
+    result = processor.process_audio(MagicMock())
+    assert result.text == "send email"
+    assert result.confidence == 0.42
+
+
+def test_voice_processor_returns_none_when_not_understood():
+    assert VoiceProcessor(backend=StubBackend(None)).process_audio(MagicMock()) is None
+
+
+def test_voice_processor_falls_back_to_google():
+    with patch(
+        "gmail_assistant.voice_processing.backends.create_backend",
+        side_effect=GmailAssistantError("no vosk"),
+    ):
+        processor = VoiceProcessor()
+    assert isinstance(processor.backend, GoogleBackend)
+
+
+def test_failed_model_load_falls_back_to_google():
+    with patch(
+        "gmail_assistant.voice_processing.backends.create_backend",
+        side_effect=RuntimeError("corrupt model file"),
+    ):
+        assert isinstance(load_backend(), GoogleBackend)
+
+
+def test_backend_must_implement_transcribe():
+    class Incomplete(ASRBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_buffered_stream_transcribes_whole_utterance():
+    backend = StubBackend(("check inbox", 0.9))
+    backend.transcribe = MagicMock(return_value=("check inbox", 0.9))
+    stream = backend.start_stream()
+    for chunk in (b"\x01\x00" * 10, b"\x02\x00" * 10):
+        assert stream.accept(sr.AudioData(chunk, 16000, 2)) is None
+
+    assert stream.finish() == ("check inbox", 0.9)
+    audio = backend.transcribe.call_args.args[0]
+    assert audio.get_raw_data() == b"\x01\x00" * 10 + b"\x02\x00" * 10
+
+
+def test_vosk_stream_reports_partials_and_segments():
+    recognizer = MagicMock()
+    recognizer.AcceptWaveform.side_effect = [False, True, False]
+    recognizer.PartialResult.side_effect = [
+        json.dumps({"partial": "check"}),
+        json.dumps({"partial": "the"}),
+    ]
+    recognizer.Result.return_value = json.dumps(
+        {"text": "check inbox", "result": [{"conf": 1.0}, {"conf": 0.8}]}
+    )
+    recognizer.FinalResult.return_value = json.dumps(
+        {"text": "then", "result": [{"conf": 0.5}]}
+    )
+
+    stream = VoskStream(recognizer)
+    chunk = sr.AudioData(b"\x00\x00" * 160, 16000, 2)
+    assert [stream.accept(chunk) for _ in range(3)] == [
+        "check",
+        "check inbox",
+        "check inbox the",
+    ]
+    text, confidence = stream.finish()
+    assert text == "check inbox then"
+    assert confidence == pytest.approx(0.7)
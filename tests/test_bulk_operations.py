@@ -0,0 +1,160 @@
+"""Tests for bulk label changes through batchModify."""
+
+from gmail_assistant import command_processor
+from gmail_assistant.bulk_operations import BulkOperations
+from gmail_assistant.command_processor import CommandProcessor
+from gmail_assistant.message_store import MessageStore
+
+
+class Call:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeMessages:
+    """messages() resource over ``count`` matching ids, recording calls."""
+
+    def __init__(self, count):
+        self.ids = [f"m{n}" for n in range(count)]
+        self.lists = []
+        self.modified = []
+        self.deleted = []
+
+    def list(self, userId, q, maxResults, pageToken=None):
+        self.lists.append((q, maxResults, pageToken))
+        start = int(pageToken or 0)
+        end = min(start + maxResults, len(self.ids))
+        result = {"messages": [{"id": id_} for id_ in self.ids[start:end]]}
+        if end < len(self.ids):
+            result["nextPageToken"] = str(end)
+        return Call(result)
+
+    def batchModify(self, userId, body):
+        self.modified.append(body)
+        return Call(None)
+
+    def batchDelete(self, userId, body):
+        self.deleted.append(body)
+        return Call(None)
+
+
+class FakeService:
+    def __init__(self, count):
+        self.messages_resource = FakeMessages(count)
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self.messages_resource
+
+
+def test_mark_read_pages_ids_and_modifies_in_chunks():
+    service = FakeService(2300)
+    progress = []
+    result = BulkOperations(service).mark_read(
+        "from:bob", on_progress=lambda done, total: progress.append((done, total))
+    )
+
+    messages = service.messages_resource
+    assert [q for q, _, _ in messages.lists] == ["from:bob is:unread"] * 5
+    assert [len(body["ids"]) for body in messages.modified] == [1000, 1000, 300]
+    assert messages.modified[0]["removeLabelIds"] == ["UNREAD"]
+    assert "addLabelIds" not in messages.modified[0]
+    assert progress == [(1000, 2300), (2000, 2300), (2300, 2300)]
+    assert (result.matched, result.changed) == (2300, 2300)
+
+
+def test_dry_run_only_counts():
+    service = FakeService(42)
+    result = BulkOperations(service).trash("older_than:1m", dry_run=True)
+    assert (result.matched, result.changed, result.dry_run) == (42, 0, True)
+    assert service.messages_resource.modified == []
+
+
+def test_limit_stops_paging():
+    service = FakeService(2000)
+    result = BulkOperations(service).mark_read("", limit=1)
+    assert service.messages_resource.lists == [("is:unread", 1, None)]
+    assert result.changed == 1
+
+
+def test_trash_and_delete_update_the_store(tmp_path):
+    store = MessageStore(tmp_path / "messages.db")
+    store.upsert_messages(
+        [{"id": "m0", "labelIds": ["INBOX"]}, {"id": "m1", "labelIds": ["INBOX"]}]
+    )
+    service = FakeService(1)
+    BulkOperations(service, store).trash("from:bob")
+    assert service.messages_resource.modified == [
+        {"addLabelIds": ["TRASH"], "ids": ["m0"]}
+    ]
+    assert [m["id"] for m in store.list_messages("TRASH")] == ["m0"]
+
+    BulkOperations(service, store).delete("from:bob")
+    assert service.messages_resource.deleted == [{"ids": ["m0"]}]
+    assert not store.has_message("m0")
+    assert store.has_message("m1")
+
+
+def test_voice_commands_build_bulk_queries():
+    processor = CommandProcessor()
+    processor.set_gmail_service(FakeService(3))
+    messages = processor.gmail_service.messages_resource
+
+    response = processor.process_command(
+        "trash everything older than a month in promotions"
+    ).response
+    assert response == (
+        "3 emails matching 'older_than:1m category:promotions' "
+        "will be moved to trash. Say yes to confirm."
+    )
+    assert messages.modified == []
+    response = processor.process_command("yes").response
+    assert (
+        response
+        == "Moved 3 emails matching 'older_than:1m category:promotions' to trash."
+    )
+
+    response = processor.process_command("preview delete all emails from bob").response
+    assert response == "3 emails matching 'from:bob' would be moved to trash."
+    assert len(messages.modified) == 1
+
+    response = processor.process_command("mark all from bob as read").response
+    assert response == "Marked 3 emails as read."
+    assert messages.lists[-1][0] == "from:bob is:unread"
+
+
+def test_bulk_trash_is_cancelled_by_any_other_command(monkeypatch):
+    processor = CommandProcessor()
+    processor.set_gmail_service(FakeService(3))
+    messages = processor.gmail_service.messages_resource
+
+    processor.process_command("delete all emails in inbox")
+    processor.process_command("no, don't")
+    assert processor.process_command("yes").intent == "unknown"
+
+    processor.process_command("delete all emails in inbox")
+    monkeypatch.setattr(command_processor, "CONFIRM_TIMEOUT", -1)
+    processor.process_command("delete all emails in inbox")
+    assert processor.process_command("yes").intent == "unknown"
+    assert messages.modified == []
+
+
+def test_bulk_trash_needs_a_filter():
+    processor = CommandProcessor()
+    processor.set_gmail_service(FakeService(3))
+    response = processor.process_command("delete everything").response
+    assert response.startswith("Please say which emails to trash")
+    assert processor.gmail_service.messages_resource.modified == []
+
+
+def test_age_phrases():
+    assert CommandProcessor._age_after("older than 2 weeks".split(), "older") == "14d"
+    assert CommandProcessor._age_after("newer than three days".split(), "newer") == "3d"
+    assert CommandProcessor._age_after("older than a year".split(), "older") == "1y"
+    assert CommandProcessor._age_after("older than month".split(), "older") == "1m"
+    assert CommandProcessor._age_after("older than usual".split(), "older") is None
@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import Mock, patch
 from gmail_assistant.command_processor import CommandProcessor
 
+
 class TestCommandProcessor(unittest.TestCase):
     def setUp(self):
         self.processor = CommandProcessor()
@@ -45,4 +46,49 @@ class TestCommandProcessor(unittest.TestCase):
         for command in commands:
             with self.subTest(command=command):
                 result = self.processor.process_command(command)
-                self.assertEqual(result.intent, "unknown") 
\ No newline at end of file
+                self.assertEqual(result.intent, "unknown") 
+
+    def test_search_query_comes_from_slots(self):
+        """Test 'find' and 'look for' searches use the extracted query"""
+        self.processor.set_gmail_service(Mock())
+        self.processor.message_fetcher = Mock()
+        self.processor.message_fetcher.fetch_headers.return_value = []
+        messages = self.processor.gmail_service.users().messages()
+        messages.list.return_value.execute.return_value = {}
+        for command in ["find invoices", "look for invoices", "search for invoices"]:
+            with self.subTest(command=command):
+                result = self.processor.process_command(command)
+                self.assertEqual(result.response, "No emails found matching 'invoices'")
+                self.assertEqual(messages.list.call_args.kwargs['q'], 'invoices')
+
+    def test_weak_destructive_match_does_not_run(self):
+        """Test commands that merely mention deleting change nothing"""
+        self.processor.set_gmail_service(Mock())
+        self.processor.commands['delete_email'] = Mock()
+        result = self.processor.process_command("do not delete anything")
+        self.assertIsNone(result.response)
+        self.processor.commands['delete_email'].assert_not_called()
+
+    def test_search_falls_back_to_gmail_when_store_may_be_incomplete(self):
+        """Test a short page of local hits is not reported as all matches"""
+        self.processor.set_gmail_service(Mock())
+        self.processor.message_fetcher = Mock()
+        self.processor.message_fetcher.fetch_headers.return_value = [
+            {'id': 'old', 'from': 'bob@example.com', 'subject': 'March invoice',
+             'date': 'Mon, 3 Mar 2025'}]
+        store = Mock()
+        store.search.return_value = ([], 0)
+        store.unindexed_ids.return_value = []
+        store.oldest_date.return_value = None
+        self.processor.set_message_store(store)
+        messages = self.processor.gmail_service.users().messages()
+        messages.list.return_value.execute.return_value = {
+            'messages': [{'id': 'old'}], 'resultSizeEstimate': 1}
+
+        result = self.processor.process_command("search for invoices")
+        self.assertEqual(
+            result.response,
+            "Found 1 emails matching 'invoices':\n\n"
+            "From: bob@example.com\nDate: Mon, 3 Mar 2025\nSubject: March invoice\n"
+            + "-" * 50 + "\n")
+        self.assertEqual(messages.list.call_args.kwargs['q'], 'invoices')
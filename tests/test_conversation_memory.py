@@ -0,0 +1,107 @@
+"""Tests for the token-budgeted conversation memory."""
+
+import threading
+
+from gmail_assistant.conversation_memory import ConversationMemory, estimate_tokens
+
+
+def word_count(text):
+    return len(text.split())
+
+
+def joined_summary(summary, turns):
+    users = [turn.user for turn in turns]
+    return " ".join(([summary] if summary else []) + users)
+
+
+def test_exchanges_within_budget_are_kept():
+    memory = ConversationMemory(
+        word_count, joined_summary, budget=100, background=False
+    )
+    memory.add("hello", "hi there")
+    memory.add("how are you", "fine")
+    assert [turn.user for turn in memory.turns] == ["hello", "how are you"]
+    assert memory.summary == ""
+
+
+def test_over_budget_compacts_all_but_recent_turns():
+    # Each exchange is its two words plus the four template tokens
+    memory = ConversationMemory(
+        word_count, joined_summary, budget=20, keep_turns=2, background=False
+    )
+    for turn in range(6):
+        memory.add(f"q{turn}", f"a{turn}")
+    assert [turn.user for turn in memory.turns] == ["q4", "q5"]
+    assert memory.summary == "q0 q1 q2 q3"
+    assert memory.tokens <= 20
+
+
+def test_summary_accumulates():
+    memory = ConversationMemory(
+        word_count, joined_summary, budget=12, keep_turns=1, background=False
+    )
+    for turn in range(8):
+        memory.add(f"q{turn}", f"a{turn}")
+    assert memory.summary == "q0 q1 q2 q3 q4 q5"
+    assert [turn.user for turn in memory.turns] == ["q6", "q7"]
+
+
+def test_failed_summary_still_drops_turns():
+    def broken(summary, turns):
+        raise RuntimeError("model down")
+
+    memory = ConversationMemory(
+        word_count, broken, budget=12, keep_turns=1, background=False
+    )
+    for turn in range(3):
+        memory.add(f"q{turn}", f"a{turn}")
+    assert memory.summary == ""
+    assert memory.tokens <= 12
+
+
+def test_ring_buffer_overflow_is_summarized_later():
+    release = threading.Event()
+
+    def slow(summary, turns):
+        release.wait(2)
+        return joined_summary(summary, turns)
+
+    memory = ConversationMemory(word_count, slow, budget=12, keep_turns=1, max_turns=3)
+    for turn in range(6):
+        memory.add(f"q{turn}", f"a{turn}")
+    assert len(memory.turns) == 3
+    release.set()
+    memory.wait(2)
+    # A turn that fell out of the buffer triggers the next compaction
+    memory.add("q6", "a6")
+    memory.wait(2)
+    assert memory.summary.split() == [f"q{turn}" for turn in range(6)]
+    assert [turn.user for turn in memory.turns] == ["q6"]
+
+
+def test_oversized_recent_turns_are_cut_to_the_budget():
+    memory = ConversationMemory(summarize=joined_summary, budget=2048, background=False)
+    for turn in range(4):
+        memory.add(f"q{turn} " + "x" * 4000, f"a{turn} " + "y" * 4000)
+    assert memory.tokens <= 2048
+    turns = memory.turns
+    assert turns[-1].user.startswith("q3")
+    # The oldest exchanges give way first
+    assert [len(turn.user) for turn in turns] == sorted(
+        len(turn.user) for turn in turns
+    )
+    assert memory.summary == ""
+
+
+def test_clear():
+    memory = ConversationMemory(
+        word_count, joined_summary, budget=6, keep_turns=0, background=False
+    )
+    memory.add("q0", "a0")
+    memory.clear()
+    assert memory.turns == [] and memory.summary == ""
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 40) == 11
@@ -0,0 +1,222 @@
+"""Tests for the shared Gmail client and its credential store."""
+
+import pickle
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import httplib2
+import pytest
+from google.oauth2.credentials import Credentials
+
+from gmail_assistant import gmail_service
+from gmail_assistant.gmail_service import (
+    CredentialStore,
+    HttpPool,
+    build_service,
+    discovery_document,
+)
+
+
+def make_store(token_path):
+    return CredentialStore(
+        str(token_path), credentials_path="unused.json", scopes=["scope"]
+    )
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class FakeCredentials:
+    """Credentials whose refresh extends the expiry by ``lifetime`` seconds."""
+
+    def __init__(self, expires_in, lifetime=3600):
+        self.expiry = utcnow() + timedelta(seconds=expires_in)
+        self.lifetime = lifetime
+        self.refresh_token = "refresh"
+        self.refreshes = 0
+
+    @property
+    def expired(self):
+        return self.expiry <= utcnow()
+
+    @property
+    def valid(self):
+        return not self.expired
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.expiry = utcnow() + timedelta(seconds=self.lifetime)
+
+
+def authorized_user(expires_in=3600):
+    return Credentials(
+        token="access",
+        refresh_token="refresh",
+        client_id="id",
+        client_secret="secret",
+        token_uri="https://oauth2.googleapis.com/token",
+        expiry=utcnow() + timedelta(seconds=expires_in),
+    )
+
+
+def test_json_token_is_loaded_once_and_saved_as_json(tmp_path):
+    path = tmp_path / "token.json"
+    path.write_text(authorized_user().to_json())
+    store = make_store(path)
+
+    creds = store.get()
+    assert creds.token == "access"
+    path.unlink()
+    assert store.get() is creds
+
+    store._save()
+    assert path.read_text().startswith("{")
+
+
+def test_pickled_token_stays_pickled(tmp_path):
+    path = tmp_path / "token.json"
+    path.write_bytes(pickle.dumps(authorized_user()))
+    store = make_store(path)
+
+    assert store.get().token == "access"
+    store._save()
+    assert pickle.loads(path.read_bytes()).token == "access"
+
+
+def test_expired_token_is_refreshed_and_saved(tmp_path):
+    store = make_store(tmp_path / "token.pickle")
+    store.credentials = FakeCredentials(expires_in=-10)
+
+    assert store.get().refreshes == 1
+    assert pickle.loads((tmp_path / "token.pickle").read_bytes()).valid
+
+
+def test_refresher_refreshes_before_expiry(tmp_path):
+    store = make_store(tmp_path / "token.pickle")
+    creds = store.credentials = FakeCredentials(expires_in=0.3)
+    store.start_refresher(margin=0.2, retry_interval=0.05)
+    try:
+        deadline = time.monotonic() + 2
+        while not creds.refreshes and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert creds.refreshes == 1
+        # The token was still valid when it was refreshed
+        assert store.seconds_until_refresh(margin=0.2) > 3000
+    finally:
+        store.stop()
+
+
+def test_refresher_needs_a_refresh_token(tmp_path):
+    store = make_store(tmp_path / "token.pickle")
+    store.credentials = FakeCredentials(expires_in=60)
+    store.credentials.refresh_token = None
+    assert store.seconds_until_refresh() is None
+    store.start_refresher()
+    store._thread.join(timeout=1)
+    assert not store._thread.is_alive()
+
+
+def test_discovery_document_is_parsed_once():
+    assert discovery_document() is discovery_document()
+    service = build_service(authorized_user())
+    request = service.users().messages().list(userId="me", maxResults=1)
+    assert request.uri.startswith(
+        "https://gmail.googleapis.com/gmail/v1/users/me/messages"
+    )
+
+
+class FakeHttp:
+    """An httplib2.Http that fails if two requests use it at once."""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.busy = False
+        self.overlapped = False
+        self.closed = False
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        if uri.endswith("/fail"):
+            raise ConnectionError("connection reset")
+        self.overlapped |= self.busy
+        self.busy = True
+        time.sleep(self.delay)
+        self.busy = False
+        return (
+            httplib2.Response(
+                {"status": "200", "sent-authorization": headers["authorization"]}
+            ),
+            b"{}",
+        )
+
+    def close(self):
+        self.closed = True
+
+
+def test_pool_never_shares_a_transport_between_requests():
+    transports = []
+
+    def factory():
+        transports.append(FakeHttp())
+        return transports[-1]
+
+    pool = HttpPool(authorized_user(), size=2, http_factory=factory)
+    responses = []
+    threads = [
+        threading.Thread(target=lambda: responses.append(pool.request("https://x/a")))
+        for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert len(responses) == 6
+    assert responses[0][0]["sent-authorization"] == "Bearer access"
+    assert len(transports) == pool.created == 2
+    assert not any(http.overlapped for http in transports)
+
+
+def test_failed_transport_is_replaced():
+    transports = []
+
+    def factory():
+        transports.append(FakeHttp(delay=0))
+        return transports[-1]
+
+    pool = HttpPool(authorized_user(), size=1, http_factory=factory)
+    with pytest.raises(ConnectionError):
+        pool.request("https://x/fail")
+    assert transports[0].closed
+    pool.request("https://x/a")
+    assert len(transports) == 2
+    pool.close()
+    assert transports[1].closed and pool.created == 0
+
+
+def test_service_sends_requests_through_the_pool():
+    service = build_service(authorized_user(), pool_size=3)
+    assert isinstance(service._http, HttpPool)
+    assert service._http.size == 3
+
+
+def test_shared_service_is_built_once_per_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(gmail_service, "_services", {})
+    monkeypatch.setattr(gmail_service, "_store", None)
+    stores = []
+    for name in ("first", "second"):
+        path = tmp_path / f"{name}.json"
+        path.write_text(authorized_user(expires_in=3600).to_json())
+        stores.append(make_store(path))
+    first, second = stores
+    try:
+        service = gmail_service.get_gmail_service(first)
+        assert gmail_service.get_gmail_service(first) is service
+        assert gmail_service.get_gmail_service() is service
+        assert gmail_service.get_gmail_service(second) is not service
+        assert gmail_service.get_credential_store() is first
+        assert first._thread.is_alive() and second._thread.is_alive()
+    finally:
+        first.stop()
+        second.stop()
@@ -0,0 +1,65 @@
+"""Tests for the pooled Ollama HTTP client."""
+
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from gmail_assistant.llm.http_client import OllamaClient
+from gmail_assistant.llm.service import LLMService
+
+
+def test_post_reuses_session_with_split_timeouts():
+    client = OllamaClient(
+        base_url="http://ollama:11434/", connect_timeout=1, read_timeout=30
+    )
+    with patch.object(client.session, "post") as mock_post:
+        client.post("/api/generate", {"prompt": "hi"})
+        client.post("/api/generate", {"prompt": "again"}, timeout=(1, 5))
+
+    first, second = mock_post.call_args_list
+    assert first.args == ("http://ollama:11434/api/generate",)
+    assert first.kwargs["timeout"] == (1, 30)
+    assert second.kwargs["timeout"] == (1, 5)
+
+
+def test_adapter_pools_and_retries_connections():
+    client = OllamaClient(pool_size=8, max_retries=3)
+    adapter = client.session.get_adapter("http://localhost:11434")
+    assert adapter._pool_maxsize == 8
+    assert adapter.max_retries.connect == 3
+    assert adapter.max_retries.read == 0
+
+
+def test_generation_is_not_retried_after_a_gateway_error():
+    retry = OllamaClient(max_retries=3).session.get_adapter("http://x").max_retries
+    assert retry.is_retry("GET", 503)
+    assert not retry.is_retry("POST", 503)
+
+
+def test_check_health_marks_unavailable_on_connection_error():
+    client = OllamaClient()
+    with patch.object(
+        client.session, "get", side_effect=requests.exceptions.ConnectionError()
+    ):
+        assert client.check_health() is False
+    assert client.available is False
+
+
+def test_check_health_async_reports_to_callback():
+    client = OllamaClient()
+    callback = MagicMock()
+    with patch.object(client.session, "get") as mock_get:
+        mock_get.return_value.status_code = 200
+        client.check_health_async(callback).join(timeout=5)
+    callback.assert_called_once_with(True)
+    assert client.available is True
+
+
+def test_llm_service_uses_rules_until_ollama_answers():
+    client = MagicMock(available=None)
+    service = LLMService(client=client)
+
+    client.check_health_async.assert_called_once()
+    assert service.is_ollama_available is False
+    assert service.analyze_query("send an email to bob")["query_type"] == "email_send"
+    client.post.assert_not_called()
@@ -0,0 +1,96 @@
+"""Tests for the compiled intent matcher."""
+
+import pytest
+
+from gmail_assistant.intent_engine import (
+    DIRECT_MATCH_SCORE,
+    UNKNOWN,
+    IntentEngine,
+    IntentMatch,
+    tokenize,
+)
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return IntentEngine()
+
+
+@pytest.mark.parametrize(
+    "text,intent",
+    [
+        ("read my email", "read_email"),
+        ("read latest email", "read_email"),
+        ("show my emails", "read_email"),
+        ("compose email", "send_email"),
+        ("new email", "send_email"),
+        ("check inbox", "check_inbox"),
+        ("what's new", "check_inbox"),
+        ("check unread", "list_unread"),
+        ("mark as read", "mark_read"),
+        ("delete the latest email", "delete_email"),
+        ("search for invoices", "search_email"),
+        ("find invoices", "search_email"),
+        ("mark all from bob as read", "mark_read"),
+        ("random text", UNKNOWN),
+        ("do not delete anything", UNKNOWN),
+        ("don't delete my email", UNKNOWN),
+        ("what did bob send me", UNKNOWN),
+        ("mark my words", UNKNOWN),
+    ],
+)
+def test_intents(engine, text, intent):
+    assert engine.match(text).intent == intent
+
+
+def test_longer_phrase_outranks_shorter(engine):
+    # "mark as read" contains the weak phrase "read"
+    match = engine.match("please mark as read")
+    assert match.intent == "mark_read"
+    assert match.score == 1.0
+
+
+def test_slots_are_extracted(engine):
+    match = engine.match("search for invoices from alice since 2024-01-01 page 2")
+    assert match.slots == {
+        "query": "invoices",
+        "sender": "alice",
+        "after": "2024-01-01",
+        "page": 2,
+    }
+
+    match = engine.match("read email from bob subject project update")
+    assert match.slots == {"sender": "bob", "subject": "project update"}
+
+    assert engine.match("send an email to carol").slots == {"recipient": "carol"}
+    assert engine.match("read last three emails").slots == {"count": 3}
+
+
+def test_weak_match_scores_lower(engine):
+    assert engine.match("read last 3 emails").score < engine.match("read email").score
+
+
+def test_weak_matches_cannot_change_mail(engine):
+    weather = engine.match("check the weather")
+    assert weather.intent == "read_email"
+    assert weather.score < DIRECT_MATCH_SCORE
+    assert weather.runnable
+
+    assert IntentMatch("delete_email", score=0.75).runnable is False
+    assert engine.match("delete the latest email").runnable
+
+
+def test_unknown_has_no_score(engine):
+    match = engine.match("do something")
+    assert not match.matched
+    assert match.score == 0.0
+
+
+def test_tokenize_applies_synonyms():
+    assert tokenize("Check my E-mail messages!") == ["check", "my", "email", "email"]
+
+
+def test_custom_phrases():
+    engine = IntentEngine({"archive": ["archive", "archive email"]}, {})
+    assert engine.match("archive this email").intent == "archive"
+    assert engine.match("read email").intent == UNKNOWN
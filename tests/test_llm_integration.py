@@ -7,7 +7,7 @@ class TestOllamaIntegration:
     def ollama_handler(self):
         return OllamaHandler()
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_command_analysis(self, mock_post, ollama_handler):
         """Test LLM command analysis"""
         mock_post.return_value.json.return_value = {
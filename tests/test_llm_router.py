@@ -0,0 +1,321 @@
+"""Tests for LLM backends and latency-aware routing, against stub servers."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock
+
+import pytest
+
+from gmail_assistant.error_handler import GmailAssistantError
+from gmail_assistant.llm.backends import LLMBackend, OllamaBackend, create_backends
+from gmail_assistant.llm.http_client import OllamaClient
+from gmail_assistant.llm.response_cache import ResponseCache
+from gmail_assistant.llm.router import LatencyStats, LLMRouter
+from gmail_assistant.llm.service import INTENT_SCHEMA, LLMService
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server.requests.append((self.path, payload))
+        time.sleep(server.delay)
+        if server.fail:
+            self.send_response(500)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        if self.path == "/api/embeddings":
+            self.wfile.write(json.dumps({"embedding": [0.5, 0.25]}).encode())
+        elif payload.get("format") == "json":
+            self.wfile.write(
+                json.dumps({"response": server.reply, "done": True}).encode()
+            )
+        elif payload["stream"]:
+            for word in server.reply.split():
+                self.wfile.write(
+                    json.dumps({"response": word + " ", "done": False}).encode() + b"\n"
+                )
+            self.wfile.write(
+                json.dumps({"response": "", "done": True}).encode() + b"\n"
+            )
+        else:
+            self.wfile.write(
+                json.dumps({"response": server.reply, "done": True}).encode()
+            )
+
+    def log_message(self, *args):
+        pass
+
+
+def stub_server(reply, delay=0.0):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+    server.reply = reply
+    server.delay = delay
+    server.fail = False
+    server.requests = []
+    threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    ).start()
+    return server
+
+
+def stub_backend(server, name):
+    client = OllamaClient(
+        base_url=f"http://127.0.0.1:{server.server_port}", max_retries=0
+    )
+    backend = OllamaBackend(client=client)
+    backend.name = name
+    return backend
+
+
+@pytest.fixture
+def servers():
+    fast = stub_server("fast reply")
+    slow = stub_server("slow reply", delay=0.05)
+    yield fast, slow
+    for server in (fast, slow):
+        server.shutdown()
+        server.server_close()
+
+
+def test_ollama_backend_maps_options(servers):
+    fast, _ = servers
+    backend = stub_backend(fast, "fast")
+    assert (
+        backend.generate("hi", max_tokens=5, temperature=0, stop=["\n"]) == "fast reply"
+    )
+    assert list(backend.stream("hi")) == ["fast ", "reply "]
+    assert backend.embed("hi") == [0.5, 0.25]
+    path, payload = fast.requests[0]
+    assert path == "/api/generate"
+    assert payload["options"] == {"num_predict": 5, "temperature": 0, "stop": ["\n"]}
+
+
+def test_router_prefers_the_faster_backend(servers):
+    fast, slow = servers
+    router = LLMRouter([stub_backend(slow, "slow"), stub_backend(fast, "fast")])
+    # Both get measured once, then the fast one takes over
+    answers = [router.generate("hi") for _ in range(4)]
+    assert answers == ["slow reply", "fast reply", "fast reply", "fast reply"]
+    report = router.report()
+    assert report["fast.generate"]["p50"] < report["slow.generate"]["p50"]
+    assert report["fast.generate"]["requests"] == 3
+
+
+def test_router_falls_back_and_skips_failing_backend(servers):
+    fast, slow = servers
+    fast.fail = True
+    router = LLMRouter(
+        [stub_backend(fast, "fast"), stub_backend(slow, "slow")], retry_after=60
+    )
+    assert router.generate("hi") == "slow reply"
+    assert router.generate("hi") == "slow reply"
+    # The failing backend was only tried the first time
+    assert len(fast.requests) == 1
+    assert router.report()["fast.generate"]["error_rate"] == 1.0
+
+
+def test_unhealthy_backend_is_retried_after_cooldown(servers):
+    fast, slow = servers
+    now = [0.0]
+    router = LLMRouter(
+        [stub_backend(fast, "fast"), stub_backend(slow, "slow")],
+        retry_after=30,
+        clock=lambda: now[0],
+    )
+    fast.fail = True
+    router.generate("hi")
+    fast.fail = False
+    router.generate("hi")
+    assert len(fast.requests) == 1
+    now[0] = 31
+    assert router.generate("hi") == "fast reply"
+
+
+def test_stream_falls_back_before_first_token(servers):
+    fast, slow = servers
+    fast.fail = True
+    router = LLMRouter([stub_backend(fast, "fast"), stub_backend(slow, "slow")])
+    assert "".join(router.stream("hi")) == "slow reply "
+
+
+def test_all_backends_failing_raises(servers):
+    fast, slow = servers
+    fast.fail = slow.fail = True
+    router = LLMRouter([stub_backend(fast, "fast"), stub_backend(slow, "slow")])
+    with pytest.raises(GmailAssistantError, match="All LLM backends failed"):
+        router.generate("hi")
+
+
+def test_embed_skips_backends_without_embeddings(servers):
+    fast, _ = servers
+
+    class TextOnly(LLMBackend):
+        name = "text_only"
+
+    router = LLMRouter([TextOnly(), stub_backend(fast, "fast")])
+    assert router.embed("hi") == [0.5, 0.25]
+    assert "text_only.embed" not in router.report()
+
+
+def test_latency_percentiles():
+    stats = LatencyStats(window=200)
+    for ms in range(1, 101):
+        stats.record(ms / 1000, True)
+    stats.record(5.0, False)
+    # Failed requests count towards the error rate, not the latency
+    assert stats.p50 == 0.05
+    assert stats.p95 == 0.095
+    assert stats.count == 101
+    assert stats.error_rate == pytest.approx(1 / 101)
+
+
+def test_create_backends_by_name():
+    assert [backend.name for backend in create_backends(["ollama", " llama_cpp"])] == [
+        "ollama",
+        "llama_cpp",
+    ]
+    with pytest.raises(GmailAssistantError):
+        create_backends(["nope"])
+
+
+def test_service_streams_through_router(servers):
+    fast, _ = servers
+    service = LLMService(
+        client=OllamaClient(base_url="http://127.0.0.1:1", max_retries=0),
+        router=LLMRouter([stub_backend(fast, "fast")]),
+    )
+    assert "".join(service.stream_improve_writing("hello")) == "fast reply "
+    assert service.improve_writing("hello") == "fast reply"
+
+
+def test_json_mode_falls_back_on_invalid_json(servers):
+    fast, slow = servers
+    fast.reply = "Sure! Here is the JSON"
+    slow.reply = json.dumps({"intent": "help", "slots": {}, "confidence": 1})
+    router = LLMRouter([stub_backend(fast, "fast"), stub_backend(slow, "slow")])
+    assert router.generate_json("hi", INTENT_SCHEMA, max_tokens=96)["intent"] == "help"
+    payload = fast.requests[0][1]
+    assert payload["format"] == "json"
+    assert payload["options"]["num_predict"] == 96
+
+
+def analysis_service(*replies):
+    backend = MagicMock()
+    backend.name = "stub"
+    backend.generate_json.side_effect = list(replies)
+    return (
+        LLMService(
+            client=MagicMock(), cache=ResponseCache(), router=LLMRouter([backend])
+        ),
+        backend,
+    )
+
+
+def test_analysis_uses_structured_output():
+    service, backend = analysis_service(
+        {
+            "intent": "search_email",
+            "slots": {"query": "invoices", "page": 2, "bogus": "x"},
+            "confidence": 0.85,
+        }
+    )
+    analysis = service.analyze_query("dig up those invoices for me")
+    assert analysis == {
+        "query_type": "email_search",
+        "parameters": {"query": "invoices", "page": 2},
+        "confidence": 0.85,
+    }
+    assert backend.generate_json.call_args.args[1] is INTENT_SCHEMA
+
+
+def test_malformed_analysis_falls_back_to_rules_and_is_not_cached():
+    service, backend = analysis_service(
+        {"intent": "launch_rocket", "slots": {}, "confidence": 1},
+        {"intent": "unknown", "slots": {}, "confidence": 0.9},
+    )
+    assert service.analyze_query("hmm what")["query_type"] == "unknown"
+    assert service.analyze_query("hmm what") == {
+        "query_type": "unknown",
+        "parameters": {},
+        "confidence": 0.0,
+    }
+    assert backend.generate_json.call_count == 2
+
+
+def test_confident_match_never_reaches_the_model():
+    service, backend = analysis_service()
+    assert service.analyze_query("send an email to bob")["query_type"] == "email_send"
+    backend.generate_json.assert_not_called()
+
+
+def test_slow_analysis_is_cut_off_at_the_budget():
+    release = threading.Event()
+
+    def slow_answer(*args, **kwargs):
+        release.wait(2)
+        return {
+            "intent": "search_email",
+            "slots": {"query": "invoices"},
+            "confidence": 0.9,
+        }
+
+    service, backend = analysis_service()
+    backend.generate_json.side_effect = slow_answer
+    service.analysis_budget = 0.05
+
+    started = time.monotonic()
+    assert service.analyze_query("dig up those invoices")["query_type"] == "unknown"
+    assert time.monotonic() - started < 0.5
+
+    # The late answer is kept, and the same command is then answered from it
+    release.set()
+    deadline = time.monotonic() + 2
+    while service._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert (
+        service.analyze_query("dig up those invoices")["query_type"] == "email_search"
+    )
+    assert backend.generate_json.call_count == 1
+
+
+def test_analysis_is_not_queued_behind_another():
+    release = threading.Event()
+
+    def slow_answer(*args, **kwargs):
+        release.wait(2)
+        return {
+            "intent": "search_email",
+            "slots": {"query": "invoices"},
+            "confidence": 0.9,
+        }
+
+    service, backend = analysis_service()
+    backend.generate_json.side_effect = slow_answer
+    service.analysis_budget = 0.05
+
+    assert service.analyze_query("dig up those invoices")["query_type"] == "unknown"
+    assert service.analyze_query("hmm what now")["query_type"] == "unknown"
+    release.set()
+    deadline = time.monotonic() + 2
+    while service._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert backend.generate_json.call_count == 1
+
+
+def test_queued_analysis_is_cancelled_at_the_budget():
+    service, backend = analysis_service()
+    blocker = threading.Event()
+    service._executor.submit(blocker.wait, 2)
+    service.analysis_budget = 0.05
+
+    assert service.analyze_query("dig up those invoices")["query_type"] == "unknown"
+    blocker.set()
+    assert service._pending == {}
+    service._executor.shutdown(wait=True)
+    backend.generate_json.assert_not_called()
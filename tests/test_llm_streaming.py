@@ -0,0 +1,132 @@
+"""Tests for streamed LLM output helpers."""
+
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from gmail_assistant.llm.ollama_handler import OllamaHandler
+from gmail_assistant.llm.streaming import (
+    iter_in_background,
+    iter_ndjson_tokens,
+    iter_sentences,
+    speak_stream,
+)
+
+
+def ndjson_response(tokens):
+    lines = [
+        json.dumps({"response": token, "done": False}).encode() for token in tokens
+    ]
+    lines.append(json.dumps({"response": "", "done": True}).encode())
+    response = MagicMock()
+    response.iter_lines.return_value = iter(lines)
+    return response
+
+
+def test_iter_ndjson_tokens_stops_at_done():
+    response = ndjson_response(["Hello", " there"])
+    assert list(iter_ndjson_tokens(response)) == ["Hello", " there"]
+    response.close.assert_called_once()
+
+
+def test_iter_ndjson_tokens_raises_stream_errors():
+    response = MagicMock()
+    response.iter_lines.return_value = iter([b'{"error": "model not found"}'])
+    with pytest.raises(RuntimeError):
+        list(iter_ndjson_tokens(response))
+
+
+def test_iter_sentences_groups_tokens():
+    tokens = [
+        "You have",
+        " three new",
+        " emails.",
+        " The first",
+        " is from Bob.",
+        " Ok.",
+        " Bye",
+    ]
+    assert list(iter_sentences(tokens)) == [
+        "You have three new emails.",
+        "The first is from Bob.",
+        "Ok. Bye",
+    ]
+
+
+def test_iter_sentences_splits_run_on_text():
+    pieces = list(iter_sentences(["word "] * 100, max_length=50))
+    assert all(len(piece) <= 50 for piece in pieces)
+    assert " ".join(pieces).split() == ["word"] * 100
+
+
+def test_iter_in_background_reraises_errors():
+    def failing():
+        yield "a"
+        raise ValueError("boom")
+
+    items = iter_in_background(failing())
+    assert next(items) == "a"
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_speak_stream_speaks_each_sentence():
+    spoken, shown = [], []
+    tokens = ["You have", " three new", " emails.", " The first", " is from Bob."]
+    text = speak_stream(tokens, spoken.append, on_text=shown.append)
+    assert spoken == shown == ["You have three new emails.", "The first is from Bob."]
+    assert text == "You have three new emails. The first is from Bob."
+
+
+def test_stop_closes_the_stream():
+    stop = threading.Event()
+    closed = threading.Event()
+    produced = []
+
+    def tokens():
+        try:
+            for n in range(1000):
+                produced.append(n)
+                time.sleep(0.001)
+                yield f"Sentence number {n}. "
+        finally:
+            closed.set()
+
+    def speak(sentence):
+        if len(spoken) == 2:
+            stop.set()
+        spoken.append(sentence)
+
+    spoken = []
+    text = speak_stream(tokens(), speak, stop=stop)
+    assert closed.wait(1)
+    assert len(spoken) == 3 and text == " ".join(spoken)
+    assert len(produced) < 1000
+
+
+def test_closing_the_consumer_stops_the_producer():
+    closed = threading.Event()
+
+    def tokens():
+        try:
+            while True:
+                time.sleep(0.001)
+                yield "token"
+        finally:
+            closed.set()
+
+    items = iter_in_background(tokens())
+    assert next(items) == "token"
+    items.close()
+    assert closed.wait(1)
+
+
+@patch("requests.Session.post")
+def test_ollama_handler_stream(mock_post):
+    mock_post.return_value = ndjson_response(["Read", " email"])
+    tokens = list(OllamaHandler().stream("read my email"))
+    assert tokens == ["Read", " email"]
+    assert mock_post.call_args.kwargs["json"]["stream"] is True
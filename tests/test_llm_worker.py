@@ -0,0 +1,299 @@
+"""Tests for the llama.cpp worker process protocol."""
+
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+from gmail_assistant import llm_service, llm_worker
+from gmail_assistant.error_handler import GmailAssistantError
+from gmail_assistant.llm_service import LLMService
+from gmail_assistant.llm_worker import LLMWorker, LLMWorkerClient, load_authkey
+
+KEY = b"test key"
+
+
+class FakeLlama:
+    """Stream the prompt back word by word, recording call overlap."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.calls = []
+        self.tokens = []
+        self.evaluated = 0
+        self.loaded = 0
+
+    def tokenize(self, text, add_bos=True):
+        return text.decode().split()
+
+    def reset(self):
+        self.tokens = []
+
+    def eval(self, tokens):
+        self.evaluated += len(tokens)
+        self.tokens += tokens
+
+    def save_state(self):
+        return {"tokens": list(self.tokens)}
+
+    def load_state(self, state):
+        self.loaded += 1
+        self.tokens = list(state["tokens"])
+
+    def __call__(self, prompt, stream=False, echo=False, **options):
+        self.calls.append((prompt, options))
+        if prompt == "fail":
+            raise RuntimeError("model exploded")
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            for word in prompt.split():
+                time.sleep(self.delay)
+                yield {"choices": [{"text": word + " "}]}
+        finally:
+            self.running -= 1
+
+
+def free_address():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()
+
+
+def client_for(worker):
+    return LLMWorkerClient(worker.address, authkey=KEY)
+
+
+@pytest.fixture
+def worker(tmp_path):
+    llm = FakeLlama()
+    worker = LLMWorker(
+        llm,
+        address=("127.0.0.1", 0),
+        authkey=KEY,
+        idle_timeout=0,
+        state_dir=tmp_path / "states",
+    )
+    thread = threading.Thread(target=worker.serve_forever, daemon=True)
+    thread.start()
+    assert worker.listening.wait(2)
+    yield worker
+    worker.shutdown()
+    thread.join(timeout=2)
+    assert not thread.is_alive()
+
+
+def test_stream_and_generate(worker):
+    client = client_for(worker)
+    assert list(client.stream("hello there")) == ["hello ", "there "]
+    assert client.generate("one two three", max_tokens=5, bogus=1) == "one two three "
+    assert worker.llm.calls[-1] == ("one two three", {"max_tokens": 5})
+
+
+def test_concurrent_requests_are_generated_one_at_a_time(worker):
+    worker.llm.delay = 0.01
+    client = client_for(worker)
+    results = {}
+
+    def ask(name):
+        results[name] = client.generate(f"{name} a b c")
+
+    threads = [threading.Thread(target=ask, args=(name,)) for name in ("x", "y", "z")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == {name: f"{name} a b c " for name in ("x", "y", "z")}
+    assert worker.llm.max_running == 1
+
+
+def test_generation_error_is_raised(worker):
+    with pytest.raises(GmailAssistantError, match="model exploded"):
+        client_for(worker).generate("fail")
+
+
+def test_closing_stream_cancels_generation(worker):
+    worker.llm.delay = 0.02
+    client = client_for(worker)
+    tokens = client.stream(" ".join(["word"] * 100))
+    next(tokens)
+    tokens.close()
+
+    # The next request is served without waiting for the 100 words
+    started = time.monotonic()
+    assert client.generate("quick") == "quick "
+    assert time.monotonic() - started < 1
+
+
+def test_json_schema_is_compiled_into_a_grammar_once(worker):
+    compiled = []
+    worker.grammar_factory = (
+        lambda schema: compiled.append(schema) or f"grammar {len(compiled)}"
+    )
+    client = client_for(worker)
+    schema = {"type": "object"}
+    client.generate("a", json_schema=schema)
+    client.generate("b", json_schema=schema)
+    assert compiled == ['{"type": "object"}']
+    assert worker.llm.calls[-1] == ("b", {"grammar": "grammar 1"})
+
+
+def test_count_tokens(worker):
+    assert client_for(worker).count_tokens("three short words") == 3
+
+
+def test_ping_without_worker():
+    assert not LLMWorkerClient(free_address(), authkey=KEY).ping()
+
+
+def test_client_with_the_wrong_key_is_refused(worker):
+    assert client_for(worker).ping()
+    assert not LLMWorkerClient(worker.address, authkey=b"other key").ping()
+    assert client_for(worker).ping()
+
+
+def test_authkey_is_created_once_for_this_user_only(tmp_path):
+    path = tmp_path / "worker.key"
+    key = load_authkey(path)
+    assert len(key) == 32
+    assert load_authkey(path) == key
+    if sys.platform != "win32":
+        assert path.stat().st_mode & 0o077 == 0
+
+
+def test_frozen_app_serves_the_worker_from_a_thread(monkeypatch):
+    monkeypatch.setattr(sys, "frozen", True, raising=False)
+    monkeypatch.setattr(llm_worker, "load_model", FakeLlama)
+    monkeypatch.setattr(
+        llm_worker.subprocess, "Popen", lambda *a, **k: pytest.fail("spawned")
+    )
+    client = LLMWorkerClient(free_address(), authkey=KEY, start_timeout=5)
+    client.ensure_running()
+    assert client.generate("in process") == "in process "
+    assert client._thread.is_alive()
+
+
+def test_service_keeps_history_over_worker(worker):
+    service = LLMService(client=client_for(worker))
+    assert service.process_conversation("hi")
+    assert "".join(service.stream_conversation("again"))
+    assert [exchange["user"] for exchange in service.conversation_history] == [
+        "hi",
+        "again",
+    ]
+
+
+def test_worker_that_cannot_start_reports_its_log(tmp_path, monkeypatch):
+    monkeypatch.setattr("gmail_assistant.llm_worker.LOG_PATH", tmp_path / "worker.log")
+    monkeypatch.setenv("LLAMA_MODEL_PATH", str(tmp_path / "missing.gguf"))
+    client = LLMWorkerClient(free_address(), authkey=KEY, start_timeout=30)
+    with pytest.raises(GmailAssistantError, match="exited during startup"):
+        client.ensure_running()
+
+
+def test_warm_saves_prefix_state_and_restores_it(tmp_path):
+    first = LLMWorker(FakeLlama(), state_dir=tmp_path, model_id="m")
+    first.warm("system prompt here")
+    assert first.llm.evaluated == 3
+    assert len(list(tmp_path.glob("*/*.state"))) == 1
+
+    second = LLMWorker(FakeLlama(), state_dir=tmp_path, model_id="m")
+    second.warm("system prompt here")
+    assert second.llm.evaluated == 0
+    assert second.llm.tokens == ["system", "prompt", "here"]
+
+    # Another model never sees this state
+    other = LLMWorker(FakeLlama(), state_dir=tmp_path, model_id="other")
+    other.warm("system prompt here")
+    assert other.llm.evaluated == 3
+
+
+def test_worker_starts_from_latest_saved_prefix(tmp_path):
+    LLMWorker(FakeLlama(), state_dir=tmp_path, model_id="m").warm("system prompt")
+    restarted = LLMWorker(FakeLlama(), state_dir=tmp_path, model_id="m")
+    restarted._restore_latest_prefix()
+    assert restarted.llm.tokens == ["system", "prompt"]
+
+
+def test_worker_never_starts_from_another_models_prefix(tmp_path):
+    LLMWorker(FakeLlama(), state_dir=tmp_path, model_id="small:2048").warm(
+        "system prompt"
+    )
+    other = LLMWorker(FakeLlama(), state_dir=tmp_path, model_id="large:4096")
+    other._restore_latest_prefix()
+    assert other.llm.loaded == 0
+
+
+class RecordingClient:
+    def __init__(self):
+        self.prompts = []
+        self.warmed = []
+
+    def ensure_running(self):
+        pass
+
+    def warm(self, prefix):
+        self.warmed.append(prefix)
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+    def generate(self, prompt, **options):
+        if "New exchanges" in prompt:
+            return f"summary of {prompt.count('User:')} exchanges"
+        self.prompts.append(prompt)
+        return f" reply {len(self.prompts)}"
+
+
+def test_conversation_prompts_only_append():
+    client = RecordingClient()
+    service = LLMService(client=client)
+    for turn in range(10):
+        service.process_conversation(f"question {turn}")
+
+    assert all(prompt.startswith(client.warmed[0]) for prompt in client.prompts)
+    for previous, current in zip(client.prompts, client.prompts[1:]):
+        assert current.startswith(previous)
+
+
+def test_long_email_is_clipped_to_the_context_window():
+    client = RecordingClient()
+    service = LLMService(client=client)
+    service.summarize_email("word " * 20000)
+
+    prompt = client.prompts[-1]
+    assert prompt.endswith(" [/INST]")
+    assert (
+        client.count_tokens(prompt) + llm_service.EMAIL_SUMMARY_TOKENS
+        <= llm_worker.N_CTX
+    )
+    assert client.count_tokens(prompt) > llm_worker.N_CTX // 2
+
+
+def test_old_exchanges_are_summarized_in_blocks():
+    client = RecordingClient()
+    service = LLMService(client=client)
+    service.memory.background = False
+    service.memory.budget = 40
+    for turn in range(12):
+        service.process_conversation(f"question {turn}")
+
+    assert service.memory.summary.startswith("summary of")
+    assert service.memory.tokens <= 40
+    assert "Summary of the conversation so far" in client.prompts[-1]
+    assert all(prompt.startswith(client.warmed[0]) for prompt in client.prompts)
+    # Only the prompts right after a compaction stop extending the last one
+    breaks = sum(
+        not current.startswith(previous)
+        for previous, current in zip(client.prompts, client.prompts[1:])
+    )
+    assert 0 < breaks <= 3
+
+    service.clear_conversation()
+    assert service.conversation_history == []
+    assert service.memory.summary == ""
@@ -0,0 +1,148 @@
+"""Tests for batched Gmail message fetching."""
+
+from unittest.mock import MagicMock
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from gmail_assistant.message_fetcher import MessageFetcher, get_headers
+from gmail_assistant.rate_limiter import RateLimiter
+
+
+class FakeBatch:
+    def __init__(self, callback, store, executed):
+        self.callback = callback
+        self.store = store
+        self.executed = executed
+        self.ids = []
+
+    def add(self, request, request_id=None):
+        self.ids.append(request_id)
+
+    def execute(self):
+        self.executed.append(list(self.ids))
+        for message_id in self.ids:
+            if message_id in self.store:
+                self.callback(message_id, self.store[message_id], None)
+            else:
+                self.callback(message_id, None, Exception("not found"))
+
+
+def make_message(message_id, subject):
+    return {
+        "id": message_id,
+        "payload": {
+            "headers": [
+                {"name": "Subject", "value": subject},
+                {"name": "From", "value": "alice@example.com"},
+            ]
+        },
+    }
+
+
+@pytest.fixture
+def service():
+    store = {str(i): make_message(str(i), f"Subject {i}") for i in range(120)}
+    executed = []
+    service = MagicMock()
+    service.new_batch_http_request.side_effect = lambda callback: FakeBatch(
+        callback, store, executed
+    )
+    service.executed = executed
+    return service
+
+
+def test_fetch_uses_one_batch_for_fifty_ids(service):
+    fetcher = MessageFetcher(service)
+    ids = [{"id": str(i)} for i in range(50)]
+
+    messages = fetcher.fetch(ids)
+
+    assert len(service.executed) == 1
+    assert [m["id"] for m in messages] == [str(i) for i in range(50)]
+    service.users().messages().get.assert_called_with(
+        userId="me",
+        id="49",
+        format="metadata",
+        metadataHeaders=["From", "Subject", "Date"],
+    )
+
+
+def test_fetch_splits_large_lists_into_batches(service):
+    fetcher = MessageFetcher(service)
+
+    messages = fetcher.fetch([str(i) for i in range(120)])
+
+    assert [len(batch) for batch in service.executed] == [50, 50, 20]
+    assert len(messages) == 120
+
+
+def test_fetch_skips_failed_messages(service):
+    fetcher = MessageFetcher(service)
+
+    messages = fetcher.fetch(["1", "missing", "2"])
+
+    assert [m["id"] for m in messages] == ["1", "2"]
+
+
+def test_fetch_headers_returns_lowercase_names(service):
+    fetcher = MessageFetcher(service)
+
+    headers = fetcher.fetch_headers(["3"], headers=("From", "Subject"))
+
+    assert headers == [{"id": "3", "subject": "Subject 3", "from": "alice@example.com"}]
+
+
+def test_get_headers_defaults_missing_names():
+    assert get_headers({"payload": {}}) == {}
+
+
+def throttled_error():
+    content = b'{"error": {"code": 429, "errors": [{"reason": "rateLimitExceeded"}]}}'
+    return HttpError(httplib2.Response({"status": 429}), content)
+
+
+def test_throttled_batch_parts_are_fetched_again(service):
+    throttle = {"3": 2, "7": 1}
+    original = service.new_batch_http_request.side_effect
+
+    def new_batch(callback):
+        def on_response(message_id, response, exception):
+            if throttle.get(message_id):
+                throttle[message_id] -= 1
+                response, exception = None, throttled_error()
+            callback(message_id, response, exception)
+
+        return original(on_response)
+
+    service.new_batch_http_request.side_effect = new_batch
+    delays = []
+    limiter = RateLimiter(sleep=delays.append, rand=lambda: 0.5)
+    messages = MessageFetcher(service, limiter=limiter).fetch(
+        [str(i) for i in range(10)]
+    )
+
+    assert [m["id"] for m in messages] == [str(i) for i in range(10)]
+    assert service.executed[1:] == [["3", "7"], ["3"]]
+    assert delays == [0.5, 1.0]
+    assert limiter.throttled == 3
+    assert limiter.rate < limiter.quota_per_second
+
+
+def test_parts_still_throttled_after_retries_are_raised(service):
+    original = service.new_batch_http_request.side_effect
+
+    def new_batch(callback):
+        def on_response(message_id, response, exception):
+            if message_id == "1":
+                response, exception = None, throttled_error()
+            callback(message_id, response, exception)
+
+        return original(on_response)
+
+    service.new_batch_http_request.side_effect = new_batch
+    limiter = RateLimiter(max_retries=2, sleep=lambda delay: None)
+    with pytest.raises(HttpError):
+        MessageFetcher(service, limiter=limiter).fetch(["0", "1"])
+    assert service.executed[1:] == [["1"], ["1"]]
@@ -0,0 +1,237 @@
+"""Tests for the local message store and history sync."""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from gmail_assistant import message_store
+from gmail_assistant.message_store import MessageStore, MessageSync
+
+
+def make_message(message_id, subject, labels, internal_date):
+    return {
+        "id": message_id,
+        "threadId": message_id,
+        "labelIds": labels,
+        "internalDate": str(internal_date),
+        "snippet": f"snippet {message_id}",
+        "payload": {
+            "headers": [
+                {"name": "Subject", "value": subject},
+                {"name": "From", "value": "bob@example.com"},
+            ]
+        },
+    }
+
+
+@pytest.fixture
+def store():
+    store = MessageStore(":memory:")
+    store.upsert_messages(
+        [
+            make_message("a", "Oldest", ["INBOX"], 1),
+            make_message("b", "Unread", ["INBOX", "UNREAD"], 2),
+            make_message("c", "Important", ["INBOX", "UNREAD", "IMPORTANT"], 3),
+            make_message("d", "Trashed", ["TRASH"], 4),
+        ]
+    )
+    return store
+
+
+def test_list_messages_by_label(store):
+    unread = store.list_messages("UNREAD")
+    assert [m["subject"] for m in unread] == ["Important", "Unread"]
+    assert store.count_messages("IMPORTANT") == 1
+
+
+def test_list_messages_by_label_hides_trash(store):
+    store.add_labels("b", ["TRASH"])
+    assert [m["id"] for m in store.list_messages("UNREAD")] == ["c"]
+    assert store.count_messages("UNREAD") == 1
+    assert [m["id"] for m in store.list_messages("TRASH")] == ["d", "b"]
+
+
+def test_list_messages_without_label_hides_trash(store):
+    latest = store.list_messages(limit=1)
+    assert latest == [
+        {
+            "id": "c",
+            "subject": "Important",
+            "from": "bob@example.com",
+            "snippet": "snippet c",
+        }
+    ]
+
+
+def test_label_updates(store):
+    store.remove_labels("b", ["UNREAD"])
+    store.add_labels("a", ["IMPORTANT"])
+    assert [m["id"] for m in store.list_messages("UNREAD")] == ["c"]
+    assert [m["id"] for m in store.list_messages("IMPORTANT")] == ["c", "a"]
+
+
+def test_store_is_ready_after_history_id(store):
+    assert not store.is_ready()
+    store.history_id = 42
+    assert store.is_ready()
+    assert store.history_id == "42"
+
+
+def test_incremental_sync_applies_history(store):
+    store.history_id = 100
+    service = MagicMock()
+    service.users().history().list().execute.return_value = {
+        "historyId": "105",
+        "history": [
+            {"messagesAdded": [{"message": {"id": "e"}}]},
+            {"labelsRemoved": [{"message": {"id": "b"}, "labelIds": ["UNREAD"]}]},
+            {"messagesDeleted": [{"message": {"id": "a"}}]},
+        ],
+    }
+    sync = MessageSync(service, store)
+    new_message = make_message("e", "New", ["INBOX", "UNREAD"], 5)
+
+    with patch.object(sync.fetcher, "fetch", return_value=[new_message]) as fetch:
+        sync.sync()
+
+    fetch.assert_called_once_with(["e"])
+    assert [m["id"] for m in store.list_messages("UNREAD")] == ["e", "c"]
+    assert not store.has_message("a")
+    assert store.history_id == "105"
+
+
+def test_vanished_message_is_skipped_without_full_sync(store):
+    store.history_id = 100
+    service = MagicMock()
+    service.users().history().list().execute.return_value = {
+        "historyId": "101",
+        "history": [{"messagesAdded": [{"message": {"id": "gone"}}]}],
+    }
+    sync = MessageSync(service, store)
+
+    # The fetcher skips the part Gmail answered with 404
+    with patch.object(sync.fetcher, "fetch", return_value=[]), patch.object(
+        sync, "_full_sync"
+    ) as full_sync:
+        sync.sync()
+
+    full_sync.assert_not_called()
+    assert not store.has_message("gone")
+    assert store.has_message("a")
+    assert store.history_id == "101"
+
+
+def test_expired_history_runs_full_sync(store):
+    store.history_id = 1
+    service = MagicMock()
+    service.users().history().list().execute.side_effect = HttpError(
+        MagicMock(status=404), b"Requested entity was not found."
+    )
+    sync = MessageSync(service, store)
+    with patch.object(sync, "_full_sync") as full_sync:
+        sync.sync()
+    full_sync.assert_called_once()
+
+
+def test_first_sync_bootstraps_store():
+    store = MessageStore(":memory:")
+    service = MagicMock()
+    service.users().getProfile().execute.return_value = {"historyId": "7"}
+    service.users().messages().list().execute.return_value = {"messages": [{"id": "x"}]}
+    sync = MessageSync(service, store)
+
+    with patch.object(
+        sync.fetcher, "fetch", return_value=[make_message("x", "Hello", ["INBOX"], 1)]
+    ):
+        sync.sync()
+
+    assert store.history_id == "7"
+    assert store.list_messages("INBOX")[0]["subject"] == "Hello"
+
+
+def test_search_ranks_subject_matches_first(store):
+    store.index_body("a", "the quarterly budget is attached")
+    messages, total = store.search(["budget"])
+    assert total == 1 and messages[0]["id"] == "a"
+
+    store.upsert_messages([make_message("e", "Budget review", ["INBOX"], 5)])
+    messages, total = store.search(["budget"])
+    assert total == 2
+    assert [m["id"] for m in messages] == ["e", "a"]
+
+
+def test_search_keeps_body_after_header_update(store):
+    store.index_body("a", "invoice number 12")
+    store.upsert_messages([make_message("a", "Renamed", ["INBOX"], 1)])
+    messages, _ = store.search(["invoice"])
+    assert [m["subject"] for m in messages] == ["Renamed"]
+
+
+def test_search_pagination_and_filters(store):
+    store.upsert_messages(
+        [make_message(str(i), f"Report {i}", ["INBOX"], 10 + i) for i in range(12)]
+    )
+    first, total = store.search(["report"], limit=5)
+    second, _ = store.search(["report"], limit=5, offset=5)
+    assert total == 12
+    assert len(first) == 5 and not {m["id"] for m in first} & {m["id"] for m in second}
+    assert store.search(sender="bob")[1] == 15
+    assert store.search(["trashed"])[1] == 0
+
+
+def test_broad_search_returns_newest_matches(store, monkeypatch):
+    monkeypatch.setattr(message_store, "MAX_RANKED_HITS", 2)
+    store.upsert_messages(
+        [make_message(f"n{i}", "Newsletter", ["INBOX"], 100 - i) for i in range(5)]
+    )
+    messages, total = store.search(["newsletter"], limit=3)
+    assert total == 5
+    assert [m["id"] for m in messages] == ["n0", "n1", "n2"]
+
+
+def test_oldest_date(store):
+    assert store.oldest_date().timestamp() == pytest.approx(0.001)
+    assert MessageStore(":memory:").oldest_date() is None
+
+
+def test_search_quotes_spoken_operators(store):
+    messages, total = store.search(["important", "OR", "NOT"])
+    assert total == 0
+
+
+def test_unindexed_ids_and_index_bodies(store):
+    assert set(store.unindexed_ids()) == {"a", "b", "c"}
+    sync = MessageSync(MagicMock(), store, body_decoder=lambda m: "decoded body")
+    full = [make_message(i, "x", ["INBOX"], 1) for i in ("c", "b", "a")]
+    with patch.object(sync.fetcher, "fetch", return_value=full):
+        assert sync.index_bodies() == 3
+    assert store.unindexed_ids() == []
+    assert store.search(["decoded"])[1] == 3
+
+
+def test_trashed_messages_leave_search_index(store):
+    assert store.search(["unread"])[1] == 1
+    store.add_labels("b", ["TRASH"])
+    assert store.search(["unread"])[1] == 0
+    store.remove_labels("b", ["TRASH"])
+    assert store.search(["unread"])[1] == 1
+    assert "b" in store.unindexed_ids()
+
+
+def test_summaries_need_matching_content_hash(store):
+    store.save_summary("b", "hash1", "Bob says hi")
+    assert store.get_summary("b", "hash1") == "Bob says hi"
+    assert store.get_summary("b", "hash2") is None
+    store.delete_messages(["b"])
+    assert store.get_summary("b", "hash1") is None
+
+
+def test_unsummarized_ids_only_lists_indexed_bodies(store):
+    assert store.unsummarized_ids("UNREAD") == []
+    store.index_body("b", "body of b")
+    store.index_body("c", "")
+    assert store.unsummarized_ids("UNREAD") == ["b"]
+    assert store.get_body("b") == "body of b"
+    store.save_summary("b", "hash", "summary")
+    assert store.unsummarized_ids("UNREAD") == []
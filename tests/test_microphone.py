@@ -0,0 +1,89 @@
+"""Tests for the long-lived microphone stream."""
+
+import audioop
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from gmail_assistant.voice_processing.microphone import MicrophoneStream
+
+
+class FakeSource:
+    SAMPLE_RATE = 16000
+    CHUNK = 1600
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, level):
+        self.stream = MagicMock()
+        self.stream.read.side_effect = lambda size: audioop.mul(
+            b"\x01\x00" * size, 2, level
+        )
+
+
+@pytest.fixture
+def recognizer():
+    recognizer = MagicMock()
+    recognizer.energy_threshold = 4000
+    recognizer.dynamic_energy_ratio = 1.5
+    return recognizer
+
+
+def open_stream(recognizer, tmp_path, level=1000, **kwargs):
+    microphone = MagicMock()
+    microphone.__enter__.return_value = FakeSource(level)
+    with patch("speech_recognition.Microphone", return_value=microphone):
+        stream = MicrophoneStream(
+            recognizer, state_path=tmp_path / "voice.json", **kwargs
+        )
+        stream.open()
+    return stream
+
+
+def test_first_open_calibrates_once_and_saves(recognizer, tmp_path):
+    stream = open_stream(recognizer, tmp_path)
+    stream.close()
+
+    recognizer.adjust_for_ambient_noise.assert_called_once()
+    assert json.loads((tmp_path / "voice.json").read_text())["energy_threshold"]
+
+
+def test_saved_threshold_skips_calibration(recognizer, tmp_path):
+    (tmp_path / "voice.json").write_text(json.dumps({"energy_threshold": 812}))
+    stream = open_stream(recognizer, tmp_path)
+    stream.close()
+
+    recognizer.adjust_for_ambient_noise.assert_not_called()
+
+
+def test_listen_reuses_open_source(recognizer, tmp_path):
+    (tmp_path / "voice.json").write_text(json.dumps({"energy_threshold": 812}))
+    stream = open_stream(recognizer, tmp_path)
+    source = stream.source
+
+    stream.listen()
+    stream.listen()
+    stream.close()
+
+    assert recognizer.listen.call_count == 2
+    assert all(call.args[0] is source for call in recognizer.listen.call_args_list)
+
+
+def test_background_window_sets_threshold(recognizer, tmp_path):
+    (tmp_path / "voice.json").write_text(json.dumps({"energy_threshold": 5000}))
+    stream = open_stream(recognizer, tmp_path, window_seconds=0.5, min_threshold=10)
+    stream._thread.join(timeout=0.5)
+    stream.close()
+
+    assert recognizer.energy_threshold == pytest.approx(1500, rel=0.01)
+
+
+def test_listen_stream_yields_chunks_and_releases_device(recognizer, tmp_path):
+    (tmp_path / "voice.json").write_text(json.dumps({"energy_threshold": 812}))
+    recognizer.listen.return_value = iter(["chunk-1", "chunk-2"])
+    stream = open_stream(recognizer, tmp_path)
+
+    assert list(stream.listen_stream()) == ["chunk-1", "chunk-2"]
+    assert recognizer.listen.call_args.kwargs["stream"] is True
+    assert not stream._listen_pending.is_set()
+    stream.close()
@@ -0,0 +1,114 @@
+"""Tests for extracting message text from Gmail payloads."""
+
+import base64
+
+import pytest
+
+from gmail_assistant import mime_decoder
+from gmail_assistant.command_processor import CommandProcessor
+from gmail_assistant.mime_decoder import extract_text, iter_decoded, text_part
+
+
+def encode(text, charset="utf-8"):
+    return base64.urlsafe_b64encode(text.encode(charset)).decode()
+
+
+def leaf(mime_type, text, **extra):
+    return dict({"mimeType": mime_type, "body": {"data": encode(text)}}, **extra)
+
+
+def multipart(mime_type, *parts):
+    return {"mimeType": mime_type, "body": {"size": 0}, "parts": list(parts)}
+
+
+def test_plain_text_nested_in_mixed_alternative_is_found():
+    payload = multipart(
+        "multipart/mixed",
+        multipart(
+            "multipart/alternative",
+            leaf("text/html", "<p>html version</p>"),
+            leaf("text/plain", "plain version"),
+        ),
+        leaf("text/plain", "attached notes", filename="notes.txt"),
+    )
+    assert extract_text(payload) == "plain version"
+
+
+def test_html_is_used_when_there_is_no_plain_text():
+    payload = multipart(
+        "multipart/related",
+        leaf(
+            "text/html",
+            "<html><head><style>p {}</style></head>"
+            "<body><p>Hello&nbsp;<b>there</b></p><p>Second</p></body></html>",
+        ),
+        {
+            "mimeType": "image/png",
+            "filename": "logo.png",
+            "body": {"attachmentId": "a1"},
+        },
+    )
+    assert extract_text(payload, limit=100) == "Hello there\nSecond"
+
+
+def test_budget_stops_decoding_early(monkeypatch):
+    calls = []
+    real = mime_decoder.urlsafe_b64decode
+    monkeypatch.setattr(
+        mime_decoder,
+        "urlsafe_b64decode",
+        lambda data: calls.append(len(data)) or real(data),
+    )
+    payload = leaf("text/plain", "word " * 100000)
+
+    text = extract_text(payload, limit=100)
+    assert text == ("word " * 20)[:100]
+    assert len(calls) == 1
+
+
+def test_html_budget_skips_html2text(monkeypatch):
+    import html2text
+
+    monkeypatch.setattr(html2text, "html2text", lambda html: pytest.fail("converted"))
+    payload = leaf("text/html", "<div>" + "<p>paragraph</p>" * 50000 + "</div>")
+    assert extract_text(payload, limit=25) == "paragraph\nparagraph\nparag"
+
+
+def test_without_budget_html_goes_through_html2text():
+    assert (
+        extract_text(leaf("text/html", "<p>Hello <b>world</b></p>")).strip()
+        == "Hello **world**"
+    )
+
+
+def test_multibyte_characters_split_across_chunks():
+    data = encode("é" * 10)
+    assert "".join(iter_decoded(data, chunk_chars=4)) == "é" * 10
+
+
+def test_charset_and_missing_padding():
+    part = {
+        "mimeType": "text/plain",
+        "headers": [
+            {"name": "Content-Type", "value": 'text/plain; charset="ISO-8859-1"'}
+        ],
+        "body": {"data": encode("café", "latin-1").rstrip("=")},
+    }
+    assert extract_text(part) == "café"
+
+
+def test_message_without_text():
+    payload = multipart(
+        "multipart/mixed",
+        {
+            "mimeType": "application/pdf",
+            "filename": "a.pdf",
+            "body": {"attachmentId": "x"},
+        },
+    )
+    assert text_part(payload) is None
+    assert (
+        CommandProcessor()._get_email_content({"payload": payload})
+        == "No content available"
+    )
+    assert CommandProcessor._get_search_text({"payload": payload}) == ""
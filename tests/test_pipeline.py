@@ -0,0 +1,146 @@
+"""Tests for the asyncio command pipeline."""
+
+import asyncio
+import threading
+import time
+
+from gmail_assistant.pipeline import CommandPipeline
+
+
+class ScriptedMicrophone:
+    """Return queued utterances, then nothing."""
+
+    def __init__(self, utterances, delays=None):
+        self.utterances = list(utterances)
+        self.delays = list(delays or [0] * len(self.utterances))
+
+    def __call__(self):
+        if not self.utterances:
+            time.sleep(0.01)
+            return None
+        time.sleep(self.delays.pop(0))
+        return self.utterances.pop(0)
+
+
+def run_pipeline(pipeline, seconds):
+    async def main():
+        runner = asyncio.ensure_future(pipeline.run())
+        await asyncio.sleep(seconds)
+        pipeline.stop()
+        await runner
+
+    asyncio.run(main())
+
+
+def test_commands_flow_through_all_stages():
+    spoken = []
+    pipeline = CommandPipeline(
+        capture=ScriptedMicrophone(["audio-1", "audio-2"]),
+        recognize=lambda audio: audio.replace("audio", "text"),
+        handle=lambda text: f"done {text}",
+        speak=spoken.append,
+    )
+    run_pipeline(pipeline, 0.3)
+    assert spoken == ["done text-1", "done text-2"]
+
+
+def test_capture_overlaps_with_handling():
+    captured_while_handling = threading.Event()
+    handling = threading.Event()
+    microphone = ScriptedMicrophone(["first", "second"], delays=[0, 0.05])
+
+    def capture():
+        audio = microphone()
+        if audio == "second" and handling.is_set():
+            captured_while_handling.set()
+        return audio
+
+    def handle(text):
+        if text == "first":
+            handling.set()
+            time.sleep(0.2)
+            handling.clear()
+        return None
+
+    pipeline = CommandPipeline(capture, lambda audio: audio, handle, lambda text: None)
+    run_pipeline(pipeline, 0.4)
+    assert captured_while_handling.is_set()
+
+
+def test_barge_in_cancels_current_command():
+    spoken = []
+    interrupted = threading.Event()
+
+    def handle(text):
+        if text == "slow":
+            time.sleep(0.3)
+        return f"answer to {text}"
+
+    pipeline = CommandPipeline(
+        capture=ScriptedMicrophone(["slow", "fast"], delays=[0, 0.1]),
+        recognize=lambda audio: audio,
+        handle=handle,
+        speak=spoken.append,
+        interrupt=interrupted.set,
+    )
+    run_pipeline(pipeline, 0.6)
+    assert spoken == ["answer to fast"]
+    assert pipeline.generation == 1
+
+
+def test_say_from_action_reaches_speech_stage():
+    spoken = []
+    pipeline = None
+
+    def handle(text):
+        pipeline.say(f"working on {text}")
+        return None
+
+    pipeline = CommandPipeline(
+        ScriptedMicrophone(["check inbox"]), lambda audio: audio, handle, spoken.append
+    )
+    run_pipeline(pipeline, 0.2)
+    assert spoken == ["working on check inbox"]
+
+
+def test_capture_pauses_while_speaking():
+    spoken = []
+    speaking = threading.Event()
+    heard_while_speaking = threading.Event()
+
+    def capture():
+        if speaking.is_set():
+            heard_while_speaking.set()
+        return microphone()
+
+    def speak(text):
+        speaking.set()
+        time.sleep(0.1)
+        spoken.append(text)
+        speaking.clear()
+
+    microphone = ScriptedMicrophone(["first", "second"], delays=[0, 0.05])
+    pipeline = CommandPipeline(
+        capture, lambda audio: audio, lambda text: f"answer to {text}", speak
+    )
+    run_pipeline(pipeline, 0.5)
+    assert not heard_while_speaking.is_set()
+    assert pipeline.generation == 0
+
+
+def test_audio_overlapping_speech_is_dropped():
+    spoken = []
+
+    def speak(text):
+        time.sleep(0.1)
+        spoken.append(text)
+
+    pipeline = CommandPipeline(
+        capture=ScriptedMicrophone(["first", "echo"], delays=[0, 0.05]),
+        recognize=lambda audio: audio,
+        handle=lambda text: f"answer to {text}",
+        speak=speak,
+    )
+    run_pipeline(pipeline, 0.4)
+    assert spoken == ["answer to first"]
+    assert pipeline.generation == 0
@@ -0,0 +1,95 @@
+"""Tests for prefetching Gmail lookups from partial transcripts."""
+
+import threading
+from unittest.mock import MagicMock
+
+from gmail_assistant.command_processor import CommandProcessor
+from gmail_assistant.prefetch import Prefetcher
+
+
+def test_stable_key_is_fetched_once_and_reused():
+    calls = []
+
+    def lookup(label):
+        calls.append(label)
+        return [label]
+
+    prefetcher = Prefetcher(min_votes=2)
+
+    prefetcher.propose([("inbox", lookup, ("INBOX",))])
+    assert calls == []
+    prefetcher.propose([("inbox", lookup, ("INBOX",))])
+    prefetcher.propose([("inbox", lookup, ("INBOX",))])
+
+    assert prefetcher.get("inbox", lookup, "INBOX") == ["INBOX"]
+    assert calls == ["INBOX"]
+
+
+def test_unstable_key_loses_its_votes():
+    lookup = MagicMock()
+    prefetcher = Prefetcher(min_votes=2)
+    prefetcher.propose([("read", lookup, ())])
+    prefetcher.propose([("unread", lookup, ())])
+    prefetcher.propose([("read", lookup, ())])
+    lookup.assert_not_called()
+
+
+def test_get_without_prefetch_computes_directly():
+    prefetcher = Prefetcher()
+    assert prefetcher.get("missing", lambda x: x * 2, 21) == 42
+
+
+def test_failed_prefetch_is_retried():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise IOError("network down")
+        return "ok"
+
+    prefetcher = Prefetcher(min_votes=1)
+    prefetcher.propose([("key", flaky, ())])
+    assert prefetcher.get("key", flaky) == "ok"
+    assert len(attempts) == 2
+
+
+def test_clear_discards_unused_results():
+    started = threading.Event()
+    prefetcher = Prefetcher(min_votes=1)
+    prefetcher.propose([("key", lambda: started.set() or "stale", ())])
+    started.wait(1)
+    prefetcher.clear()
+    assert prefetcher.get("key", lambda: "fresh") == "fresh"
+
+
+def test_partial_transcript_prefetches_unread_listing():
+    processor = CommandProcessor()
+    processor.set_gmail_service(MagicMock())
+    processor.prefetcher = Prefetcher(min_votes=2)
+    processor._fetch_label = MagicMock(
+        return_value=[{"from": "alice", "subject": "hi"}]
+    )
+
+    processor.prefetch_for("show unread")
+    processor.prefetch_for("show unread emails")
+    response = processor._handle_unread(
+        ["show", "unread", "emails"],
+        processor.intent_engine.match("show unread emails"),
+    )
+
+    processor._fetch_label.assert_called_once_with(
+        "UNREAD", "is:unread", 5, ("From", "Subject")
+    )
+    assert "alice" in response
+
+
+def test_partial_read_uses_final_query():
+    processor = CommandProcessor()
+    processor.set_gmail_service(MagicMock())
+    processor.prefetcher = Prefetcher(min_votes=1)
+    processor._fetch_messages = MagicMock(return_value=[])
+
+    processor.prefetch_for("read email from bob")
+    processor.prefetcher._executor.shutdown(wait=True)
+    processor._fetch_messages.assert_called_once_with("from:bob", 1)
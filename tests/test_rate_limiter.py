@@ -0,0 +1,159 @@
+"""Tests for Gmail quota pacing and throttling backoff."""
+
+import json
+
+import pytest
+
+from gmail_assistant.rate_limiter import (
+    RateLimiter,
+    TokenBucket,
+    is_rate_limited,
+    method_for,
+    request_cost,
+)
+
+BASE = "https://gmail.googleapis.com/gmail/v1/users/me"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, status):
+        self.status = status
+
+
+def throttled(reason="rateLimitExceeded", status=403):
+    content = json.dumps({"error": {"errors": [{"reason": reason}]}})
+    return Response(status), content.encode()
+
+
+@pytest.mark.parametrize(
+    "http_method,path,method",
+    [
+        ("GET", "/messages?maxResults=5", "messages.list"),
+        ("GET", "/messages/abc?format=full", "messages.get"),
+        ("POST", "/messages/send", "messages.send"),
+        ("POST", "/messages/abc/modify", "messages.modify"),
+        ("POST", "/messages/abc/trash", "messages.trash"),
+        ("POST", "/messages/batchModify", "messages.batchModify"),
+        ("DELETE", "/messages/abc", "messages.delete"),
+        ("GET", "/messages/abc/attachments/def", "messages.attachments.get"),
+        ("GET", "/history?startHistoryId=1", "history.list"),
+        ("GET", "/profile", "getProfile"),
+    ],
+)
+def test_method_names(http_method, path, method):
+    assert method_for(http_method, BASE + path) == method
+
+
+def test_costs_follow_gmail_quota():
+    assert request_cost("GET", BASE + "/messages") == 5
+    assert request_cost("POST", BASE + "/messages/send") == 100
+    assert (
+        request_cost(
+            "POST",
+            "https://gmail.googleapis.com/upload/gmail/v1/users/me/messages/send",
+        )
+        == 100
+    )
+    assert request_cost("POST", BASE + "/messages/abc/modify") == 5
+
+
+def test_batch_costs_the_sum_of_its_parts():
+    body = "\r\n".join(
+        f"--b\r\nContent-Type: application/http\r\n\r\n"
+        f"GET /gmail/v1/users/me/messages/{n}?format=metadata HTTP/1.1\r\n"
+        for n in range(3)
+    )
+    assert (
+        request_cost("POST", "https://gmail.googleapis.com/batch/gmail/v1", body) == 15
+    )
+
+
+def test_rate_limit_responses():
+    assert is_rate_limited(429, b"")
+    assert is_rate_limited(403, throttled("userRateLimitExceeded")[1])
+    assert not is_rate_limited(403, throttled("insufficientPermissions")[1])
+    assert not is_rate_limited(403, b"not json")
+    assert not is_rate_limited(200, b"{}")
+
+
+def test_bucket_paces_requests_to_its_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(10, clock=clock, sleep=clock.sleep)
+    for _ in range(4):
+        bucket.acquire(5)
+    # The first 10 units were a burst; the next 10 take a second
+    assert clock.now == pytest.approx(1.0)
+    # More than the capacity waits for a full bucket
+    bucket.acquire(100)
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_throttled_request_is_retried_with_jittered_backoff():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        quota_per_second=100,
+        base_delay=1,
+        clock=clock,
+        sleep=clock.sleep,
+        rand=lambda: 0.5,
+    )
+    responses = [throttled(status=429), throttled(), (Response(200), b"{}")]
+
+    response, _ = limiter.send(
+        "GET", BASE + "/messages/abc", None, lambda: responses.pop(0)
+    )
+
+    assert response.status == 200
+    assert clock.sleeps == [0.5, 1.0]
+    report = limiter.report()
+    assert report["throttled"] == 2 and report["retries"] == 2
+    assert report["methods"] == {"messages.get": {"requests": 3, "units": 15}}
+    # Halved twice, then one step back up
+    assert limiter.rate == 26
+
+
+def test_gives_up_after_max_retries():
+    clock = FakeClock()
+    limiter = RateLimiter(max_retries=2, clock=clock, sleep=clock.sleep)
+    calls = []
+
+    def request():
+        calls.append(1)
+        return throttled(status=429)
+
+    response, _ = limiter.send("GET", BASE + "/messages", None, request)
+    assert response.status == 429
+    assert len(calls) == 3
+
+
+def test_rate_recovers_after_throttling_and_reports_throughput():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        quota_per_second=50, clock=clock, sleep=clock.sleep, rand=lambda: 0.0
+    )
+    limiter.send(
+        "GET",
+        BASE + "/messages",
+        None,
+        iter([throttled(status=429), (Response(200), b"{}")]).__next__,
+    )
+    assert limiter.rate == 26
+    for _ in range(40):
+        limiter.send("GET", BASE + "/messages", None, lambda: (Response(200), b"{}"))
+    assert limiter.rate == 50
+    report = limiter.report()
+    assert report["requests_per_second"] == pytest.approx(42 / 60)
+    assert report["units_per_second"] == pytest.approx(42 * 5 / 60)
@@ -0,0 +1,128 @@
+"""Tests for the LLM response cache."""
+
+from unittest.mock import MagicMock
+
+from gmail_assistant.llm.ollama_handler import OllamaHandler
+from gmail_assistant.llm.response_cache import ResponseCache, cache_key
+from gmail_assistant.llm.router import LLMRouter
+from gmail_assistant.llm.service import LLMService
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_depends_on_model_prompt_and_params():
+    key = cache_key("llama2", "check  my\n inbox", {"temperature": 0})
+    assert key == cache_key("llama2", "check my inbox", {"temperature": 0})
+    assert key != cache_key("mistral", "check my inbox", {"temperature": 0})
+    assert key != cache_key("llama2", "check my inbox", {"temperature": 0.7})
+    assert key != cache_key("llama2", "read my inbox", {"temperature": 0})
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_entries_expire(tmp_path):
+    clock = Clock()
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=60, clock=clock)
+    cache.put("a", {"response": "x"})
+    clock.now += 59
+    assert cache.get("a") == {"response": "x"}
+    clock.now += 2
+    assert cache.get("a") is None
+    # Expired rows are gone from disk too
+    assert (
+        ResponseCache(tmp_path / "cache.sqlite", ttl=3600, clock=clock).get("a") is None
+    )
+
+
+def test_disk_tier_survives_restart_and_is_bounded(tmp_path):
+    clock = Clock()
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_disk_entries=2, clock=clock)
+    for name in ("a", "b", "c"):
+        clock.now += 1
+        cache.put(name, name.upper())
+
+    reopened = ResponseCache(tmp_path / "cache.sqlite", clock=clock)
+    assert reopened.get("a") is None
+    assert (reopened.get("b"), reopened.get("c")) == ("B", "C")
+
+
+def test_get_or_compute_does_not_cache_none():
+    cache = ResponseCache()
+    compute = MagicMock(side_effect=[None, "ok"])
+    assert cache.get_or_compute("k", compute) is None
+    assert cache.get_or_compute("k", compute) == "ok"
+    assert cache.get_or_compute("k", compute) == "ok"
+    assert compute.call_count == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_unwritable_path_falls_back_to_memory(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = ResponseCache(blocker / "cache.sqlite")
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+
+
+def test_repeated_analysis_skips_the_model():
+    backend = MagicMock()
+    backend.name = "stub"
+    backend.generate_json.return_value = {
+        "intent": "send_email",
+        "slots": {"recipient": "bob"},
+        "confidence": 0.9,
+    }
+    service = LLMService(
+        client=MagicMock(), cache=ResponseCache(), router=LLMRouter([backend])
+    )
+
+    first = service.analyze_query("could you maybe email bob")
+    second = service.analyze_query("could you maybe email bob")
+    assert first == second
+    assert backend.generate_json.call_count == 1
+    assert backend.generate_json.call_args.kwargs["temperature"] == 0
+
+
+def test_command_analysis_is_cached():
+    client = MagicMock()
+    client.post.return_value.json.return_value = {"response": "intent: read email"}
+    handler = OllamaHandler(client=client, cache=ResponseCache())
+    assert handler.analyze_command("read my email") == "intent: read email"
+    assert handler.analyze_command("read my email") == "intent: read email"
+    assert client.post.call_count == 1
+
+
+def test_analysis_cache_is_kept_per_model():
+    def backend_for(model):
+        backend = MagicMock()
+        backend.name = "stub"
+        backend.model_id = f"stub:{model}"
+        backend.generate_json.return_value = {
+            "intent": "send_email",
+            "slots": {},
+            "confidence": 0.9,
+        }
+        return backend
+
+    cache = ResponseCache()
+    old, new = backend_for("llama2"), backend_for("mistral")
+    for backend in (old, new):
+        service = LLMService(
+            client=MagicMock(), cache=cache, router=LLMRouter([backend])
+        )
+        service.analyze_query("could you maybe email bob")
+        backend.generate_json.assert_called_once()
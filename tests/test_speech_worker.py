@@ -0,0 +1,153 @@
+"""Tests for the background text to speech worker."""
+
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from gmail_assistant.error_handler import GmailAssistantError
+from gmail_assistant.speech_worker import SpeechWorker
+
+
+class FakeEngine:
+    """Record what is spoken, taking ``delay`` seconds per word."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.properties = {}
+        self.callbacks = {}
+        self.pending = []
+        self.spoken = []
+        self.threads = set()
+        self.stopped = False
+
+    def setProperty(self, name, value):
+        self.properties[name] = value
+
+    def connect(self, topic, callback):
+        self.callbacks[topic] = callback
+
+    def say(self, text):
+        self.pending.append(text)
+
+    def stop(self):
+        self.stopped = True
+
+    def runAndWait(self):
+        self.threads.add(threading.current_thread().name)
+        for text in self.pending:
+            words = []
+            for word in text.split():
+                self.callbacks["started-word"]("utterance", 0, len(word))
+                if self.stopped:
+                    break
+                time.sleep(self.delay)
+                words.append(word)
+            self.spoken.append(" ".join(words))
+        self.pending = []
+        self.stopped = False
+
+
+@pytest.fixture
+def engine():
+    return FakeEngine()
+
+
+@pytest.fixture
+def worker(engine):
+    worker = SpeechWorker(lambda: engine, rate=100)
+    worker.start()
+    yield worker
+    worker.stop(timeout=2)
+
+
+def test_say_returns_before_speech_finishes(worker, engine):
+    engine.delay = 0.05
+    started = time.monotonic()
+    worker.say("one two three four five six")
+    assert time.monotonic() - started < 0.05
+    assert worker.is_speaking
+    assert worker.wait(timeout=2)
+    assert engine.spoken == ["one two three four five six"]
+    assert engine.properties == {"rate": 100}
+    assert engine.threads == {"SpeechWorker"}
+
+
+def test_queued_short_utterances_are_merged(worker, engine):
+    engine.delay = 0.05
+    worker.say("Recent emails:")
+    # Everything below queues up while the first utterance plays
+    time.sleep(0.02)
+    for subject in ("Lunch", "Invoice", "Weekly report"):
+        worker.say(subject)
+    worker.wait(timeout=2)
+    assert engine.spoken == ["Recent emails:", "Lunch. Invoice. Weekly report"]
+
+
+def test_merging_stops_at_the_character_limit(engine):
+    worker = SpeechWorker(lambda: engine, merge_chars=13)
+    worker._queue.extend(["first", "second", "third"])
+    assert worker._next_utterance() == "first. second"
+    assert worker._next_utterance() == "third"
+
+
+def test_interrupt_cuts_off_speech_and_drops_the_queue(worker, engine):
+    engine.delay = 0.02
+    worker.say(" ".join(["word"] * 50))
+    time.sleep(0.05)
+    worker.say("stale")
+    worker.interrupt()
+    assert worker.wait(timeout=1)
+    assert len(engine.spoken) == 1
+    assert len(engine.spoken[0].split()) < 50
+
+    worker.say("fresh")
+    worker.wait(timeout=2)
+    assert engine.spoken[-1] == "fresh"
+
+
+def test_blank_text_is_ignored(worker, engine):
+    worker.say("  ")
+    worker.say(None)
+    assert not worker.is_speaking
+
+
+def test_engine_that_cannot_start_is_reported():
+    def broken():
+        raise RuntimeError("no audio device")
+
+    with pytest.raises(GmailAssistantError, match="no audio device"):
+        SpeechWorker(broken).start()
+
+
+def test_assistant_finishes_speaking_before_it_listens(worker, engine):
+    from gmail_assistant.gmail_voice_assistant import GmailVoiceAssistant
+
+    class Microphone:
+        def listen_stream(self, timeout, phrase_time_limit):
+            heard.append(worker.is_speaking)
+            yield b"audio"
+
+    class Transcription:
+        def accept(self, chunk):
+            return None
+
+        def finish(self):
+            return "check inbox", 0.9
+
+    heard = []
+    assistant = GmailVoiceAssistant(lazy=True)
+    assistant.subsystems.run("voice", lambda: None)
+    assistant.subsystems.run("commands", lambda: None)
+    assistant.speech = worker
+    assistant.microphone = Microphone()
+    assistant.asr_backend = MagicMock()
+    assistant.asr_backend.start_stream.return_value = Transcription()
+    assistant.command_processor = MagicMock()
+
+    engine.delay = 0.02
+    worker.say("one two three four five")
+    assert assistant.listen() == "check inbox"
+    assert heard == [False]
+    assert engine.spoken == ["one two three four five"]
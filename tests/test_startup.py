@@ -0,0 +1,95 @@
+"""Tests for startup timing and background subsystem initialization."""
+
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from gmail_assistant.error_handler import GmailAssistantError
+from gmail_assistant.startup import StartupProfiler, Subsystems
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_profiler_reports_phases_in_start_order():
+    clock = FakeClock()
+    profiler = StartupProfiler(clock=clock)
+    with profiler.phase("window"):
+        clock.now = 0.05
+    clock.now = 0.2
+    profiler.mark("interactive")
+
+    assert [record[:3] for record in profiler.records] == [
+        ("window", 0.0, 0.05),
+        ("interactive", 0.2, 0.0),
+    ]
+    report = profiler.report()
+    assert "window" in report and "50.0" in report
+
+
+def test_background_subsystems_report_readiness():
+    subsystems = Subsystems()
+    ready = []
+    release = threading.Event()
+    subsystems.add_listener(lambda name, error: ready.append((name, error)))
+
+    subsystems.start("slow", lambda: release.wait(1))
+    subsystems.start("dependent", lambda: None, requires=("slow",))
+    assert not subsystems.is_ready("dependent")
+
+    release.set()
+    subsystems.wait("dependent", timeout=1)
+    assert [name for name, _ in ready] == ["slow", "dependent"]
+    assert {record[0] for record in subsystems.profiler.records} == {
+        "slow",
+        "dependent",
+    }
+
+
+def test_failed_subsystem_is_reported_and_raised_on_wait():
+    subsystems = Subsystems()
+    errors = []
+    subsystems.add_listener(lambda name, error: errors.append(error))
+
+    def broken():
+        raise IOError("no microphone")
+
+    subsystems.start("voice", broken)
+    with pytest.raises(GmailAssistantError, match="no microphone"):
+        subsystems.wait("voice", timeout=1)
+    assert isinstance(errors[0], IOError)
+    assert not subsystems.is_ready("voice")
+
+
+def test_wait_for_unknown_subsystem_fails():
+    with pytest.raises(GmailAssistantError):
+        Subsystems().wait("gmail")
+
+
+def test_run_raises_setup_error():
+    def broken():
+        raise GmailAssistantError("no credentials")
+
+    with pytest.raises(GmailAssistantError, match="no credentials"):
+        Subsystems().run("gmail", broken)
+
+
+def test_importing_assistant_does_not_load_heavy_modules():
+    code = (
+        "import sys\n"
+        "import gmail_assistant.gmail_voice_assistant\n"
+        "heavy = ['nltk', 'googleapiclient', 'pyttsx3', 'speech_recognition',\n"
+        "         'customtkinter', 'llama_cpp', 'requests']\n"
+        "print([name for name in heavy if name in sys.modules])\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "[]"
@@ -0,0 +1,123 @@
+"""Tests for stored and pre-made email summaries."""
+
+import threading
+import time
+from unittest.mock import MagicMock
+
+from gmail_assistant.command_processor import CommandProcessor
+from gmail_assistant.message_store import MessageStore
+from gmail_assistant.summarizer import EmailSummarizer, PreSummarizer
+
+
+def make_message(message_id, subject, labels, internal_date):
+    return {
+        "id": message_id,
+        "labelIds": labels,
+        "internalDate": str(internal_date),
+        "payload": {
+            "headers": [
+                {"name": "Subject", "value": subject},
+                {"name": "From", "value": "bob@example.com"},
+            ]
+        },
+    }
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_store():
+    store = MessageStore(":memory:")
+    store.upsert_messages(
+        [
+            make_message("a", "Read", ["INBOX"], 1),
+            make_message("b", "New", ["INBOX", "UNREAD"], 2),
+            make_message("c", "Newer", ["INBOX", "UNREAD"], 3),
+        ]
+    )
+    for message_id in "abc":
+        store.index_body(message_id, f"body of {message_id}")
+    store.history_id = 1
+    return store
+
+
+def test_summary_is_made_once_per_body():
+    store = make_store()
+    summarize = MagicMock(side_effect=lambda body: body.upper())
+    summarizer = EmailSummarizer(store, summarize)
+    assert summarizer.summary_for("b", "body of b") == "BODY OF B"
+    assert summarizer.summary_for("b", "body of b") == "BODY OF B"
+    assert summarize.call_count == 1
+    # A changed body is summarized again
+    assert summarizer.summary_for("b", "new body") == "NEW BODY"
+    assert summarize.call_count == 2
+
+
+def test_concurrent_requests_share_one_summary():
+    store = make_store()
+    release = threading.Event()
+    calls = []
+
+    def summarize(body):
+        calls.append(body)
+        release.wait(2)
+        return "summary"
+
+    summarizer = EmailSummarizer(store, summarize)
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(summarizer.summary_for("b", "body of b"))
+        )
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=2)
+    assert results == ["summary"] * 3
+    assert len(calls) == 1
+
+
+def test_pre_summarizer_waits_for_idle():
+    store = make_store()
+    clock = Clock()
+    summarize = MagicMock(return_value="summary")
+    pre = PreSummarizer(EmailSummarizer(store, summarize), idle_after=10, clock=clock)
+
+    assert pre.run_once() == 0
+    clock.now = 10
+    assert pre.run_once() == 2
+    assert summarize.call_args_list[0].args == ("body of c",)
+    assert store.unsummarized_ids("UNREAD") == []
+
+    pre.touch()
+    store.upsert_messages([make_message("d", "Newest", ["INBOX", "UNREAD"], 4)])
+    store.index_body("d", "body of d")
+    assert pre.run_once() == 0
+
+
+def test_summarize_command_uses_stored_summary():
+    store = make_store()
+    summarize = MagicMock(return_value="Bob wants lunch")
+    summarizer = EmailSummarizer(store, summarize)
+    PreSummarizer(summarizer, idle_after=0).run_once()
+
+    processor = CommandProcessor()
+    processor.set_gmail_service(MagicMock())
+    processor.set_message_store(store)
+    processor.set_summarizer(summarizer)
+    result = processor.process_command("summarize my latest email")
+
+    assert result.intent == "summarize_email"
+    assert "Subject: Newer" in result.response
+    assert "Bob wants lunch" in result.response
+    assert summarize.call_count == 2
+    processor.gmail_service.users.assert_not_called()
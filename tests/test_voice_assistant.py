@@ -7,7 +7,7 @@ from unittest.mock import MagicMock, patch
 def assistant():
     with patch('speech_recognition.Recognizer'), \
          patch('pyttsx3.init'), \
-         patch('gmail_assistant.voice_assistant.build'):
+         patch('gmail_assistant.voice_assistant.get_gmail_service'):
         return GmailVoiceAssistant()
 
 def test_command_processing(assistant):
@@ -6,7 +6,7 @@ from gmail_assistant.voice_assistant import GmailVoiceAssistant
 def mock_assistant():
     with patch('speech_recognition.Recognizer'), \
          patch('pyttsx3.init'), \
-         patch('gmail_assistant.voice_assistant.build'):
+         patch('gmail_assistant.voice_assistant.get_gmail_service'):
         assistant = GmailVoiceAssistant()
         assistant.service = MagicMock()
         return assistant